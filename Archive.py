@@ -0,0 +1,408 @@
+import calendar
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from urllib.parse import quote
+
+import numpy as np
+
+import SharedVars as shv
+
+"""This module provides archive of cold ambient data in immutable compressed columnar segment files"""
+# Segment file: magic, blocks of compressed columns, JSON index, index length (<Q), magic.
+# Block holds block_rows rows, unixtime column is delta encoded int32, value columns are float32
+# with NaN for missing value, bytes of floats are shuffled (all first bytes, then all second ...)
+# before compression. Index keeps time bounds and offsets of all blocks, so only blocks which
+# overlap requested time range are read.
+
+magic = b'AMBSEG01'
+segment_ext = '.seg'
+
+
+class SegmentWriter:
+    """
+    Write rows of columns into new segment file by blocks. File is written under temporary name
+    and renamed on close(), so readers never see partial segment.
+    """
+
+    def __init__(self, path, columns, meta=None, block_rows=None, level=6):
+        """
+        :param path: str, path of segment file
+        :param columns: list, names of value columns, unixtime column is added first
+        :param meta: dict, JSON serializable description of segment
+        :param block_rows: int, number of rows in one block
+        :param level: int, zlib compression level
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.block_rows = block_rows or shv.archive_block_rows
+        self.level = level
+        self.index = {
+            'version': 1,
+            'meta': meta or {},
+            'columns': [{'name': 'unixtime', 'encoding': 'delta-i4'}] + [
+                {'name': name, 'encoding': 'shuffle-f4'} for name in self.columns
+            ],
+            'blocks': []
+        }
+        self.rows = 0
+        self._pending = []  # not written arrays of rows, [(unixtime, values), ...]
+        self._pending_rows = 0
+        self._file = open(path + '.tmp', 'wb')
+        self._file.write(magic)
+
+    def write(self, unixtime, values):
+        """
+        Add rows, time must grow over all written rows
+        :param unixtime: numpy.ndarray, time of rows
+        :param values: numpy.ndarray, 2-dimensional array (rows, columns) of values, NaN for missing value
+        :return: None
+        """
+        if not len(unixtime):
+            return
+        self._pending.append((np.asarray(unixtime, dtype=np.int64), np.asarray(values, dtype=np.float32)))
+        self._pending_rows += len(unixtime)
+        if self._pending_rows >= self.block_rows:
+            unixtime = np.concatenate([x for x, _ in self._pending])
+            values = np.concatenate([y for _, y in self._pending])
+            full = len(unixtime) // self.block_rows * self.block_rows
+            for start in range(0, full, self.block_rows):
+                self._write_block(unixtime[start:start + self.block_rows], values[start:start + self.block_rows])
+            self._pending = [(unixtime[full:], values[full:])] if full < len(unixtime) else []
+            self._pending_rows = len(unixtime) - full
+
+    def _write_block(self, unixtime, values):
+        deltas = np.diff(unixtime)
+        if len(deltas) and (deltas.min() < 0 or deltas.max() > np.iinfo(np.int32).max):
+            raise ValueError("Time of segment rows must grow with steps less than 2**31")
+        chunks = [deltas.astype('<i4').tobytes()]
+        for i in range(len(self.columns)):
+            column = np.ascontiguousarray(values[:, i], dtype='<f4')
+            chunks.append(column.view(np.uint8).reshape(-1, 4).T.tobytes())  # shuffle bytes
+        data = []
+        for chunk in chunks:
+            compressed = zlib.compress(chunk, self.level)
+            data.append([self._file.tell(), len(compressed)])
+            self._file.write(compressed)
+        self.index['blocks'].append({
+            'rows': len(unixtime),
+            'first': int(unixtime[0]),
+            'last': int(unixtime[-1]),
+            'data': data
+        })
+        self.rows += len(unixtime)
+
+    def close(self):
+        """
+        Write the rest of rows and index, publish segment file
+        :return: None
+        """
+        if self._pending_rows:
+            self._write_block(
+                np.concatenate([x for x, _ in self._pending]),
+                np.concatenate([y for _, y in self._pending])
+            )
+            self._pending = []
+            self._pending_rows = 0
+        index = json.dumps(self.index, separators=(',', ':')).encode('utf-8')
+        self._file.write(index)
+        self._file.write(struct.pack('<Q', len(index)))
+        self._file.write(magic)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + '.tmp')
+
+
+class Segment:
+    """
+    Read-only segment file mapped into memory, index is parsed once, blocks are decompressed on demand
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str, path of segment file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tail = len(magic) + 8
+        if self._mm[:len(magic)] != magic or self._mm[-len(magic):] != magic:
+            self._mm.close()
+            raise ValueError("File is not a segment: {}".format(path))
+        index_len = struct.unpack('<Q', self._mm[-tail:-len(magic)])[0]
+        self.index = json.loads(self._mm[-tail - index_len:-tail].decode('utf-8'))
+        self.meta = self.index['meta']
+        self.columns = [column['name'] for column in self.index['columns'][1:]]
+        self.blocks = self.index['blocks']
+        self.rows = sum(block['rows'] for block in self.blocks)
+        self.first = self.blocks[0]['first'] if self.blocks else None
+        self.last = self.blocks[-1]['last'] if self.blocks else None
+
+    def read_block(self, i, columns=None):
+        """
+        :param i: int, number of block
+        :param columns: list, names of value columns, all columns if None
+        :return: tuple, unixtime (int64 numpy.ndarray) and 2-dimensional float64 array of values (rows, columns)
+        """
+        block = self.blocks[i]
+        columns = self.columns if columns is None else columns
+        offset, length = block['data'][0]
+        deltas = np.frombuffer(zlib.decompress(self._mm[offset:offset + length]), dtype='<i4')
+        unixtime = np.empty(block['rows'], dtype=np.int64)
+        unixtime[0] = block['first']
+        np.cumsum(deltas, dtype=np.int64, out=unixtime[1:])
+        unixtime[1:] += block['first']
+        values = np.full((block['rows'], len(columns)), np.nan)
+        for j, name in enumerate(columns):
+            if name not in self.columns:
+                continue
+            offset, length = block['data'][self.columns.index(name) + 1]
+            raw = np.frombuffer(zlib.decompress(self._mm[offset:offset + length]), dtype=np.uint8)
+            values[:, j] = raw.reshape(4, -1).T.copy().view('<f4').ravel()  # unshuffle bytes
+        return unixtime, values
+
+    def read_range(self, unixtime_start, unixtime_stop, columns=None):
+        """
+        Read rows in time range (bounds are included), only overlapping blocks are decompressed
+        :return: tuple, unixtime (int64 numpy.ndarray) and 2-dimensional float64 array of values (rows, columns)
+        """
+        parts = [
+            self.read_block(i, columns) for i, block in enumerate(self.blocks)
+            if block['last'] >= unixtime_start and block['first'] <= unixtime_stop
+        ]
+        n_columns = len(self.columns if columns is None else columns)
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, n_columns))
+        unixtime = np.concatenate([x for x, _ in parts])
+        values = np.concatenate([y for _, y in parts])
+        mask = (unixtime >= unixtime_start) & (unixtime <= unixtime_stop)
+        return unixtime[mask], values[mask]
+
+    def close(self):
+        self._mm.close()
+
+
+class Archive:
+    """
+    Directory of segments, one segment per device and period (UTC day or month):
+    <archive>/<quoted device>/<YYYYMMDD or YYYYMM>.seg. Segments are immutable, late data of
+    archived period is merged by rewrite of the whole segment. Archive is shared by threads:
+    rewritten segment is only dropped from cache, its mapping is closed when the last reader releases it.
+    """
+
+    def __init__(self, path, columns=None, period=None):
+        """
+        :param path: str, archive directory
+        :param columns: list, names of value columns (data types), shv.all_dtype if None
+        :param period: str, 'day' or 'month', shv.archive_period if None
+        """
+        self.path = path
+        self.columns = list(columns or shv.all_dtype)
+        self.period = period or shv.archive_period
+        if self.period not in ('day', 'month'):
+            raise ValueError("Unknown archive period: {}".format(self.period))
+        self._segments = {}  # {path: (mtime_ns, size, Segment)}
+        self._bounds = {}  # {device directory: (mtime_ns, first unixtime, last unixtime)}
+        self._lock = threading.Lock()  # guards self._segments and self._bounds
+
+    @staticmethod
+    def device_key(device):
+        return quote(device, safe='') or '%'  # quote() never gives single '%'
+
+    def period_bounds(self, unixtime):
+        """
+        :param unixtime: int, time in period
+        :return: tuple, start (included) and stop (excluded) of period and its name
+        """
+        t = time.gmtime(unixtime)
+        if self.period == 'day':
+            start = calendar.timegm((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0))
+            return start, start + 86400, time.strftime('%Y%m%d', t)
+        year, month = (t.tm_year + 1, 1) if t.tm_mon == 12 else (t.tm_year, t.tm_mon + 1)
+        start = calendar.timegm((t.tm_year, t.tm_mon, 1, 0, 0, 0))
+        return start, calendar.timegm((year, month, 1, 0, 0, 0)), time.strftime('%Y%m', t)
+
+    def segment(self, path):
+        """
+        :param path: str, path of segment file
+        :return: Segment, opened once and cached until file is replaced
+        """
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._segments.get(path)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                return cached[2]
+            segment = Segment(path)
+            self._segments[path] = (stat.st_mtime_ns, stat.st_size, segment)  # replaced one is not closed
+            return segment
+
+    def segments(self, device=None, unixtime_start=None, unixtime_stop=None):
+        """
+        Segments which overlap time range
+        :param device: str, identifier of device, None for all devices
+        :param unixtime_start: int, start of time range, None for no limit
+        :param unixtime_stop: int, end of time range, None for no limit
+        :return: list, Segment ordered by period
+        """
+        if not os.path.isdir(self.path):
+            return []
+        keys = [self.device_key(device)] if device is not None else os.listdir(self.path)
+        result = []
+        for key in keys:
+            directory = os.path.join(self.path, key)
+            if not os.path.isdir(directory):
+                continue
+            first, last = self.directory_bounds(directory)
+            if first is None or (unixtime_start is not None and last < unixtime_start) or (
+                    unixtime_stop is not None and first > unixtime_stop
+            ):  # e.g. upload cursor is after archived data, segments are not listed
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith(segment_ext):
+                    continue
+                segment = self.segment(os.path.join(directory, name))
+                if not segment.rows:
+                    continue
+                if unixtime_start is not None and segment.last < unixtime_start:
+                    continue
+                if unixtime_stop is not None and segment.first > unixtime_stop:
+                    continue
+                result.append(segment)
+        result.sort(key=lambda x: x.meta['start'])
+        return result
+
+    def directory_bounds(self, directory):
+        """
+        :param directory: str, directory of device segments
+        :return: tuple, time of the first and the last archived row of device, cached until directory
+            is changed (segment is added or replaced), (None, None) if there are no rows
+        """
+        mtime_ns = os.stat(directory).st_mtime_ns  # taken before listing, so concurrent change is seen next time
+        with self._lock:
+            cached = self._bounds.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1:]
+        first = last = None
+        for name in os.listdir(directory):
+            if not name.endswith(segment_ext):
+                continue
+            segment = self.segment(os.path.join(directory, name))
+            if segment.rows:
+                first = segment.first if first is None else min(first, segment.first)
+                last = segment.last if last is None else max(last, segment.last)
+        with self._lock:
+            self._bounds[directory] = (mtime_ns, first, last)
+        return first, last
+
+    def period_segments(self, device, unixtime_start, unixtime_stop):
+        """
+        Segments of device for periods of time range, only paths of the periods are checked
+        :param device: str, identifier of device
+        :param unixtime_start: int, start of time range (included)
+        :param unixtime_stop: int, end of time range (included)
+        :return: list, Segment ordered by period
+        """
+        directory = os.path.join(self.path, self.device_key(device))
+        result = []
+        period_start = unixtime_start
+        while period_start <= unixtime_stop:
+            _, period_stop, name = self.period_bounds(period_start)
+            path = os.path.join(directory, name + segment_ext)
+            if os.path.exists(path):
+                result.append(self.segment(path))
+            period_start = period_stop
+        return result
+
+    def iter_periods(self, columns, unixtime_start=None, unixtime_stop=None, device=None, reverse=False):
+        """
+        Stream rows in time range by periods, rows of all devices of one period are merged by time
+        :param columns: list, names of value columns
+        :param unixtime_start: int, start of time range (included), None for no limit
+        :param unixtime_stop: int, end of time range (included), None for no limit
+        :param device: str, identifier of device, None for all devices
+        :param reverse: bool, the newest rows first
+        :return: generator of tuples, unixtime (int64 numpy.ndarray) and values (rows, columns)
+        """
+        start = -2 ** 62 if unixtime_start is None else unixtime_start
+        stop = 2 ** 62 if unixtime_stop is None else unixtime_stop
+        periods = {}
+        for segment in self.segments(device, unixtime_start, unixtime_stop):
+            periods.setdefault(segment.meta['start'], []).append(segment)
+        for period in sorted(periods, reverse=reverse):
+            parts = [segment.read_range(start, stop, columns) for segment in periods[period]]
+            unixtime = np.concatenate([x for x, _ in parts])
+            values = np.concatenate([y for _, y in parts])
+            if len(parts) > 1:
+                order = np.argsort(unixtime, kind='stable')
+                unixtime, values = unixtime[order], values[order]
+            if reverse:
+                unixtime, values = unixtime[::-1], values[::-1]
+            if len(unixtime):
+                yield unixtime, values
+
+    def write_period(self, device, unixtime, values):
+        """
+        Write rows of one period of device into its segment, rows are merged with existing segment:
+        stored value is kept, missing one is taken from new rows
+        :param device: str, identifier of device
+        :param unixtime: numpy.ndarray, time of rows, all in one period
+        :param values: numpy.ndarray, 2-dimensional array (rows, columns) of values in order of self.columns
+        :return: int, number of rows in segment
+        """
+        period_start, period_stop, name = self.period_bounds(int(unixtime[0]))
+        if unixtime.min() < period_start or unixtime.max() >= period_stop:
+            raise ValueError("Rows are not in one period")
+        directory = os.path.join(self.path, self.device_key(device))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name + segment_ext)
+        if os.path.exists(path):
+            segment = Segment(path)  # own mapping of writer, cached one may be read by other threads
+            try:
+                old_unixtime, old_values = segment.read_range(period_start, period_stop, self.columns)  # copies
+            finally:
+                segment.close()  # mapped file can't be replaced on Windows
+            with self._lock:
+                self._segments.pop(path, None)  # not used cached mapping is released before replace
+            unixtime = np.concatenate([old_unixtime, unixtime])
+            values = np.concatenate([old_values, values])
+        order = np.argsort(unixtime, kind='stable')  # stored rows go first for equal time
+        unixtime, values = unixtime[order], np.asarray(values, dtype=np.float64)[order]
+        unique, first = np.unique(unixtime, return_index=True)
+        if len(unique) < len(unixtime):
+            merged = values[first]
+            for i in range(1, len(unixtime)):  # fill missing values of duplicated time
+                if unixtime[i] == unixtime[i - 1]:
+                    row = np.searchsorted(unique, unixtime[i])
+                    missing = np.isnan(merged[row])
+                    merged[row][missing] = values[i][missing]
+            unixtime, values = unique, merged
+        writer = SegmentWriter(
+            path, self.columns,
+            meta={'device': device, 'start': period_start, 'stop': period_stop, 'period': self.period}
+        )
+        try:
+            writer.write(unixtime, values)
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        return writer.rows
+
+    def close(self):
+        """
+        Close all cached segments, archive must not be read anymore
+        :return: None
+        """
+        with self._lock:
+            for _, _, segment in self._segments.values():
+                segment.close()
+            self._segments = {}
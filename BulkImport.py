@@ -0,0 +1,173 @@
+import collections
+import concurrent.futures
+import os
+import time
+
+import DataBase
+import FrameParser
+import SharedVars as shv
+
+"""This module provides bulk import of recorded device logs (LY frames dumped from SD card or captured
+from serial port) into client database"""
+
+# Result of parsing of one piece of log file
+ParsedChunk = collections.namedtuple('ParsedChunk', ['path', 'size', 'rows', 'frames', 'invalid', 'dropped'])
+
+
+def split_file(path, chunk_bytes=None):
+    """
+    Split log file on pieces which end at line end, so pieces are parsed independently
+    :param path: str, path to log file
+    :param chunk_bytes: int, approximate size of piece
+    :return: list, structure of tuples with path, start and end offsets of pieces [(path, start, stop), ...]
+    """
+    chunk_bytes = chunk_bytes or shv.import_chunk_bytes
+    size = os.path.getsize(path)
+    pieces = []
+    start = 0
+    with open(path, 'rb') as log_file:
+        while start < size:
+            log_file.seek(min(start + chunk_bytes, size))
+            log_file.readline()  # move end of piece to the nearest line end
+            stop = min(log_file.tell(), size)
+            pieces.append((path, start, stop))
+            start = stop
+    return pieces
+
+
+def parse_chunk(path, start, stop, device=''):
+    """
+    Parse piece of log file with the same rules as serial stream: bytes go through Framer and
+    FrameParser, so garbage and broken frames are skipped as in live ingestion. Called in worker process.
+    :param path: str, path to log file
+    :param start: int, offset of piece start
+    :param stop: int, offset of piece end
+    :param device: str, identifier of device which recorded log
+    :return: ParsedChunk
+    """
+    framer = FrameParser.Framer()
+    parser = FrameParser.FrameParser(device=device)
+    rows = []
+    invalid = 0
+    with open(path, 'rb') as log_file:
+        log_file.seek(start)
+        data = log_file.read(stop - start)
+    if not data.endswith(b'\n'):
+        data += b'\n'  # last line of file without line end
+    step = 65536  # feed framer by blocks as serial reads, buffer of framer stays small
+    for offset in range(0, len(data), step):
+        for frame in framer.feed(data[offset:offset + step]):
+            reading = parser.parse(frame)
+            if reading is None:
+                invalid += 1
+                continue
+            rows.extend(reading.rows())
+    return ParsedChunk(path, stop - start, rows, framer.frames - invalid, invalid, framer.dropped + framer.partial)
+
+
+def import_files(db_conn, paths, device='', workers=None, batch_size=None, chunk_bytes=None):
+    """
+    Import log files into DB. Pieces of files are parsed in pool of processes, readings are written
+    by main process in large transactions, readings which are already in DB or archive are skipped.
+    :param db_conn: sqlite3.Connection
+    :param paths: list, paths to log files
+    :param device: str, identifier of device which recorded logs
+    :param workers: int, number of parsing processes, parsing in main process if 1
+    :param batch_size: int, number of readings in one transaction
+    :param chunk_bytes: int, approximate size of piece of file parsed by one task
+    :return: dict, counters of import: frames, invalid, dropped, readings, inserted (new readings)
+    """
+    workers = workers or shv.import_workers or os.cpu_count() or 1
+    batch_size = batch_size or shv.import_batch_size
+    pieces = [piece for path in paths for piece in split_file(path, chunk_bytes)]
+    total_bytes = sum(stop - start for _, start, stop in pieces) or 1
+    stats = dict.fromkeys(('frames', 'invalid', 'dropped', 'readings', 'inserted'), 0)
+    done_bytes = 0
+    pending = []
+    time_start = time.monotonic()
+    for chunk in iter_parsed(pieces, device, workers):
+        stats['frames'] += chunk.frames
+        stats['invalid'] += chunk.invalid
+        stats['dropped'] += chunk.dropped
+        pending.extend(chunk.rows)
+        if len(pending) >= batch_size:
+            stats['inserted'] += write_batch(db_conn, pending)
+            stats['readings'] += len(pending)
+            pending = []
+        done_bytes += chunk.size
+        shv.logger.info(
+            "Import: %.0f%% of data, %s frames, %.0f s",
+            100 * done_bytes / total_bytes, stats['frames'], time.monotonic() - time_start
+        )
+    if pending:
+        stats['inserted'] += write_batch(db_conn, pending)
+        stats['readings'] += len(pending)
+    return stats
+
+
+def iter_parsed(pieces, device, workers):
+    """
+    Parse pieces of files in pool of processes, number of parsed pieces which wait for writing is bounded,
+    so memory does not depend on size of files
+    :param pieces: list, structure of tuples with path, start and end offsets of pieces
+    :param device: str, identifier of device which recorded logs
+    :param workers: int, number of processes
+    :return: generator of ParsedChunk in order of pieces
+    """
+    if workers == 1:
+        for path, start, stop in pieces:
+            yield parse_chunk(path, start, stop, device)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = collections.deque()
+        for path, start, stop in pieces:
+            if len(futures) >= 2 * workers:
+                yield futures.popleft().result()
+            futures.append(executor.submit(parse_chunk, path, start, stop, device))
+        while futures:
+            yield futures.popleft().result()
+
+
+def write_batch(db_conn, rows):
+    """
+    Write readings in one transaction
+    :param db_conn: sqlite3.Connection
+    :param rows: list, structure of tuples with unixtime, data type, value and device
+    :return: int, number of new readings
+    """
+    try:
+        db_conn.execute("BEGIN IMMEDIATE")  # live DB writer may run, see DataWriter.flush
+        inserted = DataBase.insert_readings(db_conn, rows)
+        DataBase.bump_data_generation(db_conn.cursor())  # running GUI drops its cached plots
+        db_conn.commit()
+    except Exception:
+        db_conn.rollback()
+        raise
+    shv.logger.debug("\twrite %s readings, %s new", len(rows), inserted)
+    return inserted
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Bulk import of recorded device logs")
+    parser.add_argument('--db', default='test.db', help="path to SQLite database")
+    parser.add_argument('--device', default='', help="identifier of device which recorded logs, e.g. its serial port")
+    parser.add_argument('--workers', type=int, help="number of parsing processes, number of CPUs by default")
+    parser.add_argument('--batch-size', type=int, help="number of readings in one transaction")
+    parser.add_argument('logs', nargs='+', help="log files with LY frames")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    shv.logger = logging.getLogger('main_logger')
+    conn = DataBase.connect(args.db)
+    DataBase.init_db(conn)
+    result = import_files(conn, args.logs, device=args.device, workers=args.workers, batch_size=args.batch_size)
+    shv.logger.info(
+        "Imported %(readings)s readings, %(inserted)s of them are new (not in DB or archive): "
+        "%(frames)s frames, %(invalid)s invalid frames, %(dropped)s pieces of garbage", result
+    )
+    if shv.archive_after_days is not None:
+        DataBase.archive_cold_data(conn)  # old imported data go to archive at once, as live data do
+    conn.close()
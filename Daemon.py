@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+import DataBase
+import DataWriter
+import IngestManager
+import LogPipeline
+import Metrics
+import Profiling
+import SharedVars as shv
+import Uploader
+
+"""This module provides headless daemon for gateway machines: ingestion of ambient data from serial devices
+and upload to backend server without GUI. Qt and matplotlib are never imported."""
+
+
+class Daemon:
+    """
+    Run workers of client in plain threads: DB writer, one ingestion thread for all serial
+    devices and uploader. stop() may be called from signal handler, it only sets event,
+    workers are stopped by main thread in run().
+    """
+
+    def __init__(self, db_path, ports=None, upload=True):
+        """
+        :param db_path: str, path to SQLite database
+        :param ports: list, serial ports of devices, no ingestion if empty
+        :param upload: bool, send data to backend server
+        """
+        self.db_path = db_path
+        self.ports = ports or []
+        self.upload = upload
+        self.stop_event = threading.Event()
+        self.profile_event = threading.Event()  # profiling is toggled by main thread
+        self.writer = None
+        self.manager = None
+        self.uploader = None
+        self.threads = []
+        self.metrics_server = None
+
+    def run(self):
+        """
+        Start workers and wait until stop() is called
+        :return: None
+        """
+        db_conn = DataBase.connect(self.db_path)
+        DataBase.init_db(db_conn)
+        db_conn.close()
+        self.writer = DataWriter.DataWriter(self.db_path)
+        self.writer.start()
+        self.metrics_server = Metrics.start_server()
+        if self.ports:
+            self.manager = IngestManager.IngestManager(self.ports, self.writer, on_status=self.log_status)
+            self.threads.append(threading.Thread(target=self.manager.run, name='ingest'))
+        if self.upload:
+            self.uploader = Uploader.Uploader(self.db_path)
+            self.threads.append(threading.Thread(target=self.uploader.run, name='upload'))
+        for thread in self.threads:
+            thread.start()
+        shv.logger.info(
+            "Daemon is started: %s serial devices, upload %s", len(self.ports), 'on' if self.upload else 'off'
+        )
+        Profiling.init_from_env()
+        while not self.stop_event.wait(1):
+            if self.profile_event.is_set():
+                self.profile_event.clear()
+                Profiling.toggle()
+            if not any(thread.is_alive() for thread in self.threads):
+                shv.logger.error("All workers are finished")
+                break
+        self.shutdown()
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+    def toggle_profiling(self, *args):
+        self.profile_event.set()  # signal handler only sets event, profile is written by main loop
+
+    def shutdown(self):
+        """
+        Stop workers: ingestion first, then queued readings are committed by writer
+        :return: None
+        """
+        shv.logger.info("Daemon is stopping")
+        if self.manager is not None:
+            self.manager.stop()
+        if self.uploader is not None:
+            self.uploader.stop()
+        for thread in self.threads:
+            thread.join()
+        if self.uploader is not None:
+            self.uploader.close()
+        self.writer.stop()
+        Profiling.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        shv.logger.info("Daemon is stopped")
+
+    @staticmethod
+    def log_status(port, message):
+        shv.logger.info("%s: %s", port, message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless daemon: ingestion of ambient data from serial devices and upload to backend server"
+    )
+    parser.add_argument('--db', default='test.db', help="path to SQLite database")
+    parser.add_argument(
+        '--port', action='append', dest='ports',
+        help="serial port of device, may be repeated, all found ports by default"
+    )
+    parser.add_argument('--no-ingest', action='store_true', help="do not read serial devices")
+    parser.add_argument('--no-upload', action='store_true', help="do not send data to backend server")
+    parser.add_argument('--log', default='daemon-log.log', help="path to log file")
+    parser.add_argument('--debug', action='store_true', help="log debug messages")
+    args = parser.parse_args()
+
+    LogPipeline.init_logger(args.log, logging.DEBUG if args.debug else logging.INFO)
+    if args.no_ingest:
+        ports = []
+    else:
+        ports = args.ports or IngestManager.available_ports()
+    daemon = Daemon(args.db, ports=ports, upload=not args.no_upload)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, daemon.stop)
+    if hasattr(signal, 'SIGUSR1'):  # start profiling for profile_window seconds or stop it
+        signal.signal(signal.SIGUSR1, daemon.toggle_profiling)
+    daemon.run()
+    sys.exit(0)
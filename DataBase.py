@@ -0,0 +1,1027 @@
+import os
+import sqlite3
+import time
+import numpy as np
+import Archive
+import Profiling
+import SharedVars as shv
+
+"""This module provides access to client database (SQLite) with ambient data"""
+
+rollups = (
+    ('rollup_minute', 60),
+    ('rollup_hour', 3600),
+    ('rollup_day', 86400)
+)  # aggregate tables (count, min, max, sum of values) for each data type and time bucket, from fine to coarse
+# Wide layout stores one row per frame in ambient_frames, column of each data type:
+frame_columns = {
+    'CO2': 'co2',
+    'T': 't',
+    'R': 'r',
+    'P': 'p'
+}
+
+
+class Connection(sqlite3.Connection):
+    """
+    Connection to client database, layout of DB is kept once it is wide: migration to wide layout is one-way
+    """
+    layout = None
+    data_version = None  # last PRAGMA data_version, see get_data_generation
+
+
+def connect(db_path):
+    """
+    Open connection to client database in WAL mode, so readers never block the writer.
+    Durability of commits is set by shv.db_synchronous.
+    :param db_path: str, path to SQLite database
+    :return: sqlite3.Connection
+    """
+    if shv.db_synchronous not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError("Unknown synchronous level: {}".format(shv.db_synchronous))
+    db_conn = sqlite3.connect(db_path, check_same_thread=False, timeout=shv.db_busy_timeout, factory=Connection)
+    db_conn.execute("PRAGMA journal_mode=WAL")
+    db_conn.execute("PRAGMA synchronous={}".format(shv.db_synchronous))
+    return db_conn
+
+
+def init_db(db_conn):
+    """
+    Create tables and indexes if they are not exist, migrate tables of older versions
+    :param db_conn: sqlite3.Connection
+    :return: None
+    """
+    if shv.db_layout not in ('narrow', 'wide'):
+        raise ValueError("Unknown DB layout: {}".format(shv.db_layout))
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "select count(*) from sqlite_master where type = 'table' and name in ('ambient_data', 'ambient_frames')"
+    )
+    if (not cursor.fetchone()[0] and shv.db_layout == 'wide') or get_layout(db_conn) == 'wide':  # new or wide DB
+        create_frames_table(cursor)  # index is added to wide DB of older version too
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ambient_data (
+                unixtime integer,
+                type text,
+                value real,
+                device text NOT NULL DEFAULT ''
+            )
+            """)
+    # DB for last send status
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS send_status (
+            unixtime integer,
+            type text,
+            device text NOT NULL DEFAULT ''
+        )
+        """)
+    # DB for known devices, device is identified by its serial port
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS devices (
+            device text PRIMARY KEY,
+            first_seen integer
+        )
+        """)
+    migrate_devices(cursor)
+    # DB for counter of writes which bypass DB writer of running GUI (bulk import, migration), see QueryCache
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_generation (
+            generation integer NOT NULL
+        )
+        """)
+    cursor.execute("INSERT INTO data_generation SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM data_generation)")
+    if get_layout(db_conn) == 'narrow':
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uk_ambient_data on ambient_data (
+                type,
+                unixtime,
+                device
+            )
+            """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_ambient_data_device on ambient_data (
+                device,
+                type,
+                unixtime
+            )
+            """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uk_send_status on send_status (
+            device,
+            type
+        )
+        """)
+    cursor.execute("select count(*) from sqlite_master where type = 'table' and name like 'rollup_%'")
+    need_backfill = cursor.fetchone()[0] < len(rollups)
+    for table, _ in rollups:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS {} (
+                type text,
+                bucket integer,
+                device text,
+                cnt integer,
+                vmin real,
+                vmax real,
+                vsum real,
+                PRIMARY KEY (type, bucket, device)
+            ) WITHOUT ROWID
+            """.format(table))
+    db_conn.commit()
+    if need_backfill:
+        rebuild_rollups(db_conn)
+
+
+def migrate_devices(cursor):
+    """
+    Add device column to tables created before multi-device support, existing data gets '' device
+    :param cursor: sqlite3.Cursor
+    :return: None
+    """
+    for table, index in (('ambient_data', 'uk_ambient_data'), ('send_status', 'uk_send_status')):
+        cursor.execute("PRAGMA table_info({})".format(table))
+        columns = [column[1] for column in cursor.fetchall()]
+        if columns and 'device' not in columns:
+            shv.logger.info("Add device column to %s table", table)
+            cursor.execute("ALTER TABLE {} ADD COLUMN device text NOT NULL DEFAULT ''".format(table))
+            cursor.execute("DROP INDEX IF EXISTS {}".format(index))  # unique index is recreated with device
+            if table == 'ambient_data':
+                cursor.execute("""
+                    INSERT OR IGNORE INTO devices (device, first_seen)
+                    SELECT '', min(unixtime) FROM ambient_data HAVING count(*) > 0
+                    """)
+    for table, _ in rollups:
+        cursor.execute("PRAGMA table_info({})".format(table))
+        columns = [column[1] for column in cursor.fetchall()]
+        if columns and 'device' not in columns:
+            cursor.execute("DROP TABLE {}".format(table))  # rollups are rebuilt from raw data
+
+
+def create_frames_table(cursor):
+    """
+    Create table of wide layout: one row per frame of device, primary key is time and device,
+    index of device and time serves reads of one device
+    :param cursor: sqlite3.Cursor
+    :return: None
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ambient_frames (
+            unixtime integer,
+            device text NOT NULL DEFAULT '',
+            {},
+            PRIMARY KEY (unixtime, device)
+        ) WITHOUT ROWID
+        """.format(',\n            '.join('{} real'.format(column) for column in frame_columns.values())))
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ambient_frames_device on ambient_frames (
+            device,
+            unixtime
+        )
+        """)
+
+
+def get_layout(db_conn):
+    """
+    Layout of ambient data in DB: 'narrow' is ambient_data table with one row per value, 'wide' is
+    ambient_frames table with one row per frame. DB is narrow until migration to wide is finished.
+    Wide layout is kept in connection, narrow one is checked on each call: DB may be migrated online
+    by other process.
+    :param db_conn: sqlite3.Connection
+    :return: str, 'narrow' or 'wide'
+    """
+    if getattr(db_conn, 'layout', None) is not None:
+        return db_conn.layout
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "select name from sqlite_master where type = 'table' and name in ('ambient_data', 'ambient_frames')"
+    )
+    tables = {x[0] for x in cursor.fetchall()}
+    layout = 'wide' if tables == {'ambient_frames'} else 'narrow'
+    if layout == 'wide' and isinstance(db_conn, Connection):
+        db_conn.layout = layout
+    return layout
+
+
+def bump_data_generation(cursor):
+    """
+    Mark write of data which is not reported by DB writer of running GUI, called in transaction of the write
+    :param cursor: sqlite3.Cursor
+    :return: None
+    """
+    cursor.execute("UPDATE data_generation SET generation = generation + 1")
+
+
+def get_data_generation(db_conn):
+    """
+    Counter of writes marked by bump_data_generation. It is read only if other connection has committed
+    since the last call (PRAGMA data_version), so polling costs no query while DB is not changed.
+    :param db_conn: sqlite3.Connection
+    :return: int, counter, None if DB is not changed since the last call on this connection
+    """
+    data_version = db_conn.execute("PRAGMA data_version").fetchone()[0]
+    if isinstance(db_conn, Connection):
+        if data_version == db_conn.data_version:
+            return None
+        db_conn.data_version = data_version
+    return db_conn.execute("select generation from data_generation").fetchone()[0]
+
+
+def series_source(db_conn, sens_dtype):
+    """
+    SQL parts for select of one data type in current layout
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :return: tuple, table, value column, sql condition and its parameters
+    """
+    if get_layout(db_conn) == 'wide':
+        column = frame_columns[sens_dtype]
+        return 'ambient_frames', column, '{} is not null'.format(column), ()
+    return 'ambient_data', 'value', 'type = ?', (sens_dtype,)
+
+
+def archive_path(db_conn):
+    """
+    :param db_conn: sqlite3.Connection
+    :return: str, directory of archive segments of DB, shv.archive_dir or '<DB name>-archive' near DB file,
+        None for in-memory DB
+    """
+    if shv.archive_dir:
+        return shv.archive_dir
+    db_file = [x[2] for x in db_conn.execute("PRAGMA database_list") if x[1] == 'main'][0]
+    return os.path.splitext(db_file)[0] + '-archive' if db_file else None
+
+
+_archives = {}  # {archive directory: Archive.Archive}, archives are shared by connections
+
+
+def get_archive(db_conn, create=False):
+    """
+    :param db_conn: sqlite3.Connection
+    :param create: bool, return archive even if it has no segments yet
+    :return: Archive.Archive or None if DB has no archive
+    """
+    path = archive_path(db_conn)
+    if path is None or not (create or os.path.isdir(path)):
+        return None
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives.setdefault(path, Archive.Archive(path))  # atomic, threads get the same archive
+    return archive
+
+
+def archive_rows(db_conn, dtypes, limit, unixtime_start=None, unixtime_stop=None, device=None, reverse=False):
+    """
+    Get archived rows of data types in time range (bounds are included)
+    :param db_conn: sqlite3.Connection
+    :param dtypes: list, data types in order of row values
+    :param limit: int, max number of rows
+    :param unixtime_start: int, start of time range, None for no limit
+    :param unixtime_stop: int, end of time range, None for no limit
+    :param device: str, identifier of device, None for all devices
+    :param reverse: bool, the newest rows first
+    :return: list, rows of tuples [(unixtime, value, ...), ...], None for missing value, rows without values
+        are skipped
+    """
+    archive = get_archive(db_conn)
+    if archive is None or limit <= 0:
+        return []
+    rows = []
+    for unixtime, values in archive.iter_periods(dtypes, unixtime_start, unixtime_stop, device, reverse):
+        mask = ~np.isnan(values).all(axis=1)
+        unixtime, values = unixtime[mask][:limit - len(rows)], values[mask][:limit - len(rows)]
+        values = values.astype(object)
+        values[np.isnan(values.astype(np.float64))] = None
+        rows.extend(zip(unixtime.tolist(), *values.T.tolist()))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def archive_cold_data(db_conn, older_than_days=None):
+    """
+    Move data older than threshold from DB to archive segments, by whole periods of each device.
+    Each period is one transaction, DB is locked for writers while period is archived, so late
+    readings of period can't be lost. Rollups are kept in DB.
+    :param db_conn: sqlite3.Connection
+    :param older_than_days: float, age of archived data, shv.archive_after_days if None
+    :return: int, number of archived frames
+    """
+    older_than_days = older_than_days if older_than_days is not None else shv.archive_after_days
+    cutoff = int(time.time() - older_than_days * 86400)
+    archive = get_archive(db_conn, create=True)
+    if archive is None:
+        return 0
+    layout = get_layout(db_conn)
+    cursor = db_conn.cursor()
+    moved = 0
+    for device in get_devices(db_conn):
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                first, _ = unixtime_bounds(cursor, layout, device)
+                if first is None or archive.period_bounds(first)[1] > cutoff:
+                    db_conn.rollback()
+                    break
+                period_start, period_stop, name = archive.period_bounds(first)
+                unixtime, values = read_period(cursor, layout, device, period_start, period_stop)
+                archive.write_period(device, unixtime, values)
+                if layout == 'wide':
+                    cursor.execute(
+                        "DELETE FROM ambient_frames WHERE unixtime >= ? AND unixtime < ? AND device = ?",
+                        (period_start, period_stop, device)
+                    )
+                else:
+                    for sens_dtype in shv.all_dtype:
+                        cursor.execute(
+                            "DELETE FROM ambient_data WHERE type = ? AND unixtime >= ? AND unixtime < ? AND device = ?",
+                            (sens_dtype, period_start, period_stop, device)
+                        )
+                db_conn.commit()
+            except Exception:
+                db_conn.rollback()
+                raise
+            moved += len(unixtime)
+            shv.logger.info("\tarchive %s frames of %s for %s", len(unixtime), device, name)
+    return moved
+
+
+def unixtime_bounds(cursor, layout, device):
+    """
+    :return: tuple, time of the oldest and the newest reading of device in DB, (None, None) if there is no data
+    """
+    if layout == 'wide':
+        cursor.execute("select min(unixtime), max(unixtime) from ambient_frames where device = ?", (device,))
+        return cursor.fetchone()
+    first, last = [], []
+    for sens_dtype in shv.all_dtype:  # min and max over (device, type, unixtime) index
+        for aggregate, times in (('min', first), ('max', last)):
+            cursor.execute(
+                "select {}(unixtime) from ambient_data where device = ? and type = ?".format(aggregate),
+                (device, sens_dtype)
+            )
+            times.append(cursor.fetchone()[0])
+    first = [x for x in first if x is not None]
+    last = [x for x in last if x is not None]
+    return (min(first), max(last)) if first else (None, None)
+
+
+def read_period(cursor, layout, device, unixtime_start, unixtime_stop):
+    """
+    Read frames of device from DB, start is included, stop is excluded
+    :return: tuple, unixtime (int64 numpy.ndarray) and 2-dimensional array (rows, shv.all_dtype) with NaN
+        for missing value
+    """
+    if layout == 'wide':
+        cursor.execute(
+            """
+            select unixtime, {} from ambient_frames where unixtime >= ? and unixtime < ? and device = ?
+            order by unixtime
+            """.format(', '.join(frame_columns[sens_dtype] for sens_dtype in shv.all_dtype)),
+            (unixtime_start, unixtime_stop, device)
+        )
+        rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, len(shv.all_dtype) + 1)
+        return rows[:, 0].astype(np.int64), rows[:, 1:]
+    series = []
+    for sens_dtype in shv.all_dtype:
+        cursor.execute(
+            """
+            select unixtime, value from ambient_data where type = ? and unixtime >= ? and unixtime < ? and device = ?
+            """,
+            (sens_dtype, unixtime_start, unixtime_stop, device)
+        )
+        series.append(np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 2))
+    unixtime = np.unique(np.concatenate([x[:, 0] for x in series])).astype(np.int64)
+    values = np.full((len(unixtime), len(series)), np.nan)
+    for i, x in enumerate(series):
+        values[np.searchsorted(unixtime, x[:, 0].astype(np.int64)), i] = x[:, 1]
+    return unixtime, values
+
+
+def get_devices(db_conn):
+    """
+    :param db_conn: sqlite3.Connection
+    :return: list, identifiers of all devices with data in DB
+    """
+    cursor = db_conn.cursor()
+    cursor.execute("select device from devices order by device")
+    return [x[0] for x in cursor.fetchall()]
+
+
+def device_filter(device):
+    """
+    :param device: str, identifier of device, None for all devices
+    :return: tuple, sql condition and its parameters
+    """
+    if device is None:
+        return '', ()
+    return ' and device = ?', (device,)
+
+
+@Profiling.span('insert_readings')
+def insert_readings(db_conn, rows):
+    """
+    Insert readings into DB and add them to rollup tables, readings which are already in DB or archive are skipped.
+    Rows go to temporary staging table by executemany, new readings are selected once into
+    second temporary table and moved by set-based statements. Transaction is not committed.
+    :param db_conn: sqlite3.Connection
+    :param rows: list, structure of tuples with unixtime, data type, value and device
+        [(unixtime, type, value, device), ...]
+    :return: int, number of inserted readings
+    """
+    is_wide = get_layout(db_conn) == 'wide'  # layout can't change in transaction of writer
+    cursor = db_conn.cursor()
+    for table in ('staging_data', 'staging_new'):
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS {} (
+                unixtime integer,
+                type text,
+                value real,
+                device text
+            )
+            """.format(table))
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS staging_archived (
+            unixtime integer,
+            type text,
+            device text,
+            PRIMARY KEY (type, unixtime, device)
+        ) WITHOUT ROWID
+        """)
+    cursor.executemany(
+        """
+        INSERT INTO staging_data (unixtime, type, value, device) VALUES (?, ?, ?, ?)
+        """,
+        rows
+    )
+    stage_archived(db_conn, cursor)
+    if is_wide:
+        is_stored = """
+            SELECT 1 FROM ambient_frames f WHERE f.unixtime = s.unixtime AND f.device = s.device
+            AND CASE s.type {} END IS NOT NULL
+            """.format(' '.join("WHEN '{}' THEN f.{}".format(*item) for item in frame_columns.items()))
+        type_filter = ' AND s.type IN ({})'.format(', '.join("'{}'".format(dtype) for dtype in frame_columns))
+    else:
+        is_stored = """
+            SELECT 1 FROM ambient_data a
+            WHERE a.type = s.type AND a.unixtime = s.unixtime AND a.device = s.device
+            """
+        type_filter = ''
+    cursor.execute(
+        """
+        INSERT INTO staging_new (unixtime, type, value, device)
+        SELECT s.unixtime, s.type, s.value, s.device FROM staging_data s
+        WHERE NOT EXISTS ({}) AND NOT EXISTS (
+            SELECT 1 FROM staging_archived r WHERE r.type = s.type AND r.unixtime = s.unixtime AND r.device = s.device
+        ){}
+        GROUP BY s.type, s.unixtime, s.device
+        """.format(is_stored, type_filter)
+    )
+    inserted = cursor.rowcount
+    for table, resolution in rollups:  # only new readings, duplicates in DB or archive are already in rollups
+        cursor.execute(
+            """
+            INSERT INTO {table} (type, bucket, device, cnt, vmin, vmax, vsum)
+            SELECT type, unixtime / {res} * {res}, device, count(*), min(value), max(value), sum(value)
+            FROM staging_new
+            WHERE true
+            GROUP BY type, unixtime / {res}, device
+            ON CONFLICT (type, bucket, device) DO UPDATE SET
+                cnt = cnt + excluded.cnt,
+                vmin = min(vmin, excluded.vmin),
+                vmax = max(vmax, excluded.vmax),
+                vsum = vsum + excluded.vsum
+            """.format(table=table, res=resolution)
+        )
+    if is_wide:
+        merge_frames(cursor, 'staging_new', 'true')
+    else:
+        cursor.execute(
+            """
+            INSERT INTO ambient_data (unixtime, type, value, device)
+            SELECT unixtime, type, value, device FROM staging_new
+            """
+        )
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO devices (device, first_seen)
+        SELECT device, min(unixtime) FROM staging_new GROUP BY device
+        """
+    )
+    cursor.execute("DELETE FROM staging_data")
+    cursor.execute("DELETE FROM staging_new")
+    cursor.execute("DELETE FROM staging_archived")
+    return inserted
+
+
+def stage_archived(db_conn, cursor):
+    """
+    Put keys of archived readings in time span of staged readings of each device into staging_archived table,
+    only segments of periods of staged readings are read
+    :param db_conn: sqlite3.Connection
+    :param cursor: sqlite3.Cursor
+    :return: None
+    """
+    archive = get_archive(db_conn)
+    if archive is None:
+        return
+    cursor.execute("SELECT device, min(unixtime), max(unixtime) FROM staging_data GROUP BY device")
+    for device, first, last in cursor.fetchall():
+        for segment in archive.period_segments(device, first, last):
+            unixtime, values = segment.read_range(first, last, archive.columns)
+            for j, sens_dtype in enumerate(archive.columns):
+                stored = unixtime[~np.isnan(values[:, j])].tolist()
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO staging_archived (unixtime, type, device) VALUES (?, ?, ?)",
+                    [(x, sens_dtype, device) for x in stored]
+                )
+
+
+def merge_frames(cursor, source, condition, params=()):
+    """
+    Pivot narrow rows (unixtime, type, value, device) into frames of wide layout, value which
+    is already stored is kept
+    :param cursor: sqlite3.Cursor
+    :param source: str, table with narrow rows
+    :param condition: str, sql condition for rows of source
+    :param params: tuple, parameters of condition
+    :return: int, number of inserted or updated frames
+    """
+    columns = list(frame_columns.values())
+    cursor.execute(
+        """
+        INSERT INTO ambient_frames (unixtime, device, {columns})
+        SELECT unixtime, device, {pivot} FROM {source}
+        WHERE {condition}
+        GROUP BY unixtime, device
+        ON CONFLICT (unixtime, device) DO UPDATE SET {update}
+        """.format(
+            columns=', '.join(columns),
+            pivot=', '.join(
+                "max(CASE WHEN type = '{}' THEN value END)".format(dtype) for dtype in frame_columns
+            ),
+            source=source,
+            condition=condition,
+            update=', '.join('{0} = coalesce({0}, excluded.{0})'.format(column) for column in columns)
+        ),
+        params
+    )
+    return cursor.rowcount
+
+
+def migrate_to_wide(db_conn, batch_size=None):
+    """
+    Convert narrow DB to wide layout online: ambient_data rows are copied into ambient_frames
+    by batches of rowid range, each batch is a separate transaction, so other connections can
+    read and write between batches. The last batch (rows written during migration) and drop of
+    ambient_data are done in one transaction, after it readers and writer use wide layout.
+    Interrupted migration may be simply restarted.
+    :param db_conn: sqlite3.Connection
+    :param batch_size: int, number of narrow rows in one transaction
+    :return: None
+    """
+    batch_size = batch_size or shv.db_migrate_batch
+    if get_layout(db_conn) == 'wide':
+        shv.logger.info("DB is already in wide layout")
+        return
+    cursor = db_conn.cursor()
+    create_frames_table(cursor)
+    db_conn.commit()
+    last_rowid = 0
+    while True:
+        cursor.execute(
+            "select max(rowid) from (select rowid from ambient_data where rowid > ? order by rowid limit ?)",
+            (last_rowid, batch_size)
+        )
+        upto_rowid = cursor.fetchone()[0]
+        if upto_rowid is None:
+            break
+        merge_frames(cursor, 'ambient_data', 'rowid > ? AND rowid <= ?', (last_rowid, upto_rowid))
+        db_conn.commit()
+        last_rowid = upto_rowid
+        shv.logger.info("\tmigrated rows up to rowid %s", last_rowid)
+    cursor.execute("BEGIN IMMEDIATE")  # writer waits until switch is done
+    merge_frames(cursor, 'ambient_data', 'rowid > ?', (last_rowid,))
+    cursor.execute("DROP TABLE ambient_data")
+    bump_data_generation(cursor)
+    db_conn.commit()
+    shv.logger.info("DB is migrated to wide layout")
+
+
+def rebuild_rollups(db_conn):
+    """
+    Fill rollup tables from scratch: minute buckets from raw data, each coarser level from previous one
+    :param db_conn: sqlite3.Connection
+    :return: None
+    """
+    shv.logger.info("Rebuild rollup tables")
+    cursor = db_conn.cursor()
+    raw_columns = 'unixtime AS ts, 1 AS cnt, {0} AS vmin, {0} AS vmax, {0} AS vsum'
+    if get_layout(db_conn) == 'wide':
+        source = ' UNION ALL '.join(
+            "SELECT '{}' AS type, device, {} FROM ambient_frames WHERE {} IS NOT NULL".format(
+                dtype, raw_columns.format(column), column
+            )
+            for dtype, column in frame_columns.items()
+        )
+    else:
+        source = 'SELECT type, device, {} FROM ambient_data'.format(raw_columns.format('value'))
+    for table, resolution in rollups:
+        cursor.execute("DELETE FROM {}".format(table))
+        cursor.execute(
+            """
+            INSERT INTO {table} (type, bucket, device, cnt, vmin, vmax, vsum)
+            SELECT type, ts / {res} * {res}, device, sum(cnt), min(vmin), max(vmax), sum(vsum)
+            FROM ({source})
+            GROUP BY type, ts / {res}, device
+            """.format(table=table, res=resolution, source=source)
+        )
+        source = 'SELECT type, device, bucket AS ts, cnt, vmin, vmax, vsum FROM {}'.format(table)
+    bump_data_generation(cursor)
+    db_conn.commit()
+
+
+def choose_resolution(unixtime_start, unixtime_stop, n_buckets):
+    """
+    Choose the coarsest rollup which still gives requested number of buckets in time range
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param n_buckets: int, required number of time buckets
+    :return: tuple (table, resolution) of rollup or None if raw data is needed
+    """
+    for table, resolution in reversed(rollups):
+        if (unixtime_stop - unixtime_start) / resolution >= n_buckets:
+            return table, resolution
+    return None
+
+
+def get_last_data(db_conn, sens_dtype, limit=100, device=None):
+    """
+    Get last data of sensor from DB
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param limit: int, limit value for get last data from DB
+    :param device: str, identifier of device, None for all devices
+    :return: list, structure of tuples with values of unixtime and float value [(unixtime, value), ...]
+    """
+    table, value, condition, params = series_source(db_conn, sens_dtype)
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        """
+        select unixtime, {} from {} where {}{} order by unixtime desc limit ?
+        """.format(value, table, condition, device_sql),
+        params + device_params + (limit,)
+    )
+    data = cursor.fetchall()
+    if len(data) < limit:  # older data may be in archive
+        data += archive_rows(
+            db_conn, [sens_dtype], limit - len(data),
+            unixtime_stop=data[-1][0] - 1 if data else None, device=device, reverse=True
+        )
+    data.reverse()  # oldest come first
+    return data
+
+
+def iter_range_chunks(
+        db_conn, sens_dtype, unixtime_start, unixtime_stop, chunk_size=None, device=None, with_archive=True
+):
+    """
+    Stream data of sensor in time range (bounds are included) from archive and DB by chunks, ordered by time.
+    Query goes over (type, unixtime) index or time key of frames, so cost depends only on number of rows in range.
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param chunk_size: int, number of rows fetched from cursor at once
+    :param device: str, identifier of device, None for all devices
+    :param with_archive: bool, archived data go first, otherwise only DB is read
+    :return: generator of lists with tuples of unixtime and float value
+    """
+    chunk_size = chunk_size or shv.db_chunk_size
+    if with_archive:
+        for x_chunk, y_chunk in iter_archive_arrays(db_conn, sens_dtype, unixtime_start, unixtime_stop, device):
+            rows = list(zip(x_chunk.tolist(), y_chunk.tolist()))
+            for i in range(0, len(rows), chunk_size):
+                yield rows[i:i + chunk_size]
+    table, value, condition, params = series_source(db_conn, sens_dtype)
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        """
+        select unixtime, {} from {}
+        where {} and unixtime between ? and ?{} order by unixtime
+        """.format(value, table, condition, device_sql),
+        params + (unixtime_start, unixtime_stop) + device_params
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_archive_arrays(db_conn, sens_dtype, unixtime_start, unixtime_stop, device=None):
+    """
+    Stream archived data of sensor in time range (bounds are included) by periods of archive
+    :return: generator of tuples of numpy.ndarray, unixtime (int64) and values (float64)
+    """
+    archive = get_archive(db_conn)
+    if archive is None:
+        return
+    for unixtime, values in archive.iter_periods([sens_dtype], unixtime_start, unixtime_stop, device):
+        mask = ~np.isnan(values[:, 0])
+        if mask.any():
+            yield unixtime[mask], values[mask, 0]
+
+
+def get_data_after(db_conn, sens_dtype, unixtime_after, limit, device=None):
+    """
+    Get the oldest data of sensor after time
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_after: int, only readings newer than this time are taken
+    :param limit: int, max number of readings
+    :param device: str, identifier of device, None for all devices
+    :return: list, structure of tuples with values of unixtime and float value [(unixtime, value), ...]
+    """
+    table, value, condition, params = series_source(db_conn, sens_dtype)
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        """
+        select unixtime, {} from {} where {} and unixtime > ?{} order by unixtime limit ?
+        """.format(value, table, condition, device_sql),
+        params + (unixtime_after,) + device_params + (limit,)
+    )
+    data = cursor.fetchall()
+    archived = archive_rows(db_conn, [sens_dtype], limit, unixtime_start=unixtime_after + 1, device=device)
+    if archived:  # not sent data was archived
+        data = sorted(archived + data)[:limit]
+    return data
+
+
+def count_after(db_conn, sens_dtype, unixtime_after, device=None):
+    """
+    Count readings of sensor after time by minute rollup, so count is cheap for long backlog.
+    Readings of the minute of unixtime_after are not counted.
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_after: int, only readings newer than this time are counted
+    :param device: str, identifier of device, None for all devices
+    :return: int, number of readings
+    """
+    table, resolution = rollups[0]
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        """
+        select coalesce(sum(cnt), 0) from {} where type = ? and bucket > ?{}
+        """.format(table, device_sql),
+        (sens_dtype, unixtime_after // resolution * resolution) + device_params
+    )
+    return cursor.fetchone()[0]
+
+
+def iter_range(db_conn, sens_dtype, unixtime_start, unixtime_stop, chunk_size=None, device=None):
+    """
+    Stream data of sensor in time range (bounds are included) from DB, ordered by time
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param chunk_size: int, number of rows fetched from cursor at once
+    :param device: str, identifier of device, None for all devices
+    :return: generator of tuples with values of unixtime and float value
+    """
+    for rows in iter_range_chunks(db_conn, sens_dtype, unixtime_start, unixtime_stop, chunk_size, device):
+        yield from rows
+
+
+def get_range_arrays(
+        db_conn, sens_dtype, unixtime_start, unixtime_stop, n_buckets=None, chunk_size=None, device=None
+):
+    """
+    Get data of sensor in time range as arrays for plotting, rows are converted chunk by chunk.
+    If n_buckets is set and rollup with enough buckets exists, min/max envelope of the rollup is
+    returned instead of raw data: minimum at bucket start and maximum at bucket middle.
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param n_buckets: int, number of time buckets the plot needs, raw data is used if None
+    :param chunk_size: int, number of rows fetched from cursor at once
+    :param device: str, identifier of device, None for all devices
+    :return: tuple of numpy.ndarray, unixtime (int64) and values (float64)
+    """
+    rollup = choose_resolution(unixtime_start, unixtime_stop, n_buckets) if n_buckets else None
+    if rollup is not None:
+        bucket, _, vmin, vmax, _ = get_rollup_arrays(
+            db_conn, sens_dtype, unixtime_start, unixtime_stop, rollup, device
+        )
+        data_x = np.empty(2 * len(bucket), dtype=np.int64)
+        data_y = np.empty(2 * len(bucket), dtype=np.float64)
+        data_x[0::2] = bucket
+        data_x[1::2] = bucket + rollup[1] // 2
+        data_y[0::2] = vmin
+        data_y[1::2] = vmax
+        return data_x, data_y
+
+    x_chunks = []
+    y_chunks = []
+    for x_chunk, y_chunk in iter_archive_arrays(db_conn, sens_dtype, unixtime_start, unixtime_stop, device):
+        x_chunks.append(x_chunk)
+        y_chunks.append(y_chunk)
+    hot_start = int(x_chunks[-1][-1]) + 1 if x_chunks else unixtime_start  # archived rows are not read twice
+    for rows in iter_range_chunks(
+            db_conn, sens_dtype, hot_start, unixtime_stop, chunk_size, device, with_archive=False
+    ):
+        x_chunk, y_chunk = zip(*rows)
+        x_chunks.append(np.array(x_chunk, dtype=np.int64))
+        y_chunks.append(np.array(y_chunk, dtype=np.float64))
+    if not x_chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(x_chunks), np.concatenate(y_chunks)
+
+
+def iter_frames(db_conn, dtypes, unixtime_start, unixtime_stop, device, chunk_size=None):
+    """
+    Stream frames of device in time range (bounds are included) from archive and DB by chunks of arrays,
+    ordered by time, memory does not depend on length of range
+    :param db_conn: sqlite3.Connection
+    :param dtypes: list, data types in order of columns
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param device: str, identifier of device
+    :param chunk_size: int, number of rows fetched from cursor at once
+    :return: generator of tuples, unixtime (int64 numpy.ndarray) and 2-dimensional float64 array of values
+        (rows, dtypes) with NaN for missing value
+    """
+    chunk_size = chunk_size or shv.db_chunk_size
+    archive = get_archive(db_conn)
+    if archive is not None:
+        for unixtime, values in archive.iter_periods(dtypes, unixtime_start, unixtime_stop, device):
+            mask = ~np.isnan(values).all(axis=1)
+            if mask.any():
+                unixtime_start = int(unixtime[mask][-1]) + 1  # archived rows are not read twice
+                for i in range(0, int(mask.sum()), chunk_size):
+                    yield unixtime[mask][i:i + chunk_size], values[mask][i:i + chunk_size]
+    cursor = db_conn.cursor()
+    if get_layout(db_conn) == 'wide':
+        columns = [frame_columns[sens_dtype] for sens_dtype in dtypes]
+        cursor.execute(
+            """
+            select unixtime, {} from ambient_frames where unixtime between ? and ? and device = ?
+            and coalesce({}) is not null order by unixtime
+            """.format(', '.join(columns), ', '.join(columns + ['null'])),
+            (unixtime_start, unixtime_stop, device)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            rows = np.array(rows, dtype=np.float64)
+            yield rows[:, 0].astype(np.int64), rows[:, 1:]
+        return
+    first, last = unixtime_bounds(cursor, 'narrow', device)
+    if first is None:
+        return
+    window = 86400  # narrow rows are pivoted by windows of time, so sort of group by stays small
+    unixtime_stop = min(unixtime_stop, last)
+    for window_start in range(max(unixtime_start, first), unixtime_stop + 1, window):
+        cursor.execute(
+            """
+            select unixtime, {} from ambient_data
+            where type in ({}) and unixtime between ? and ? and device = ?
+            group by unixtime order by unixtime
+            """.format(
+                ', '.join("max(case when type = ? then value end)" for _ in dtypes),
+                ', '.join('?' for _ in dtypes)
+            ),
+            tuple(dtypes) * 2 + (window_start, min(window_start + window - 1, unixtime_stop), device)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            rows = np.array(rows, dtype=np.float64)
+            yield rows[:, 0].astype(np.int64), rows[:, 1:]
+
+
+def get_rollup_arrays(db_conn, sens_dtype, unixtime_start, unixtime_stop, rollup, device=None):
+    """
+    Get aggregates of sensor data for buckets overlapping time range, for all devices they are merged
+    :param db_conn: sqlite3.Connection
+    :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param rollup: tuple, (table, resolution) item of rollups
+    :param device: str, identifier of device, None for all devices
+    :return: tuple of numpy.ndarray, bucket start, count, min, max and mean
+    """
+    table, resolution = rollup
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    cursor.execute(
+        """
+        select bucket, sum(cnt), min(vmin), max(vmax), sum(vsum) / sum(cnt) from {}
+        where type = ? and bucket between ? and ?{} group by bucket order by bucket
+        """.format(table, device_sql),
+        (sens_dtype, unixtime_start // resolution * resolution, unixtime_stop) + device_params
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.float64, np.float64))
+    bucket, cnt, vmin, vmax, mean = zip(*rows)
+    return (
+        np.array(bucket, dtype=np.int64),
+        np.array(cnt, dtype=np.int64),
+        np.array(vmin, dtype=np.float64),
+        np.array(vmax, dtype=np.float64),
+        np.array(mean, dtype=np.float64)
+    )
+
+
+def get_frames_before(db_conn, unixtime_before, limit, dtypes=None, device=None):
+    """
+    Get last readings of all data types before time, joined by time in rows
+    :param db_conn: sqlite3.Connection
+    :param unixtime_before: int, only readings older than this time are taken
+    :param limit: int, max number of rows
+    :param dtypes: list, data types in order of row values, shv.all_dtype if None
+    :param device: str, identifier of device, None for all devices
+    :return: list, rows of tuples [(unixtime, value, ...), ...] newest first, None for missing value
+    """
+    dtypes = dtypes or shv.all_dtype
+    device_sql, device_params = device_filter(device)
+    cursor = db_conn.cursor()
+    if get_layout(db_conn) == 'wide':  # frames are rows already
+        cursor.execute(
+            """
+            select unixtime, {} from ambient_frames where unixtime < ?{}
+            order by unixtime desc limit ?
+            """.format(', '.join(frame_columns[sens_dtype] for sens_dtype in dtypes), device_sql),
+            (unixtime_before,) + device_params + (limit,)
+        )
+        frames = cursor.fetchall()
+        return frames + archive_rows(
+            db_conn, dtypes, limit - len(frames),
+            unixtime_stop=(frames[-1][0] if frames else unixtime_before) - 1, device=device, reverse=True
+        )
+    times = set()
+    for sens_dtype in dtypes:  # index range scan for each type
+        cursor.execute(
+            """
+            select unixtime from ambient_data where type = ? and unixtime < ?{}
+            order by unixtime desc limit ?
+            """.format(device_sql),
+            (sens_dtype, unixtime_before) + device_params + (limit,)
+        )
+        times.update(x[0] for x in cursor.fetchall())
+    times = sorted(times, reverse=True)[:limit]
+    if not times:
+        return archive_rows(db_conn, dtypes, limit, unixtime_stop=unixtime_before - 1, device=device, reverse=True)
+    frames = {unixtime: [unixtime] + [None] * len(dtypes) for unixtime in times}
+    for i, sens_dtype in enumerate(dtypes):
+        cursor.execute(
+            """
+            select unixtime, value from ambient_data where type = ? and unixtime between ? and ?{}
+            """.format(device_sql),
+            (sens_dtype, times[-1], times[0]) + device_params
+        )
+        for unixtime, value in cursor.fetchall():
+            if unixtime in frames:
+                frames[unixtime][i + 1] = value
+    frames = [tuple(frames[unixtime]) for unixtime in times]
+    return frames + archive_rows(
+        db_conn, dtypes, limit - len(frames), unixtime_stop=times[-1] - 1, device=device, reverse=True
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Maintenance of client database")
+    parser.add_argument('--db', default='test.db', help="path to SQLite database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild-rollups', help="backfill minute/hour/day rollup tables from raw data")
+    migrate_parser = subparsers.add_parser('migrate-wide', help="convert DB to wide layout (one row per frame)")
+    migrate_parser.add_argument('--batch-size', type=int, help="number of rows in one transaction")
+    migrate_parser.add_argument('--vacuum', action='store_true', help="compact DB file after migration (not online)")
+    archive_parser = subparsers.add_parser('archive', help="move old data to archive segments")
+    archive_parser.add_argument('--older-than', type=float, help="age of archived data in days")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    shv.logger = logging.getLogger('main_logger')
+    conn = connect(args.db)
+    init_db(conn)
+    if args.command == 'rebuild-rollups':
+        rebuild_rollups(conn)
+    elif args.command == 'migrate-wide':
+        migrate_to_wide(conn, args.batch_size)
+        if args.vacuum:
+            conn.execute("VACUUM")
+    elif args.command == 'archive':
+        archive_cold_data(conn, args.older_than)
+    conn.close()
@@ -1,65 +1,115 @@
+import logging
+import time
 from PyQt5 import QtGui, QtCore, QtWidgets
-import TableImplementation
+import Profiling
 import SharedVars as shv
 
 
-class InfoWindow:
-    def __init__(self, parent = None):
-        self.parent = None
+class InfoWindow(QtCore.QObject):
+    """
+    Window with warnings for user. Message may come from any thread, it is shown in GUI thread by
+    queued signal. One non-modal message box is reused, so logging never waits for user.
+    """
+    message_signal = QtCore.pyqtSignal(str, str)  # title and text of message
 
-    def write(self, logmessage, *args, **kwargs):
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self)
+        self.parent = parent
+        self.box = None
+        self.message_signal.connect(self.show_message)
+
+    def show_message(self, title, text):
         """
-        Show information window to user
-        :param logmessage: information in logging message
+        Show information window to user, called in GUI thread
+        :param title: str, title of window
+        :param text: str, text of message
         :return: None
         """
-        # saved_args = locals()  # print locals() to see what pass
-        logmessage = logmessage.split(',')
-        logtype = logmessage[0]
-        logtime = logmessage[1]
-        logdata = logmessage[3]
-        logtext = logmessage[4]
-        QtWidgets.QMessageBox.about(
-            self.parent,
-            '{} {}'.format(logtype, logdata),
-            '{} {} \n {}: {}'.format(
-                logtype,
-                logdata,
-                logtime,
-                logtext
-            )
+        if self.box is None:
+            self.box = QtWidgets.QMessageBox(self.parent)
+            self.box.setIcon(QtWidgets.QMessageBox.Warning)
+            self.box.setWindowModality(QtCore.Qt.NonModal)
+        self.box.setWindowTitle(title)
+        self.box.setText(text)
+        self.box.show()
+
+
+class InfoHandler(logging.Handler):
+    """
+    Logging handler which shows warnings in InfoWindow, at most one message per interval: messages
+    in between are only counted, the number is shown with the next message
+    """
+
+    def __init__(self, info_window, interval=None, level=logging.WARNING):
+        """
+        :param info_window: InfoWindow, window for messages
+        :param interval: float, min time between messages in seconds
+        :param level: int, min logging level of shown records
+        """
+        logging.Handler.__init__(self, level)
+        self.info_window = info_window
+        self.interval = interval if interval is not None else shv.log_warning_interval
+        self.next_time = 0  # monotonic time when the next message may be shown
+        self.suppressed = 0  # number of records which are not shown
+        self.setFormatter(logging.Formatter('%(asctime)s: %(message)s'))
+
+    def emit(self, record):
+        now = time.monotonic()
+        if now < self.next_time:
+            self.suppressed += 1
+            return
+        self.next_time = now + self.interval
+        try:
+            text = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if self.suppressed:
+            text += '\n\n{} more messages are in log'.format(self.suppressed)
+            self.suppressed = 0
+        self.info_window.message_signal.emit(
+            '{} ({} - {} - {})'.format(record.levelname, record.module, record.funcName, record.lineno),
+            text
         )
 
 
+@Profiling.span('set_table_data')
 def set_table_data(
-        data_to_table,
-        tv_data_widget,
-        time_stamp
+        reading,
+        tv_data_widget
 ):
     """
-    Process and display data in QTableView widget
-    :param data_to_table: list, data lists for each iteration
+    Display data in QTableView widget, as new row of its LiveTableModel
+    :param reading: FrameParser.Reading, data frame
     :param tv_data_widget: PyQt5.Widgets.QTableView, main table for display COM data
-    :param time_stamp: str, time
     :return: int, if process without errors, None otherwise
     """
-    shv.logger.debug('\t gat data to table: {}'.format(data_to_table))
-    shv.all_headers[1].insert(0, time_stamp)
-    data_line = []
-    for data_type in data_to_table:
-        shv.all_headers[0].append(
-            '{} {}'.format(
-                data_type,
-                shv.all_units[data_type]
-            )
-        )
-        data_line.append(data_to_table[data_type])
-    shv.all_table_data.insert(0, data_line)
+    shv.logger.debug('\t gat data to table: %s', reading)
+    tv_model = tv_data_widget.model()
+    tv_model.append_row(reading.unixtime, [getattr(reading, data_type) for data_type in tv_model.columns])
+    return 1
 
-    shv.logger.debug('\t set new table for QWidget')
-    tv_model = TableImplementation.MyTableModel(
-        shv.all_table_data,
-        shv.all_headers
+
+def select_dtypes(parent=None):
+    """
+    Ask user for data types, e.g. for export
+    :param parent: parent widget of dialog
+    :return: list, selected data types or None if dialog is cancelled or nothing is selected
+    """
+    dialog = QtWidgets.QDialog(parent)
+    dialog.setWindowTitle('Select data')
+    layout = QtWidgets.QVBoxLayout(dialog)
+    check_boxes = {}
+    for data_type in shv.all_dtype:
+        check_boxes[data_type] = QtWidgets.QCheckBox('{} {}'.format(data_type, shv.all_units[data_type]), dialog)
+        check_boxes[data_type].setChecked(True)
+        layout.addWidget(check_boxes[data_type])
+    buttons = QtWidgets.QDialogButtonBox(
+        QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel, parent=dialog
     )
-    tv_data_widget.setModel(tv_model)
-    return 1
\ No newline at end of file
+    buttons.accepted.connect(dialog.accept)
+    buttons.rejected.connect(dialog.reject)
+    layout.addWidget(buttons)
+    if dialog.exec_() != QtWidgets.QDialog.Accepted:
+        return None
+    return [data_type for data_type, check_box in check_boxes.items() if check_box.isChecked()] or None
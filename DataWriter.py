@@ -0,0 +1,141 @@
+import queue
+import sqlite3
+import threading
+import time
+
+import DataBase
+import Metrics
+import Profiling
+import SharedVars as shv
+
+"""This module provides single writer of readings into client database with group commit"""
+
+
+class DataWriter(threading.Thread):
+    """
+    Thread which owns the only writing connection to DB. Readings are queued by producers and
+    written by one transaction for a group: when db_flush_size readings are collected or the
+    oldest of them waits db_flush_interval seconds. Not committed readings (up to flush interval)
+    may be lost on crash, this is the price of one fsync per group instead of one per reading.
+    Group which is not written because DB is locked by other process (BulkImport, migration) is kept
+    and retried at next deadline, up to db_retry_age seconds and db_retry_readings readings.
+    Writer also moves cold data to archive every archive_interval seconds, so the only writer
+    deletes archived rows.
+    """
+
+    def __init__(self, db_path, flush_interval=None, flush_size=None):
+        """
+        :param db_path: str, path to SQLite database
+        :param flush_interval: float, max waiting time (seconds) of reading before commit
+        :param flush_size: int, max number of readings in one transaction
+        """
+        threading.Thread.__init__(self, name='db-writer', daemon=True)
+        self.db_path = db_path
+        self.flush_interval = flush_interval if flush_interval is not None else shv.db_flush_interval
+        self.flush_size = flush_size or shv.db_flush_size
+        self.queue = queue.Queue()
+        self.listeners = []  # functions called with list of committed rows after each flush
+        self.db_conn = None
+        self.next_archive = time.monotonic()  # time of next archival, None if archival is off
+        self.retry_since = None  # time of the first failed write of pending readings, None if write is not failed
+
+    def put(self, rows):
+        """
+        Queue readings for writing, called from any thread
+        :param rows: list, structure of tuples with unixtime, data type, value and device
+            [(unixtime, type, value, device), ...]
+        :return: None
+        """
+        self.queue.put(rows)
+
+    def stop(self):
+        """
+        Write all queued readings and stop thread
+        :return: None
+        """
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        shv.logger.info("Run thread for DB writer")
+        self.db_conn = DataBase.connect(self.db_path)
+        if shv.archive_after_days is None:
+            self.next_archive = None
+        pending = []
+        deadline = None
+        is_run = True
+        while is_run:
+            wakeups = [x for x in (deadline, self.next_archive) if x is not None]
+            timeout = max(min(wakeups) - time.monotonic(), 0) if wakeups else None
+            try:
+                rows = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                rows = []
+            if rows is None:
+                is_run = False
+            elif rows:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.extend(rows)
+            is_full = len(pending) >= self.flush_size and self.retry_since is None  # retry waits for deadline
+            if pending and (not is_run or is_full or time.monotonic() >= deadline):
+                if self.flush(pending, can_retry=is_run):
+                    pending = []
+                    deadline = None
+                else:
+                    deadline = time.monotonic() + self.flush_interval
+            if is_run and self.next_archive is not None and time.monotonic() >= self.next_archive:
+                self.archive()
+        self.db_conn.close()
+        shv.logger.info("DB writer is stopped")
+
+    @Profiling.span('db_write')
+    def flush(self, pending, can_retry=True):
+        """
+        Write group of readings in one transaction
+        :param pending: list, structure of tuples with unixtime, data type, value and device
+        :param can_retry: bool, group may be kept for retry if DB is locked
+        :return: bool, False if group is not written and must be retried, True if it is written or dropped
+        """
+        try:
+            with Metrics.db_write_seconds.time():
+                # take write lock at start: read snapshot of deferred transaction can't be upgraded
+                # to write if other connection commits meanwhile, busy timeout doesn't help then
+                self.db_conn.execute("BEGIN IMMEDIATE")
+                inserted = DataBase.insert_readings(self.db_conn, pending)
+                self.db_conn.commit()
+        except Exception as exc:
+            self.db_conn.rollback()
+            Metrics.db_write_errors.inc()
+            now = time.monotonic()
+            if self.retry_since is None:
+                self.retry_since = now
+            if (
+                    can_retry and isinstance(exc, sqlite3.OperationalError)  # e.g. database is locked
+                    and now - self.retry_since < shv.db_retry_age and len(pending) <= shv.db_retry_readings
+            ):
+                shv.logger.warning("%s readings are not written to DB, retry later: %r", len(pending), exc)
+                return False
+            shv.logger.error("%s readings are not written to DB: %r", len(pending), exc)
+            self.retry_since = None
+            return True
+        self.retry_since = None
+        Metrics.db_write_readings.inc(len(pending))
+        shv.logger.debug("\twrite %s readings, %s new", len(pending), inserted)
+        for listener in self.listeners:
+            listener(pending)
+        return True
+
+    def archive(self):
+        """
+        Move cold data to archive, readings are queued meanwhile
+        :return: None
+        """
+        try:
+            moved = DataBase.archive_cold_data(self.db_conn)
+        except Exception as exc:
+            shv.logger.error("Data are not archived: %r", exc)
+        else:
+            if moved:
+                shv.logger.info("\tarchive %s frames", moved)
+        self.next_archive = time.monotonic() + shv.archive_interval
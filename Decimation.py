@@ -0,0 +1,89 @@
+import numpy as np
+import SharedVars as shv
+
+"""This module provides downsampling of long data series before plotting"""
+
+
+def decimate(x, y, n_out, method=None):
+    """
+    Reduce number of points of data series for plotting
+    :param x: numpy.ndarray, unixtime values ordered by time
+    :param y: numpy.ndarray, sensor values
+    :param n_out: int, max number of points after decimation
+    :param method: str, 'lttb' or 'minmax', shv.decimation_method if None
+    :return: tuple of numpy.ndarray, decimated x and y
+    """
+    method = method or shv.decimation_method
+    if method == 'lttb':
+        return lttb(x, y, n_out)
+    if method == 'minmax':
+        return min_max(x, y, n_out)
+    raise ValueError("Unknown decimation method: {}".format(method))
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling. First and last points are kept, other points
+    are split on n_out - 2 buckets and from each bucket the point forming the largest triangle
+    with selected point of previous bucket and average point of next bucket is taken.
+    :param x: numpy.ndarray, unixtime values ordered by time
+    :param y: numpy.ndarray, sensor values
+    :param n_out: int, number of points after decimation
+    :return: tuple of numpy.ndarray, decimated x and y
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    xf = np.asarray(x, dtype=np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)  # bucket b is [edges[b], edges[b + 1])
+    counts = np.diff(edges)
+    # average point of next bucket for each bucket, the last bucket looks at the last point
+    avg_x = np.append(np.add.reduceat(xf[:n - 1], edges[:-1])[1:] / counts[1:], xf[-1])
+    avg_y = np.append(np.add.reduceat(yf[:n - 1], edges[:-1])[1:] / counts[1:], yf[-1])
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        bx = xf[start:stop]
+        by = yf[start:stop]
+        area = np.abs((xf[a] - avg_x[b]) * (by - yf[a]) - (xf[a] - bx) * (avg_y[b] - yf[a]))
+        a = start + int(np.argmax(area))
+        selected[b + 1] = a
+    return x[selected], y[selected]
+
+
+def min_max(x, y, n_out):
+    """
+    Min/max per bucket downsampling. Time range is split on n_out / 2 buckets of equal width
+    (one bucket per pixel column of the plot) and minimum and maximum of each bucket are kept,
+    so peaks are never lost.
+    :param x: numpy.ndarray, unixtime values ordered by time
+    :param y: numpy.ndarray, sensor values
+    :param n_out: int, max number of points after decimation (without first and last points)
+    :return: tuple of numpy.ndarray, decimated x and y
+    """
+    n = len(x)
+    buckets = n_out // 2
+    if n <= n_out or buckets < 1:
+        return x, y
+    xf = np.asarray(x, dtype=np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+    span = xf[-1] - xf[0]
+    if span <= 0:
+        return x[[0, -1]], y[[0, -1]]
+    bucket_id = np.minimum(((xf - xf[0]) * buckets / span).astype(np.intp), buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket_id[1:] != bucket_id[:-1]])  # first index of each non empty bucket
+    rank = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))  # bucket number of each point
+
+    selected = [np.array([0, n - 1])]
+    for reduce in (np.minimum, np.maximum):
+        extremum = reduce.reduceat(yf, starts)
+        hits = np.flatnonzero(yf == extremum[rank])
+        _, first = np.unique(rank[hits], return_index=True)  # first point with extremum in each bucket
+        selected.append(hits[first])
+    selected = np.unique(np.concatenate(selected))
+    return x[selected], y[selected]
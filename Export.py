@@ -0,0 +1,147 @@
+import csv
+import os
+import time
+
+import numpy as np
+
+import Archive
+import DataBase
+import SharedVars as shv
+
+"""This module provides streaming export of ambient data for time range into CSV or columnar segment files"""
+
+formats = ('csv', 'seg')  # CSV text or columnar segment of Archive module
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def export_path(path, device, n_devices):
+    """
+    Columnar segment holds one device, so file of each device gets its suffix if several devices are exported
+    :return: str, path of export file of device
+    """
+    if n_devices == 1:
+        return path
+    stem, ext = os.path.splitext(path)
+    return '{}-{}{}'.format(stem, Archive.Archive.device_key(device), ext)
+
+
+def export_data(db_conn, path, dtypes, unixtime_start, unixtime_stop, devices, fmt=None, progress=None,
+                is_cancelled=None):
+    """
+    Export frames of devices in time range (bounds are included). Frames are streamed from archive and DB
+    by chunks straight to file, so memory does not depend on length of range. CSV has one file with rows
+    of all devices (device by device), columnar format has one file per device.
+    :param db_conn: sqlite3.Connection
+    :param path: str, path of output file
+    :param dtypes: list, exported data types
+    :param unixtime_start: int, start of time range
+    :param unixtime_stop: int, end of time range
+    :param devices: list, identifiers of exported devices
+    :param fmt: str, 'csv' or 'seg', taken from file extension if None
+    :param progress: function (float from 0 to 1) called after each chunk
+    :param is_cancelled: function () -> bool, export is stopped and files are removed if it returns True
+    :return: int, number of exported rows
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in formats:
+        fmt = 'csv'
+    span = max(unixtime_stop - unixtime_start, 1)
+    rows = 0
+    written = []
+    csv_file = None
+    try:
+        if fmt == 'csv':
+            csv_file = open(path, 'w', newline='')
+            written.append(path)
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(
+                ['device', 'unixtime', 'datetime'] + ['{} {}'.format(x, shv.all_units[x]) for x in dtypes]
+            )
+        for i, device in enumerate(devices):
+            segment = None
+            if fmt == 'seg':
+                segment = Archive.SegmentWriter(
+                    export_path(path, device, len(devices)), dtypes,
+                    meta={
+                        'device': device,
+                        'start': unixtime_start,
+                        'stop': unixtime_stop,
+                        'units': {x: shv.all_units[x] for x in dtypes}
+                    }
+                )
+            try:
+                for unixtime, values in DataBase.iter_frames(db_conn, dtypes, unixtime_start, unixtime_stop, device):
+                    if is_cancelled is not None and is_cancelled():
+                        raise ExportCancelled()
+                    if segment is not None:
+                        segment.write(unixtime, values)
+                    else:
+                        write_csv_rows(csv_writer, device, unixtime, values)
+                    rows += len(unixtime)
+                    if progress is not None:
+                        progress((i + (int(unixtime[-1]) - unixtime_start) / span) / len(devices))
+                if segment is not None:
+                    segment.close()
+                    written.append(segment.path)
+            except BaseException:
+                if segment is not None:
+                    segment.abort()
+                raise
+        if csv_file is not None:
+            csv_file.close()
+    except BaseException:
+        if csv_file is not None:
+            csv_file.close()
+        for written_path in written:
+            os.remove(written_path)
+        raise
+    if progress is not None:
+        progress(1)
+    return rows
+
+
+def write_csv_rows(csv_writer, device, unixtime, values):
+    """
+    :param csv_writer: csv.writer of output file
+    :param device: str, identifier of device
+    :param unixtime: numpy.ndarray, time of rows
+    :param values: numpy.ndarray, 2-dimensional array (rows, data types), NaN for missing value
+    :return: None
+    """
+    text = np.char.mod('%g', values).astype(object)
+    text[np.isnan(values)] = ''
+    csv_writer.writerows(
+        [device, t, time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(t))] + row
+        for t, row in zip(unixtime.tolist(), text.tolist())
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import datetime
+    import logging
+
+    parser = argparse.ArgumentParser(description="Export of ambient data for time range")
+    parser.add_argument('--db', default='test.db', help="path to SQLite database")
+    parser.add_argument('--start', required=True, help="start of range, YYYY-MM-DD[THH:MM:SS] local time")
+    parser.add_argument('--stop', required=True, help="end of range, YYYY-MM-DD[THH:MM:SS] local time")
+    parser.add_argument('--type', action='append', dest='dtypes', choices=shv.all_dtype, help="data type, all by default")
+    parser.add_argument('--device', action='append', dest='devices', help="device, all by default")
+    parser.add_argument('output', help="output file, .csv or .seg (columnar)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    shv.logger = logging.getLogger('main_logger')
+    conn = DataBase.connect(args.db)
+    DataBase.init_db(conn)
+    n = export_data(
+        conn, args.output, args.dtypes or shv.all_dtype,
+        int(datetime.datetime.fromisoformat(args.start).timestamp()),
+        int(datetime.datetime.fromisoformat(args.stop).timestamp()),
+        args.devices or DataBase.get_devices(conn)
+    )
+    shv.logger.info("Exported %s rows", n)
+    conn.close()
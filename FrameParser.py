@@ -0,0 +1,148 @@
+import collections
+import math
+import time
+
+"""This module provides parser of data frames of LogicYield ambient device"""
+# Frame: LY,2022_5_7_13_51_31,T_27.61_C,R_27_%,P_754_mm,CO2_408_ppm
+
+
+class Reading(collections.namedtuple('Reading', ['unixtime', 'CO2', 'T', 'R', 'P', 'device'], defaults=('',))):
+    """
+    One frame of device: time and value of each data type, None if value is missing, and
+    identifier of device (serial port) which sent the frame
+    """
+    __slots__ = ()
+    data_types = ('CO2', 'T', 'R', 'P')
+
+    def rows(self):
+        """
+        :return: list, structure of tuples with unixtime, data type, value and device
+            [(unixtime, type, value, device), ...]
+        """
+        return [
+            (self.unixtime, data_type, value, self.device)
+            for data_type, value in zip(self.data_types, self[1:5])
+            if value is not None
+        ]
+
+
+class FrameParser:
+    """
+    Validate and parse data frames. Conversion of device local time to unixtime is cached
+    for each hour of date, so each frame costs only a few integer operations.
+    """
+    max_cached_hours = 1024
+
+    def __init__(self, device=''):
+        """
+        :param device: str, identifier of device which frames are parsed
+        """
+        self.device = device
+        self._hour_epoch = {}  # {(year, month, day, hour): unixtime of hour start}
+
+    def parse(self, line):
+        """
+        Parse one frame
+        :param line: bytes or str, data line without line end
+        :return: Reading or None if line is not a valid frame
+        """
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('ascii')
+            except UnicodeDecodeError:
+                return None
+        splitted = line.strip().split(',')
+        if len(splitted) != 6 or splitted[0] != 'LY':
+            return None  # partial data
+        try:
+            timestamp = tuple(map(int, splitted[1].split('_')))
+            unixtime = self.unixtime(*timestamp)
+            values = dict.fromkeys(Reading.data_types)
+            for item in splitted[2:]:
+                v_type, v_value = item.split('_')[:2]
+                if v_type not in values or values[v_type] is not None:
+                    return None  # unknown or repeated type
+                value = float(v_value)
+                if not math.isfinite(value):
+                    return None  # nan, inf
+                values[v_type] = value
+        except (ValueError, TypeError, OverflowError):
+            return None
+        return Reading(unixtime, device=self.device, **values)
+
+    def unixtime(self, year, month, day, hour, minute, second):
+        """
+        Convert local time of device to unixtime
+        :return: int, unixtime
+        """
+        if not (0 <= minute < 60 and 0 <= second < 60):
+            raise ValueError("Wrong time of frame")
+        key = (year, month, day, hour)
+        hour_epoch = self._hour_epoch.get(key)
+        if hour_epoch is None:
+            if not (1 <= month <= 12 and 1 <= day <= 31 and 0 <= hour < 24):
+                raise ValueError("Wrong date of frame")
+            if len(self._hour_epoch) >= self.max_cached_hours:
+                self._hour_epoch.clear()
+            hour_epoch = int(time.mktime((year, month, day, hour, 0, 0, 0, 0, -1)))
+            if time.localtime(hour_epoch)[:3] != (year, month, day):  # mktime moves e.g. 2022_2_30 to March 2
+                raise ValueError("Wrong date of frame")
+            self._hour_epoch[key] = hour_epoch
+        return hour_epoch + minute * 60 + second
+
+
+class Framer:
+    """
+    Split stream of bytes from serial port on frames. Bytes are collected in one buffer, frame
+    starts at 'LY,' header and ends at line end. After corruption the stream is resynchronised
+    on the next header: garbage before header is dropped, frame cut by a new header is partial.
+    """
+    header = b'LY,'
+    max_frame_len = 256
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0  # number of complete frames
+        self.dropped = 0  # number of dropped pieces of garbage between frames
+        self.partial = 0  # number of frames without end
+        self._in_garbage = False  # garbage piece is already counted, but its end is not found
+
+    def feed(self, data):
+        """
+        Add bytes to buffer and take complete frames from it
+        :param data: bytes, data read from port
+        :return: list, frames (bytes) without line end
+        """
+        buffer = self.buffer
+        buffer.extend(data)
+        frames = []
+        while buffer:
+            start = buffer.find(self.header)
+            if start == -1:
+                keep = len(self.header) - 1  # tail may be the beginning of header
+                if buffer[:-keep].strip() and not self._in_garbage:
+                    self.dropped += 1
+                    self._in_garbage = True
+                del buffer[:-keep]
+                break
+            if start > 0:
+                if buffer[:start].strip() and not self._in_garbage:
+                    self.dropped += 1
+                del buffer[:start]
+            self._in_garbage = False
+            end = buffer.find(b'\n')
+            next_start = buffer.find(self.header, len(self.header))
+            if next_start != -1 and (end == -1 or next_start < end):
+                self.partial += 1  # frame is cut by the next one
+                del buffer[:next_start]
+                continue
+            if end == -1:
+                if len(buffer) > self.max_frame_len:
+                    self.partial += 1  # line end is lost, skip header and resync
+                    del buffer[:len(self.header)]
+                    continue
+                break  # wait for the rest of frame
+            frames.append(bytes(buffer[:end]).strip())
+            del buffer[:end + 1]
+        self.frames += len(frames)
+        return frames
@@ -0,0 +1,223 @@
+import os
+import selectors
+import threading
+import time
+
+import serial
+from serial.tools import list_ports
+
+import FrameParser
+import Metrics
+import Profiling
+import SharedVars as shv
+
+"""This module provides ingestion of ambient data from many serial devices in one thread"""
+
+
+def available_ports():
+    """
+    Scan system for available COM (virtual COM) ports, may take long time on Windows
+    :return: list with available COM ports
+    """
+    shv.logger.debug("Init scan for COM ports")
+    if os.name == 'nt':
+        # Windows
+        all_ports = []
+        for i in range(256):
+            try:
+                s = serial.Serial(i)
+                all_ports.append('COM' + str(i + 1))
+                s.close()
+            except serial.SerialException:
+                pass
+        return all_ports
+    else:
+        # Mac / Linux
+        return [port[0] for port in list_ports.comports()]
+
+
+class PortReader:
+    """
+    State of one serial device: port, framer and parser of its stream, reconnect backoff and counters.
+    Reader does no blocking calls, all reads are done by IngestManager when port has data.
+    """
+
+    def __init__(self, port):
+        """
+        :param port: str, serial port of device, it is also identifier of device in DB
+        """
+        self.port = port
+        self.ser = None
+        self.parser = FrameParser.FrameParser(device=port)
+        self.framer = FrameParser.Framer()
+        self.invalid = 0  # number of complete frames which are not valid
+        self.reconnects = 0  # number of failed connections
+        self.backoff = shv.serial_reconnect_min
+        self.retry_at = 0  # monotonic time of next connection attempt
+
+    def open(self):
+        self.ser = serial.Serial(self.port, timeout=0)  # non-blocking read
+        self.ser.reset_input_buffer()
+        self.backoff = shv.serial_reconnect_min
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+
+    def schedule_reconnect(self):
+        """
+        Close port and set time of next connection attempt, delay is doubled after each fail
+        :return: int, delay in seconds
+        """
+        self.close()
+        self.reconnects += 1
+        Metrics.serial_reconnects.inc(device=self.port)
+        delay = self.backoff
+        self.retry_at = time.monotonic() + delay
+        self.backoff = min(self.backoff * 2, shv.serial_reconnect_max)
+        return delay
+
+    @Profiling.span('serial_read')
+    def read(self):
+        """
+        Read all available bytes and parse complete frames
+        :return: tuple, list of valid FrameParser.Reading and list of their frames
+        """
+        data = self.ser.read(max(self.ser.in_waiting, 1))
+        readings, frames = [], []
+        dropped = self.framer.dropped + self.framer.partial
+        invalid = self.invalid
+        for frame in self.framer.feed(data):
+            reading = self.parser.parse(frame)
+            if reading is None:
+                self.invalid += 1  # corrupted data, skipping
+                continue
+            readings.append(reading)
+            frames.append(frame)
+        if readings:
+            Metrics.serial_frames.inc(len(readings), device=self.port)
+        if self.invalid > invalid:
+            Metrics.serial_invalid.inc(self.invalid - invalid, device=self.port)
+        if self.framer.dropped + self.framer.partial > dropped:
+            Metrics.serial_dropped.inc(self.framer.dropped + self.framer.partial - dropped, device=self.port)
+        return readings, frames
+
+
+class IngestManager:
+    """
+    Read frames from all serial devices in one thread and feed the shared DB writer. On POSIX
+    ports are multiplexed by selectors, so thread sleeps until any port has data, on Windows
+    ports are polled every serial_read_timeout seconds. Broken port is reconnected with
+    exponential backoff independently from others.
+    """
+
+    def __init__(self, ports, writer, on_reading=None, on_status=None):
+        """
+        :param ports: list, serial ports of devices
+        :param writer: DataWriter.DataWriter, writer of readings into DB
+        :param on_reading: function (FrameParser.Reading) called for each valid frame
+        :param on_status: function (port, message) called when connection status of port is changed
+        """
+        self.readers = [PortReader(port) for port in ports]
+        self.writer = writer
+        self.on_reading = on_reading
+        self.on_status = on_status
+        self.stop_event = threading.Event()
+        self.selector = selectors.DefaultSelector() if os.name == 'posix' else None
+
+    def run(self):
+        """
+        Read devices until stop() is called
+        :return: None
+        """
+        shv.logger.info("Run ingestion of %s serial devices", len(self.readers))
+        self.stop_event.clear()
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                for reader in self.readers:
+                    if reader.ser is None and now >= reader.retry_at:
+                        self.connect(reader)
+                rows = []
+                for reader in self.wait_ready():
+                    try:
+                        readings, frames = reader.read()
+                    except (serial.SerialException, OSError) as var:
+                        self.disconnect(reader, var)
+                        continue
+                    for reading, frame in zip(readings, frames):
+                        shv.logger.debug("Get valid COM data from %s: %s", reader.port, frame)
+                        rows.extend(reading.rows())
+                        if self.on_reading is not None:
+                            self.on_reading(reading)
+                if rows:
+                    self.writer.put(rows)  # committed by writer in group with other readings
+        finally:
+            for reader in self.readers:
+                self.unregister(reader)
+                reader.close()
+            if self.selector is not None:
+                self.selector.close()
+        for reader in self.readers:
+            shv.logger.info(
+                "%s is closed: %s frames, %s invalid, %s partial, %s dropped pieces of data, %s reconnects",
+                reader.port, reader.framer.frames, reader.invalid, reader.framer.partial,
+                reader.framer.dropped, reader.reconnects
+            )
+            self.status(reader.port, 'Serial is closed')
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wait_ready(self):
+        """
+        Wait up to serial_read_timeout for ports with data
+        :return: list, PortReader with available data
+        """
+        connected = [reader for reader in self.readers if reader.ser is not None]
+        if self.selector is not None:
+            if not connected:
+                self.stop_event.wait(shv.serial_read_timeout)
+                return []
+            return [key.data for key, _ in self.selector.select(shv.serial_read_timeout)]
+        ready = []
+        for reader in connected:
+            try:
+                if reader.ser.in_waiting:
+                    ready.append(reader)
+            except (serial.SerialException, OSError) as var:
+                self.disconnect(reader, var)
+        if not ready:
+            self.stop_event.wait(shv.serial_read_timeout)
+        return ready
+
+    def connect(self, reader):
+        try:
+            reader.open()
+            if self.selector is not None:
+                self.selector.register(reader.ser.fileno(), selectors.EVENT_READ, reader)
+        except (serial.SerialException, OSError, ValueError) as var:
+            self.disconnect(reader, var)
+            return
+        self.status(reader.port, 'Serial is connected')
+
+    def disconnect(self, reader, error):
+        self.unregister(reader)
+        delay = reader.schedule_reconnect()
+        shv.logger.error("Serial Exception on %s, reconnect in %s s: %s", reader.port, delay, error)
+        self.status(reader.port, 'Serial is broken, reconnect in {} s'.format(delay))
+
+    def unregister(self, reader):
+        if self.selector is not None and reader.ser is not None:
+            try:
+                self.selector.unregister(reader.ser.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def status(self, port, message):
+        if self.on_status is not None:
+            self.on_status(port, message)
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+import SharedVars as shv
+
+"""This module provides asynchronous logging: threads only put records into queue, formatting and
+writing to file, console and GUI are done by one listener thread"""
+
+log_format = '%(levelname)s, %(asctime)s, (%(module)s - %(funcName)s - %(lineno)d), %(message)s'
+listener = None  # logging.handlers.QueueListener of shv.logger
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler which puts record as is: message is merged with its %-style arguments by
+    listener thread, so logging thread does not format it. Queue is not shared between processes,
+    so record is not pickled, but arguments must not be changed after logging call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def init_logger(log_path, level=logging.DEBUG, console=True, handlers=()):
+    """
+    Initiate shv.logger: records go through unbounded queue to listener thread, which writes them to
+    file rotated by size, console and extra handlers. Queued records are written at exit.
+    :param log_path: str, path to log file
+    :param level: int, logging level
+    :param console: bool, write log to console
+    :param handlers: list, extra logging.Handler instances (e.g. messages for user), called in listener thread
+    :return: logging.handlers.QueueListener
+    """
+    global listener
+    stop_logger()
+    shv.logger = logging.getLogger('main_logger')
+    shv.logger.setLevel(level)
+    for handler in list(shv.logger.handlers):
+        shv.logger.removeHandler(handler)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_path, maxBytes=shv.log_max_bytes, backupCount=shv.log_backup_count, encoding='utf-8'
+    )
+    sinks = [file_handler]
+    if console:
+        sinks.append(logging.StreamHandler())
+    formatter = logging.Formatter(log_format)
+    for handler in sinks:
+        handler.setFormatter(formatter)
+    sinks.extend(handlers)
+    log_queue = queue.SimpleQueue()  # put never blocks
+    listener = logging.handlers.QueueListener(log_queue, *sinks, respect_handler_level=True)
+    listener.start()
+    shv.logger.addHandler(DeferredQueueHandler(log_queue))
+    return listener
+
+
+def stop_logger():
+    """
+    Write queued records and stop listener thread
+    :return: None
+    """
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    listener = None
+
+
+atexit.register(stop_logger)
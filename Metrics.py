@@ -0,0 +1,300 @@
+import bisect
+import http.server
+import threading
+import time
+
+import SharedVars as shv
+
+"""This module provides instrumentation of client: counters, gauges and latency histograms of ingestion,
+DB writes, upload and plots, and local HTTP endpoint with them in Prometheus text format"""
+
+registry = []  # all metrics in order of definition
+
+
+class Metric:
+    """
+    Base of metrics: values are kept for each combination of label values, updates are thread safe
+    """
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        """
+        :param name: str, name of metric
+        :param description: str, help text of metric
+        :param labels: tuple, names of labels
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}  # {tuple of label values: value}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def key(self, label_values):
+        return tuple(str(label_values.get(label, '')) for label in self.labels)
+
+    def value(self, **label_values):
+        """
+        :return: sum of values which have given label values, e.g. over all types for result='error'
+        """
+        selected = [(self.labels.index(label), str(value)) for label, value in label_values.items()]
+        with self.lock:
+            return sum(
+                value for key, value in self.values.items() if all(key[i] == wanted for i, wanted in selected)
+            )
+
+    def snapshot(self):
+        """
+        :return: dict, copy of values {tuple of label values: value}
+        """
+        with self.lock:
+            return dict(self.values)
+
+    def label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(
+            label, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        ) for label, value in pairs) + '}'
+
+    def render(self):
+        """
+        :return: list, lines of metric in Prometheus text format
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} {}'.format(self.name, self.kind)]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append('{}{} {}'.format(self.name, self.label_text(key), format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically growing count of events
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **label_values):
+        key = self.key(label_values)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Current value, e.g. size of backlog
+    """
+    kind = 'gauge'
+
+    def set(self, value, **label_values):
+        key = self.key(label_values)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of durations in seconds: count of observations for each bucket, their number and sum
+    """
+    kind = 'histogram'
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, description, labels=(), buckets=None):
+        """
+        :param buckets: tuple, upper bounds of buckets in seconds
+        """
+        Metric.__init__(self, name, description, labels)
+        self.buckets = tuple(buckets or self.default_buckets)
+
+    def observe(self, value, **label_values):
+        key = self.key(label_values)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]  # buckets, count, sum
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += 1
+            state[2] += value
+
+    def time(self, **label_values):
+        """
+        :return: context manager which observes duration of its block
+        """
+        return Timer(self, label_values)
+
+    def totals(self, **label_values):
+        """
+        :return: tuple, number and sum of observations for label values, over all labels if they are not set
+        """
+        with self.lock:
+            states = [self.values.get(self.key(label_values))] if label_values else list(self.values.values())
+            states = [state for state in states if state is not None]
+            return sum(state[1] for state in states), sum(state[2] for state in states)
+
+    def value(self, **label_values):
+        return self.totals(**label_values)[0]
+
+    def quantile(self, q, **label_values):
+        """
+        Estimate quantile by linear interpolation inside bucket, as histogram_quantile of Prometheus
+        :param q: float, quantile from 0 to 1
+        :return: float, estimated value in seconds, None if there are no observations
+        """
+        with self.lock:
+            states = [self.values.get(self.key(label_values))] if label_values else list(self.values.values())
+            counts = [sum(column) for column in zip(*[state[0] for state in states if state is not None])]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # above the last bound, value is unknown
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} {}'.format(self.name, self.kind)]
+        with self.lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self.values.items())
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, self.label_text(key, [('le', format_value(bound))]), cumulative
+                ))
+            lines.append('{}_sum{} {}'.format(self.name, self.label_text(key), format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, self.label_text(key), count))
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.label_values)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def reset():
+    """
+    Clear values of all metrics, e.g. between benchmark scenarios
+    :return: None
+    """
+    for metric in registry:
+        with metric.lock:
+            metric.values.clear()
+
+
+def render():
+    """
+    :return: str, all metrics in Prometheus text format
+    """
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+# Ingestion of serial devices
+serial_frames = Counter('ambient_serial_frames_total', 'Valid frames read from serial devices', ('device',))
+serial_invalid = Counter('ambient_serial_invalid_frames_total', 'Complete frames which are not valid', ('device',))
+serial_dropped = Counter(
+    'ambient_serial_dropped_total', 'Partial frames and pieces of garbage dropped from serial stream', ('device',)
+)
+serial_reconnects = Counter('ambient_serial_reconnects_total', 'Failed connections to serial devices', ('device',))
+# DB writer
+db_write_seconds = Histogram('ambient_db_write_seconds', 'Duration of DB write transaction of group of readings')
+db_write_readings = Counter('ambient_db_write_readings_total', 'Readings written to DB, duplicates included')
+db_write_errors = Counter('ambient_db_write_errors_total', 'Failed DB write transactions')
+# Upload to backend
+upload_backlog = Gauge('ambient_upload_backlog', 'Readings which are not sent to backend', ('device', 'type'))
+upload_lag = Gauge(
+    'ambient_upload_lag_seconds', 'Age of the last reading acknowledged by backend', ('device', 'type')
+)
+http_request_seconds = Histogram('ambient_http_request_seconds', 'Duration of upload request to backend', ('type',))
+http_requests = Counter('ambient_http_requests_total', 'Upload requests to backend by result', ('type', 'result'))
+# GUI
+query_cache_requests = Counter(
+    'ambient_query_cache_requests_total', 'Plot queries to DB by kind and cache result', ('kind', 'result')
+)
+plot_redraw_seconds = Histogram(
+    'ambient_plot_redraw_seconds', 'Duration of plot redraw', ('mode',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        shv.logger.debug("\tmetrics request: " + format, *args)
+
+
+class MetricsServer(threading.Thread):
+    """
+    Local HTTP endpoint with metrics in Prometheus text format, served at /metrics
+    """
+
+    def __init__(self, host=None, port=None):
+        """
+        :param host: str, address of endpoint
+        :param port: int, TCP port of endpoint, 0 for any free port
+        """
+        threading.Thread.__init__(self, name='metrics', daemon=True)
+        self.server = http.server.ThreadingHTTPServer(
+            (host or shv.metrics_host, port if port is not None else shv.metrics_port), MetricsHandler
+        )
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def run(self):
+        shv.logger.info("Metrics are served at http://%s:%s/metrics", *self.server.server_address[:2])
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_server():
+    """
+    Start metrics endpoint if it is enabled by shv.metrics_port
+    :return: MetricsServer or None if endpoint is disabled or port is busy
+    """
+    if shv.metrics_port is None:
+        return None
+    try:
+        server = MetricsServer()
+    except OSError as exc:
+        shv.logger.error("Metrics endpoint is not started: %r", exc)
+        return None
+    server.start()
+    return server
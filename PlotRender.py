@@ -0,0 +1,145 @@
+import time
+
+from PyQt5 import QtCore
+import matplotlib
+matplotlib.use('Qt5Agg')
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+
+import numpy as np
+import Metrics
+import Profiling
+import SharedVars as shv
+
+"""This module provides matplotlib canvas and scheduler of plots redraw"""
+
+
+class MplCanvas(FigureCanvasQTAgg):
+    """
+    Class for matplotlib canvas with blitting of animated artists: background of full draw
+    is cached and only animated artists are redrawn over it
+    """
+    def __init__(self, parent=None, width=5, height=4, dpi=150):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        self.axes = fig.add_subplot(111)
+        super(MplCanvas, self).__init__(fig)
+        self.animated = []  # artists which are redrawn by blitting
+        self._background = None
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def set_animated(self, artists):
+        """
+        Set artists redrawn by blitting, other artists are part of cached background
+        :param artists: list of matplotlib artists
+        :return: None
+        """
+        for artist in artists:
+            artist.set_animated(True)
+        self.animated = list(artists)
+        self._background = None
+
+    def _on_draw(self, event):
+        # full draw skips animated artists, save background and draw them on top
+        self._background = self.copy_from_bbox(self.figure.bbox)
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    def blit_animated(self):
+        """
+        Redraw only animated artists over cached background
+        :return: bool, False if there is no cached background and full draw is needed
+        """
+        if self._background is None:
+            return False
+        self.restore_region(self._background)
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+        self.blit(self.figure.bbox)
+        return True
+
+    def animated_out_of_view(self):
+        """
+        Check if data of animated artists goes beyond limits of y axis
+        :return: bool, True if axes need rescale
+        """
+        y_min, y_max = self.axes.get_ylim()
+        for artist in self.animated:
+            y_data = np.asarray(artist.get_ydata())
+            if len(y_data) and (y_data.min() < y_min or y_data.max() > y_max):
+                return True
+        return False
+
+
+class RenderScheduler(QtCore.QObject):
+    """
+    Coalesce redraw requests of plots in tabs of QTabWidget: only visible tab is redrawn,
+    not more than max_fps times per second, by blitting if possible. Hidden tabs stay marked
+    and are redrawn when they become visible.
+    """
+
+    def __init__(self, tab_widget, max_fps=None, parent=None):
+        """
+        :param tab_widget: PyQt5.Widgets.QTabWidget, widget with tabs of plots
+        :param max_fps: int, max number of redraws per second
+        :param parent: parent class
+        """
+        QtCore.QObject.__init__(self, parent)
+        self.tab_widget = tab_widget
+        self.pages = {}  # {key: (tab widget, canvas)}
+        self.dirty = {}  # {key: True if full draw is needed, False if blitting is enough}
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(int(1000 / (max_fps or shv.plot_max_fps)))
+        self.timer.timeout.connect(self.flush)
+        self.tab_widget.currentChanged.connect(self._on_tab_changed)
+
+    def register(self, key, widget, canvas):
+        """
+        :param key: str, identifier of plot (sensor data type)
+        :param widget: PyQt5.Widgets.QWidget, tab page with canvas
+        :param canvas: MplCanvas, canvas of plot
+        :return: None
+        """
+        self.pages[key] = (widget, canvas)
+
+    def mark_dirty(self, key, full=False):
+        """
+        Request redraw of plot, it is done at the next frame
+        :param key: str, identifier of plot (sensor data type)
+        :param full: bool, full redraw (axes are changed), otherwise animated artists are blitted
+        :return: None
+        """
+        self.dirty[key] = self.dirty.get(key, False) or full
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """
+        Redraw visible plot if it is marked
+        :return: None
+        """
+        current = self.tab_widget.currentWidget()
+        for key, (widget, canvas) in self.pages.items():
+            if widget is current and key in self.dirty:
+                self._redraw(canvas, self.dirty.pop(key))
+
+    def _on_tab_changed(self, index):
+        widget = self.tab_widget.widget(index)
+        for key, (page, canvas) in self.pages.items():
+            if page is widget and key in self.dirty:
+                del self.dirty[key]
+                self._redraw(canvas, True)  # background of hidden tab is outdated
+
+    @staticmethod
+    @Profiling.span('plot_redraw')
+    def _redraw(canvas, full):
+        start = time.perf_counter()
+        if not full and canvas.animated_out_of_view():
+            canvas.axes.relim()
+            canvas.axes.autoscale_view()
+            full = True
+        if full or not canvas.blit_animated():
+            canvas.draw()
+            full = True
+        Metrics.plot_redraw_seconds.observe(time.perf_counter() - start, mode='full' if full else 'blit')
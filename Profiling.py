@@ -0,0 +1,235 @@
+import functools
+import os
+import sys
+import threading
+import time
+
+import SharedVars as shv
+
+"""This module provides profiling of hot paths in field: named span timers and cProfile capture for
+time window, switched on and off at runtime. When profiling is off, span costs one check of flag."""
+
+enabled = False  # spans are timed
+capture = False  # spans run under cProfile
+listeners = []  # functions called with path of summary file after profiling is stopped
+_lock = threading.Lock()
+_local = threading.local()  # profiler of thread and flag of running profiled span
+_stats = {}  # {span name: [count, total seconds, max seconds]}
+_profilers = []  # cProfile.Profile of each thread in current window
+_active = 0  # number of spans which run under profiler now
+_generation = 0  # number of profiling window, profiler of thread is created for each window
+_started = None  # wall time of profiling start
+_timer = None  # threading.Timer which stops profiling at the end of window
+# Since Python 3.12 only one profiler may be active in process, and it sees all threads:
+# one profiler runs for whole window instead of profilers of spans in each thread
+_shared = sys.version_info >= (3, 12)
+_shared_profiler = None  # cProfile.Profile of window if _shared
+
+
+def span(name):
+    """
+    Decorator of hot function: when profiling is on, time of each call is added to span with the name,
+    and function runs under cProfile of its thread if capture is on
+    :param name: str, name of span
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            return _run_span(name, function, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def _run_span(name, function, args, kwargs):
+    profiler = None
+    start = time.perf_counter()
+    try:
+        if capture and not _shared and not getattr(_local, 'running', False):  # nested spans are in outer one
+            profiler = _enable_thread_profiler()
+        return function(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            _disable_thread_profiler(profiler)
+        elapsed = time.perf_counter() - start
+        with _lock:
+            stat = _stats.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] = max(stat[2], elapsed)
+
+
+def _enable_thread_profiler():
+    """
+    Enable cProfile of current thread, capture is switched off if profiler can't be enabled
+    :return: cProfile.Profile or None if it is not enabled
+    """
+    global _active
+    profiler = _thread_profiler()
+    with _lock:
+        _active += 1
+    _local.running = True
+    try:
+        profiler.enable()
+    except ValueError as exc:  # other profiling tool (debugger, coverage) is active
+        _disable_thread_profiler(None)
+        _stop_capture(exc)
+        return None
+    return profiler
+
+
+def _disable_thread_profiler(profiler):
+    global _active
+    if profiler is not None:
+        profiler.disable()
+    _local.running = False
+    with _lock:
+        _active -= 1
+
+
+def _stop_capture(exc):
+    global capture
+    with _lock:
+        was_captured = capture
+        capture = False
+    if was_captured:
+        shv.logger.warning("cProfile is not captured, spans are only timed: %r", exc)
+
+
+def _thread_profiler():
+    """
+    :return: cProfile.Profile of current thread for current window
+    """
+    import cProfile
+    if getattr(_local, 'generation', None) != _generation:
+        _local.profiler = cProfile.Profile()
+        _local.generation = _generation
+        with _lock:
+            _profilers.append(_local.profiler)
+    return _local.profiler
+
+
+def start(window=None, with_cprofile=None):
+    """
+    Start profiling: statistics of spans are reset, profiling is stopped and dumped after window
+    :param window: float, duration of profiling in seconds, shv.profile_window if None, 0 for no limit
+    :param with_cprofile: bool, capture cProfile of spans, shv.profile_cprofile if None
+    :return: None
+    """
+    global enabled, capture, _generation, _started, _timer, _shared_profiler
+    window = window if window is not None else shv.profile_window
+    with _lock:
+        if enabled:
+            return
+        _stats.clear()
+        del _profilers[:]
+        _generation += 1
+        _started = time.time()
+        capture = with_cprofile if with_cprofile is not None else shv.profile_cprofile
+        enabled = True
+    if capture and _shared:
+        import cProfile
+        _shared_profiler = cProfile.Profile()
+        try:
+            _shared_profiler.enable()
+        except ValueError as exc:
+            _shared_profiler = None
+            _stop_capture(exc)
+        else:
+            _profilers.append(_shared_profiler)
+    if window:
+        _timer = threading.Timer(window, stop)
+        _timer.daemon = True
+        _timer.start()
+    shv.logger.info("Profiling is started for %s s, cProfile %s", window or 'unlimited', 'on' if capture else 'off')
+
+
+def stop():
+    """
+    Stop profiling and write summary of spans and cProfile statistics (pstats file) to shv.profile_dir
+    :return: str, path of summary file, None if profiling was not started
+    """
+    global enabled, capture, _timer, _shared_profiler
+    with _lock:
+        if not enabled:
+            return None
+        enabled = False
+        was_captured = capture
+        capture = False
+    if _shared_profiler is not None:
+        _shared_profiler.disable()
+        _shared_profiler = None
+    if _timer is not None and _timer is not threading.current_thread():
+        _timer.cancel()
+    _timer = None
+    deadline = time.monotonic() + shv.profile_stop_wait
+    while _active and time.monotonic() < deadline:
+        time.sleep(0.01)  # profiler can't be read while its span runs
+    path = dump(was_captured and not _active)
+    shv.logger.info("Profiling is stopped, summary: %s", path)
+    for listener in listeners:
+        listener(path)
+    return path
+
+
+def toggle():
+    """
+    Start profiling if it is off, stop it otherwise
+    :return: str, path of summary file if profiling is stopped, None if started
+    """
+    if enabled:
+        return stop()
+    start()
+    return None
+
+
+def dump(with_cprofile=True):
+    """
+    Write summary of spans and, if captured, merged cProfile statistics of all threads
+    :param with_cprofile: bool, write cProfile statistics
+    :return: str, path of summary file
+    """
+    import pstats
+    os.makedirs(shv.profile_dir, exist_ok=True)
+    stem = os.path.join(shv.profile_dir, 'profile-{}'.format(time.strftime('%Y%m%d-%H%M%S', time.localtime(_started))))
+    with _lock:
+        stats = sorted(_stats.items(), key=lambda item: -item[1][1])
+        profilers = list(_profilers)
+    with open(stem + '.txt', 'w') as summary:
+        summary.write("Profiling from {} for {:.1f} s\n\n".format(
+            time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(_started)), time.time() - _started
+        ))
+        summary.write("{:<24} {:>10} {:>12} {:>10} {:>10}\n".format('span', 'count', 'total s', 'mean ms', 'max ms'))
+        for name, (count, total, longest) in stats:
+            summary.write("{:<24} {:>10} {:>12.3f} {:>10.3f} {:>10.3f}\n".format(
+                name, count, total, total / count * 1000, longest * 1000
+            ))
+        profiled = [profiler for profiler in profilers if profiler.getstats()]
+        if with_cprofile and profiled:
+            merged = pstats.Stats(profiled[0], stream=summary)
+            for profiler in profiled[1:]:
+                merged.add(profiler)
+            merged.dump_stats(stem + '.pstats')
+            summary.write("\ncProfile of {}, all threads: {}.pstats\n".format(
+                'all code' if _shared else 'spans', stem
+            ))
+            merged.sort_stats('cumulative').print_stats(shv.profile_top)
+    return stem + '.txt'
+
+
+def init_from_env():
+    """
+    Start profiling if AMBIENT_PROFILE environment variable is set: number of seconds of window,
+    or any other not empty value for window of shv.profile_window
+    :return: None
+    """
+    value = os.environ.get('AMBIENT_PROFILE', '').strip()
+    if not value or value == '0':
+        return
+    try:
+        window = float(value)
+    except ValueError:
+        window = None
+    start(window)
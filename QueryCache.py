@@ -0,0 +1,191 @@
+import collections
+import threading
+
+import numpy as np
+
+import DataBase
+import Metrics
+import SharedVars as shv
+
+"""This module provides cache of plot queries to client database, kept up to date by DB writer"""
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of last readings and of range (raw or rollup) arrays of sensor data, keyed by
+    query: kind, data type, device, range or limit and number of buckets. DB writer reports committed
+    readings (DataWriter.listeners): entry which ends before new readings of its type and device is
+    extended with them, other entries which cover time of new readings are dropped. Result of query is
+    not cached only if reported readings overlap it while it runs. Writes of other processes (BulkImport,
+    migration) are seen by counter of DB (DataBase.get_data_generation) and drop all entries.
+    """
+
+    def __init__(self, max_entries=None, max_points=None):
+        """
+        :param max_entries: int, max number of cached queries
+        :param max_points: int, max total number of cached points
+        """
+        self.max_entries = max_entries or shv.query_cache_entries
+        self.max_points = max_points or shv.query_cache_points
+        self.entries = collections.OrderedDict()  # {key: data}, the least recently used first
+        self.points = 0
+        self.version = 0  # number of reported writes
+        # the last reported writes [(version, {(type, device): (first unixtime, last unixtime)} or None for all)],
+        # result of query is not cached if overlapping write happens meanwhile
+        self.writes = collections.deque(maxlen=1000)
+        self.generation = None  # DataBase.get_data_generation of the last check
+        self.lock = threading.Lock()
+
+    def get_last_data(self, db_conn, sens_dtype, limit=100, device=None):
+        """
+        Cached DataBase.get_last_data
+        :return: list, structure of tuples with values of unixtime and float value [(unixtime, value), ...]
+        """
+        key = ('last', sens_dtype, device, limit)
+        data = self.lookup(db_conn, key)
+        if data is None:
+            version = self.version
+            data = DataBase.get_last_data(db_conn, sens_dtype, limit=limit, device=device)
+            self.store(key, data, version)
+        return list(data)
+
+    def get_range_arrays(self, db_conn, sens_dtype, unixtime_start, unixtime_stop, n_buckets=None, device=None):
+        """
+        Cached DataBase.get_range_arrays, arrays are shared by all callers and are read only
+        :return: tuple of numpy.ndarray, unixtime (int64) and values (float64)
+        """
+        key = ('range', sens_dtype, device, unixtime_start, unixtime_stop, n_buckets)
+        data = self.lookup(db_conn, key)
+        if data is None:
+            version = self.version
+            data = DataBase.get_range_arrays(
+                db_conn, sens_dtype, unixtime_start, unixtime_stop, n_buckets=n_buckets, device=device
+            )
+            for array in data:
+                array.flags.writeable = False
+            self.store(key, data, version)
+        return data
+
+    def lookup(self, db_conn, key):
+        """
+        :param db_conn: sqlite3.Connection, connection of query, DB is checked for writes of other processes
+        :param key: tuple, key of query
+        :return: cached result of query, None if it is not cached
+        """
+        generation = DataBase.get_data_generation(db_conn)
+        if generation is not None and generation != self.generation:
+            if self.generation is not None:
+                shv.logger.debug("\tDB is changed by other process, plot cache is cleared")
+                self.clear()
+            self.generation = generation
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+        Metrics.query_cache_requests.inc(kind=key[0], result='miss' if data is None else 'hit')
+        return data
+
+    def store(self, key, data, version):
+        """
+        Cache result of query if no overlapping write was reported since query start, evict the least
+        recently used entries over limits
+        :param key: tuple, key of query
+        :param data: result of query
+        :param version: int, self.version before query
+        :return: None
+        """
+        with self.lock:
+            if version != self.version:
+                if not self.writes or self.writes[0][0] > version + 1:  # writes since query start are not kept
+                    return
+                if any(self.overlaps(key, bounds) for write_version, bounds in self.writes if write_version > version):
+                    return
+            self.drop(key)
+            self.entries[key] = data
+            self.points += self.size(data)
+            while self.entries and (len(self.entries) > self.max_entries or self.points > self.max_points):
+                self.drop(next(iter(self.entries)))
+
+    def drop(self, key):
+        data = self.entries.pop(key, None)
+        if data is not None:
+            self.points -= self.size(data)
+
+    @staticmethod
+    def overlaps(key, bounds):
+        """
+        :param key: tuple, key of query
+        :param bounds: dict, time bounds of written readings {(type, device): (first, last)}, None for all data
+        :return: bool, True if written readings may change result of query
+        """
+        if bounds is None:
+            return True
+        kind, sens_dtype, device = key[:3]
+        return any(
+            new_dtype == sens_dtype and device in (None, new_device) and (
+                kind == 'last' or (first <= key[4] and last >= key[3])
+            )
+            for (new_dtype, new_device), (first, last) in bounds.items()
+        )
+
+    @staticmethod
+    def size(data):
+        return len(data[0]) if isinstance(data, tuple) else len(data)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.points = 0
+            self.version += 1
+            self.writes.append((self.version, None))
+
+    def on_insert(self, rows):
+        """
+        Update cache for readings committed to DB, called by DB writer thread
+        :param rows: list, structure of tuples with unixtime, data type, value and device
+            [(unixtime, type, value, device), ...]
+        :return: None
+        """
+        new = {}  # {(type, device): {unixtime: value}}, duplicates in group are merged
+        for unixtime, sens_dtype, value, device in rows:
+            new.setdefault((sens_dtype, device), {})[unixtime] = value
+        with self.lock:
+            self.version += 1
+            self.writes.append((self.version, {
+                key: (min(values), max(values)) for key, values in new.items()
+            }))
+            for key in list(self.entries):
+                kind, sens_dtype, device = key[:3]
+                readings = sorted(
+                    item for (new_dtype, new_device), values in new.items()
+                    if new_dtype == sens_dtype and device in (None, new_device) for item in values.items()
+                )
+                if kind == 'range':
+                    readings = [item for item in readings if key[3] <= item[0] <= key[4]]
+                if not readings:
+                    continue
+                data = self.entries[key]
+                if kind == 'last':
+                    is_newer = not data or readings[0][0] > data[-1][0]
+                    extended = (data + readings)[-key[3]:] if is_newer else None
+                else:
+                    is_raw = DataBase.choose_resolution(key[3], key[4], key[5]) is None if key[5] else True
+                    is_newer = not len(data[0]) or readings[0][0] > data[0][-1]
+                    extended = self.extend_arrays(data, readings) if is_raw and is_newer else None
+                self.drop(key)
+                if extended is not None:
+                    self.entries[key] = extended
+                    self.points += self.size(extended)
+            while self.entries and self.points > self.max_points:
+                self.drop(next(iter(self.entries)))
+
+    @staticmethod
+    def extend_arrays(data, readings):
+        unixtime, values = zip(*readings)
+        extended = (
+            np.concatenate([data[0], np.array(unixtime, dtype=np.int64)]),
+            np.concatenate([data[1], np.array(values, dtype=np.float64)])
+        )
+        for array in extended:
+            array.flags.writeable = False
+        return extended
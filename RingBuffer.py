@@ -0,0 +1,79 @@
+import numpy as np
+
+"""This module provides fixed-size ring buffer for data series"""
+
+
+class RingBuffer:
+    """
+    Array-backed ring buffer with O(1) append. Every value is written twice, at position i and
+    i + capacity of double-length array, so last capacity values are always a contiguous slice
+    and view() returns them without copy, oldest first.
+    """
+
+    def __init__(self, capacity, width=None, dtype=np.float64, fill=0):
+        """
+        :param capacity: int, max number of stored values (rows)
+        :param width: int, number of columns in row, None for 1-dimensional buffer of scalars
+        :param dtype: numpy dtype of values
+        :param fill: value for not filled part of buffer
+        """
+        self.capacity = capacity
+        shape = (2 * capacity,) if width is None else (2 * capacity, width)
+        self._data = np.full(shape, fill, dtype=dtype)
+        self._next = 0  # position for next write
+        self._size = 0  # number of written values, up to capacity
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        """
+        Add value (row) to buffer, the oldest one is overwritten when buffer is full
+        :param value: scalar or row of values
+        :return: None
+        """
+        self._data[self._next] = value
+        self._data[self._next + self.capacity] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, values):
+        """
+        Add values (rows) to buffer, oldest first
+        :param values: iterable of scalars or rows
+        :return: None
+        """
+        values = np.asarray(values, dtype=self._data.dtype)[-self.capacity:]
+        if not len(values):
+            return
+        positions = (self._next + np.arange(len(values))) % self.capacity
+        self._data[positions] = values
+        self._data[positions + self.capacity] = values
+        self._next = (self._next + len(values)) % self.capacity
+        self._size = min(self._size + len(values), self.capacity)
+
+    def view(self):
+        """
+        All capacity values, not filled part at the start, the newest value last
+        :return: numpy.ndarray, view of buffer memory
+        """
+        return self._data[self._next:self._next + self.capacity]
+
+    def last(self, n=None):
+        """
+        Last written values, oldest first
+        :param n: int, number of values, all written values if None
+        :return: numpy.ndarray, view of buffer memory
+        """
+        n = self._size if n is None else min(n, self._size)
+        return self.view()[self.capacity - n:]
+
+    def newest(self, i=0):
+        """
+        Value (row) written i steps before the last one
+        :param i: int, 0 for the newest value
+        :return: scalar or numpy.ndarray row
+        """
+        if not 0 <= i < self._size:
+            raise IndexError("RingBuffer index out of range")
+        return self._data[self._next + self.capacity - 1 - i]
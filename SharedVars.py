@@ -1,10 +1,81 @@
 logger = None  # logger instance
 all_dtype = ['CO2', 'T', 'R', 'P']
-all_headers = [[], []]
-all_table_data = []
 all_units = {
     'CO2': 'ppm',
     'T': 'C',
     'R': '%',
     'P': 'mm.Hg'
 }
+# Upload batching: a batch of one data type is sent when it holds send_batch_size readings
+# or when its oldest reading waits longer than send_batch_age seconds
+send_batch_size = 500
+send_batch_age = 60
+send_step = 1  # seconds between readings in one batch, backend takes time of value i as start_ts + i * send_step
+send_steps = {}  # step of devices with other cadence {serial port: seconds}, send_step for not listed devices
+send_step_tolerance = 1  # seconds, max shift of reading from its backend time in batch (jitter of serial timestamps)
+send_max_in_flight = 4  # number of simultaneous upload requests to backend
+send_timeout = 30  # seconds, max waiting time of backend response, also bounds time of uploader stop
+back_url = 'http://192.168.0.15:9000/ambient-data/'
+back_device_id = '00000000-0000-0000-0000-000000000000'
+back_device_ids = {}  # backend id of each device {serial port: id}, back_device_id for not listed devices
+db_chunk_size = 5000  # number of rows fetched from DB cursor at once
+decimation_method = 'minmax'  # downsampling of long plots: 'minmax' or 'lttb'
+plot_points_per_pixel = 2  # target number of plotted points per pixel of canvas width
+plot_coarse_buckets = 100  # time buckets of coarse plot of long range, shown while detailed data are loaded
+plot_zoom_delay = 300  # ms after the last zoom or pan of datetime plot before load of visible range
+plot_zoom_margin = 0.5  # part of visible range loaded on each side of zoomed plot, for pan without load
+realtime_window_len = 50  # number of last readings on realtime plot
+plot_max_fps = 10  # max number of plot redraws per second
+table_capacity = 1000  # number of live rows in table of COM data
+table_page_size = 100  # number of older rows loaded from DB when table is scrolled to the end
+table_max_paged = 10000  # max number of older rows loaded from DB
+# DB writer: readings are committed in groups, every db_flush_interval seconds or by db_flush_size readings,
+# db_synchronous is SQLite durability level: 'OFF', 'NORMAL' (WAL: may lose last commits on power loss), 'FULL'
+db_flush_interval = 1.0
+db_flush_size = 2000
+db_synchronous = 'NORMAL'
+db_busy_timeout = 30  # seconds to wait for lock of DB
+# readings of group not written because DB is locked are kept and retried every db_flush_interval,
+# they are lost if DB is not writable for db_retry_age seconds or more than db_retry_readings are kept
+db_retry_age = 600
+db_retry_readings = 500000
+# Layout of new DB: 'wide' (one row per frame) or 'narrow' (one row per value), existing narrow DB
+# is converted by: python DataBase.py --db test.db migrate-wide
+db_layout = 'wide'
+db_migrate_batch = 50000  # number of narrow rows copied in one transaction of migration
+serial_read_timeout = 0.1  # seconds, max waiting time of serial read
+serial_reconnect_min = 1  # seconds, first delay of reconnect to broken serial port, doubled after each fail
+serial_reconnect_max = 60  # seconds, max delay of reconnect
+# Archive: frames older than archive_after_days (None: never) are moved from DB to compressed segment
+# files, one per device and period ('day' or 'month'), checked every archive_interval seconds.
+# Segments are in archive_dir, '<DB name>-archive' directory near DB file if None
+archive_after_days = 90
+archive_period = 'day'
+archive_interval = 3600
+archive_dir = None
+archive_block_rows = 65536  # number of rows in one compressed block of segment
+# Bulk import of device logs (BulkImport.py): files are parsed by pieces of import_chunk_bytes in
+# import_workers processes (None: number of CPUs), readings are written by import_batch_size in one transaction
+import_chunk_bytes = 4 * 1024 * 1024
+import_workers = None
+import_batch_size = 200000
+# Cache of plot queries to DB (QueryCache.py): at most query_cache_entries results with query_cache_points
+# points in total, the least recently used are dropped
+query_cache_entries = 64
+query_cache_points = 2000000
+# Log file is rotated when it reaches log_max_bytes, log_backup_count old files are kept.
+# Warnings are shown to user at most once per log_warning_interval seconds, others are only logged
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+log_warning_interval = 5
+# Local HTTP endpoint with metrics of client in Prometheus text format (None: disabled)
+metrics_host = '127.0.0.1'
+metrics_port = 9108
+# Profiling (menu "Profiling", SIGUSR1 of daemon or AMBIENT_PROFILE=<seconds> environment variable): span timers
+# of hot paths and cProfile (if profile_cprofile) for profile_window seconds (0: until stopped), summary and
+# pstats files are written to profile_dir with profile_top functions in summary
+profile_window = 60
+profile_cprofile = True
+profile_dir = 'profiles'
+profile_top = 40
+profile_stop_wait = 5  # seconds to wait for running spans when profiling is stopped
@@ -1,88 +1,120 @@
 # -*- coding: utf-8 -*-
 
-from PyQt5 import QtGui, QtCore, QtWidgets
+from PyQt5 import QtCore
+import collections
+import datetime
+import numpy as np
+import RingBuffer
 
 
-class MyTableModel(QtCore.QAbstractTableModel):
-    # class for tables model
+class LiveTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model for live data, the newest row first. Last capacity rows are kept in ring buffer,
+    the oldest of them is evicted when new row comes. Older rows are paged from DB when the user
+    scrolls to the end of table.
+    """
 
-    def __init__(self, datain=[[]], headerdata=[], parent=None, *args):
+    def __init__(self, columns, headers, capacity, fetch_older=None, page_size=100, max_paged=10000, parent=None):
         """
-        :param datain: a list of lists with data
-        :param headerdata: a two list in list with headers data
+        :param columns: list, identifiers of columns (sensor data types)
+        :param headers: list, horizontal headers for columns
+        :param capacity: int, max number of live rows
+        :param fetch_older: function (before_unixtime, limit) -> [(unixtime, value, ...), ...] newest first
+        :param page_size: int, number of rows loaded by one fetch
+        :param max_paged: int, max number of rows loaded from DB
         :param parent: parent class
-        :param args: None
         """
-        QtCore.QAbstractTableModel.__init__(self, parent, *args)
-        self.arraydata = datain
-        self.headerdata = headerdata
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.columns = columns
+        self.headers = headers
+        self.live = RingBuffer.RingBuffer(capacity, width=len(columns) + 1, fill=np.nan)  # rows: unixtime, values
+        self.older = collections.deque()  # rows paged from DB, newest first, shown after live rows
+        self.fetch_older = fetch_older
+        self.page_size = page_size
+        self.max_paged = max_paged
+        self.is_db_exhausted = fetch_older is None
+        self._hidden = 0  # live rows which are already removed from view but not from ring buffer
 
-    def rowCount(self, parent):
-        return len(self.arraydata)
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.live) - self._hidden + len(self.older)
 
-    def columnCount(self, parent):
-        return len(self.arraydata[0])
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.columns)
 
-    def flags(self, index):
-        return QtCore.Qt.ItemIsEditable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
-
-    def data(self, index, role):
-        if role == QtCore.Qt.EditRole:
-            row = index.row()
-            column = index.column()
-            return self.arraydata[row][column]
-
-        if role == QtCore.Qt.ToolTipRole:
-            # row = index.row()
-            # column = index.column()
-            return 'data for peak'
+    def row(self, position):
+        """
+        :param position: int, row number, 0 for the newest row
+        :return: sequence of unixtime and values
+        """
+        if position < len(self.live) - self._hidden:
+            return self.live.newest(position)
+        return self.older[position - len(self.live) + self._hidden]
 
-        if role == QtCore.Qt.DisplayRole:
-            row = index.row()
-            column = index.column()
-            value = self.arraydata[row][column]
-            return value
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and index.isValid():
+            value = self.row(index.row())[index.column() + 1]
+            if value is None or value != value:  # no data or NaN
+                return ''
+            return '{:g}'.format(value)
 
-    def setData(self, index, value, role=QtCore.Qt.EditRole):
-        if role == QtCore.Qt.EditRole:
-            row = index.row()
-            column = index.column()
-            if value.isValid():
-                # May be use try, IndexError exept if None value
-                value = value.toPyObject()
-                self.arraydata[row][column] = value
-                self.dataChanged.emit(index, index)
-                return True
-        return False
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.headers[section] if section < len(self.headers) else None
+        if section < self.rowCount():
+            unixtime = int(self.row(section)[0])
+            return datetime.datetime.fromtimestamp(unixtime).strftime('%d.%m.%Y %H:%M:%S')
+        return None
 
-    def headerData(self, section, orientation, role):
-        if role == QtCore.Qt.DisplayRole:
-            if orientation == QtCore.Qt.Horizontal:
-                if section < len(self.headerdata[0]):
-                    return self.headerdata[0][section]
-                else:
-                    return 'not implemented'
-                # return QtCore.QString(self.headerdata[0].column())
+    def append_row(self, unixtime, values):
+        """
+        Add the newest row on top of table, the oldest row is evicted if table is full
+        :param unixtime: int, time of data
+        :param values: list, values for columns, None for missing value
+        :return: None
+        """
+        row = [unixtime] + [np.nan if value is None else value for value in values]
+        keep_evicted = False
+        if len(self.live) == self.live.capacity:
+            # remove the last row of table, it is the last paged row or the oldest live row
+            last = self.rowCount() - 1
+            self.beginRemoveRows(QtCore.QModelIndex(), last, last)
+            if self.older:
+                self.older.pop()
+                keep_evicted = True  # the oldest live row moves to paged rows
             else:
-                if section < len(self.headerdata[1]):
-                    return self.headerdata[1][section]
-                else:
-                    return 'not implemented'
-                # return QtCore.QString(self.headerdata[1].column())
-
-    def insertRow(self, position, rows, parent=QtCore.QModelIndex()):
-        self.beginInsertRows(parent, position, position + rows - 1)
-        for i in range(rows):
-            default_values = '0'
-            self.arraydata.insert(position, default_values)
+                self._hidden = 1
+            self.endRemoveRows()
+        self.beginInsertRows(QtCore.QModelIndex(), 0, 0)
+        if keep_evicted:
+            self.older.appendleft(tuple(self.live.newest(self.live.capacity - 1)))
+        self.live.append(row)
+        self._hidden = 0
         self.endInsertRows()
-        return True
 
-    def insertColumns(self, position, columns, parent=QtCore.QModelIndex()):
-        self.beginInsertColumns(parent, position, position + columns - 1)
-        row_count = len(self.arraydata)
-        for i in range(columns):
-            for j in range(row_count):
-                self.arraydata[j].insert(position, '0')
-        self.endInsertColumns()
-        return True
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self.is_db_exhausted and len(self.older) < self.max_paged
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.fetch_older is None:
+            return
+        count = self.rowCount()
+        if count:
+            before = int(self.row(count - 1)[0])
+        else:
+            before = 2 ** 62  # empty table, load the newest rows
+        rows = self.fetch_older(before, self.page_size)
+        if len(rows) < self.page_size:
+            self.is_db_exhausted = True
+        if not rows:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), count, count + len(rows) - 1)
+        self.older.extend(rows)
+        self.endInsertRows()
@@ -1,79 +1,43 @@
-from PyQt5 import QtCore, QtWidgets
-import serial
-import time
-import sqlite3
-import datetime
+from PyQt5 import QtCore
+import IngestManager
 import SharedVars as shv
 
 
+class PortScanThread (QtCore.QThread):
+    # Class for scan of COM ports without blocking of GUI
+    ports_found = QtCore.pyqtSignal(list)  # available COM ports
+
+    def run(self):
+        self.ports_found.emit(IngestManager.available_ports())
+
+
 class COMStartThread (QtCore.QThread):
-    # Class for get ambient data
-    ser = None  # serial device
-    my_signal = QtCore.pyqtSignal()  # QtCore.pyqtSignal()
-    count_ard_reboot = 0
-    SER_UPDATE_SIGNAL = QtCore.pyqtSignal('QString')
+    # Class for get ambient data from serial devices
+    my_signal = QtCore.pyqtSignal(str, str)  # serial port and status of its connection
+    SER_UPDATE_SIGNAL = QtCore.pyqtSignal(object)  # FrameParser.Reading
     is_start = False
 
-    def __init__(self, device_com, db_path, parent=None):
+    def __init__(self, device_coms, writer, parent=None):
+        """
+        :param device_coms: list, serial ports of devices
+        :param writer: DataWriter.DataWriter, writer of readings into DB
+        :param parent: parent class
+        """
         QtCore.QThread.__init__(self, parent)
-        self.device_com = device_com
+        self.device_coms = device_coms
         self.is_start = True
-        self.db_path = db_path
-        self.db_conn = None
+        self.manager = IngestManager.IngestManager(
+            device_coms,
+            writer,
+            on_reading=self.SER_UPDATE_SIGNAL.emit,
+            on_status=self.my_signal.emit
+        )
 
     def run(self):
-        shv.logger.info("Run thread for COM device")
-        self.db_conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        try:
-            self.ser = serial.Serial(self.device_com)
-            self.ser.flushInput()
-            self.ser.flushOutput()
-            while self.is_start:
-                line = self.ser.readline().strip()
-                self.insert_data(line)
-        except serial.SerialException as var:
-            shv.logger.error("Serial Exception, thread is stopped: {}".format(var))
-            self.is_start = False
-            self.my_signal.emit('Serial is broken')
-
-    def insert_data(self, line):
-        """
-        Parse COM data and insert them into db
-        :param line: str, line with COM data
-        :return: None
-        """
-        # TODO: split on 2 funct: split string (use tests) and insert
-        try:
-            splitted = line.decode('utf-8').split(',')
-        except UnicodeDecodeError as e:
-            shv.logger.warning("UnicodeDecodeError {}".format(e))
-            return
-        if len(splitted) != 6 or not splitted[0] == 'LY':
-            return  # partial data, skipping
-        shv.logger.info("Get valid COM data: {}".format(line))
-        splitted = splitted[1:]  # drop data start symbols
-        timestamp = list(map(int, splitted[0].split('_')))
-        unixtime = int(time.mktime(datetime.datetime(*timestamp).timetuple()))
-
-        cursor = self.db_conn.cursor()
-        for i in range(1, 5):
-            v_splitted = splitted[i].split('_')
-            v_type = v_splitted[0]
-            v_value = float(v_splitted[1])
-            shv.logger.debug("\tget type:value COM data: {}: {}".format(v_type, v_value))
-            cursor.execute(
-                """
-                INSERT INTO ambient_data (
-                    unixtime,
-                    type,
-                    value
-                ) VALUES (?, ?, ?)
-                """, (unixtime, v_type, v_value))
-        self.db_conn.commit()
-        shv.logger.info("Write data, sent signal {}".format(line))
-        # Sent signal 2022_5_7_13_51_31,T_27.61_C,R_27_%,P_754_mm,CO2_408_ppm
-        self.SER_UPDATE_SIGNAL.emit(','.join(splitted))
+        shv.logger.info("Run thread for COM devices")
+        self.manager.run()
 
     def quit(self):
         shv.logger.info("Thread is stopped")
         self.is_start = False
+        self.manager.stop()
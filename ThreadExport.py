@@ -0,0 +1,59 @@
+from PyQt5 import QtCore
+import DataBase
+import Export
+import SharedVars as shv
+
+
+class ExportThread (QtCore.QThread):
+    # Class for export of ambient data into file
+    progress_signal = QtCore.pyqtSignal(int)  # percent of exported time range
+    finish_signal = QtCore.pyqtSignal(str)  # result of export for user
+    is_cancelled = False
+
+    def __init__(self, db_path, path, dtypes, unixtime_start, unixtime_stop, devices, parent=None):
+        """
+        :param db_path: str, path to SQLite database
+        :param path: str, path of output file, format is taken from extension (.csv or .seg)
+        :param dtypes: list, exported data types
+        :param unixtime_start: int, start of time range
+        :param unixtime_stop: int, end of time range
+        :param devices: list, identifiers of exported devices
+        :param parent: parent class
+        """
+        QtCore.QThread.__init__(self, parent)
+        self.db_path = db_path
+        self.path = path
+        self.dtypes = dtypes
+        self.unixtime_start = unixtime_start
+        self.unixtime_stop = unixtime_stop
+        self.devices = devices
+        self._percent = -1
+
+    def run(self):
+        shv.logger.info("Run thread for export of data into %s", self.path)
+        db_conn = DataBase.connect(self.db_path)
+        try:
+            rows = Export.export_data(
+                db_conn, self.path, self.dtypes, self.unixtime_start, self.unixtime_stop, self.devices,
+                progress=self.report_progress,
+                is_cancelled=lambda: self.is_cancelled
+            )
+        except Export.ExportCancelled:
+            self.finish_signal.emit("Export is cancelled")
+        except Exception as exc:  # finish signal closes progress dialog, it must be sent anyway
+            shv.logger.error("Data are not exported: %r", exc)
+            self.finish_signal.emit("Export is failed")
+        else:
+            self.finish_signal.emit("Exported {} rows into {}".format(rows, self.path))
+        finally:
+            db_conn.close()
+
+    def report_progress(self, fraction):
+        percent = int(fraction * 100)
+        if percent != self._percent:  # signal only on change, not for each chunk
+            self._percent = percent
+            self.progress_signal.emit(percent)
+
+    def quit(self):
+        shv.logger.info("Export is stopped")
+        self.is_cancelled = True
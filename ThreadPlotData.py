@@ -0,0 +1,86 @@
+import sqlite3
+from PyQt5 import QtCore
+import DataBase
+import Decimation
+import Profiling
+import SharedVars as shv
+
+
+class PlotDataThread (QtCore.QThread):
+    # Class for loading of historical data for plots: coarse view of all types first, then refined ones
+    data_signal = QtCore.pyqtSignal(int, str, object, object, bool)  # request, type, unixtime, values, is final
+    finish_signal = QtCore.pyqtSignal(int)  # request
+    is_cancelled = False
+
+    def __init__(self, request, db_path, query_cache, dtypes, unixtime_start, unixtime_stop, n_out, device,
+                 parent=None):
+        """
+        :param request: int, number of load request, it is sent back with data to drop results of old requests
+        :param db_path: str, path to SQLite database
+        :param query_cache: QueryCache.QueryCache, cache of plot queries
+        :param dtypes: list, data types to load, the first ones are loaded first
+        :param unixtime_start: int, start of time range
+        :param unixtime_stop: int, end of time range
+        :param n_out: int, number of points which plot can display
+        :param device: str, identifier of device, None for all devices
+        :param parent: parent class
+        """
+        QtCore.QThread.__init__(self, parent)
+        self.request = request
+        self.db_path = db_path
+        self.query_cache = query_cache
+        self.dtypes = dtypes
+        self.unixtime_start = unixtime_start
+        self.unixtime_stop = unixtime_stop
+        self.n_out = n_out
+        self.device = device
+        self.db_conn = None
+
+    def run(self):
+        shv.logger.debug("\tload plot data of %s from %s to %s", self.dtypes, self.unixtime_start, self.unixtime_stop)
+        try:
+            self.db_conn = DataBase.connect(self.db_path)
+            n_buckets = self.n_out // 2
+            coarse = DataBase.choose_resolution(self.unixtime_start, self.unixtime_stop, shv.plot_coarse_buckets)
+            if coarse is not None and coarse != DataBase.choose_resolution(
+                    self.unixtime_start, self.unixtime_stop, n_buckets
+            ):  # long range: rollup with a few buckets is shown while detailed data are read
+                for sens_dtype in self.dtypes:
+                    self.load(sens_dtype, shv.plot_coarse_buckets, is_final=False)
+            for sens_dtype in self.dtypes:
+                self.load(sens_dtype, n_buckets, is_final=True)
+        except Exception as exc:  # finish signal ends loading state of plot, it must be sent anyway
+            if not (self.is_cancelled and isinstance(exc, sqlite3.OperationalError)):  # cancelled query is interrupted
+                shv.logger.error("Plot data are not loaded: %r", exc)
+        finally:
+            if self.db_conn is not None:
+                self.db_conn.close()
+            if self.is_cancelled:
+                shv.logger.debug("\tload of plot data %s is cancelled", self.request)
+            self.finish_signal.emit(self.request)
+
+    @Profiling.span('plot_load')
+    def load(self, sens_dtype, n_buckets, is_final):
+        """
+        Read data of type in time range, decimate them to plot size and send them to GUI
+        :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+        :param n_buckets: int, number of time buckets, rollup is used if it has enough buckets
+        :param is_final: bool, data are final for the range, otherwise coarse ones
+        :return: None
+        """
+        if self.is_cancelled:
+            return
+        data_x, data_y = self.query_cache.get_range_arrays(
+            self.db_conn, sens_dtype, self.unixtime_start, self.unixtime_stop, n_buckets=n_buckets,
+            device=self.device
+        )  # rollup is used if range is long
+        data_x, data_y = Decimation.decimate(data_x, data_y, self.n_out)  # keep plot size bounded
+        if not self.is_cancelled:
+            self.data_signal.emit(self.request, sens_dtype, data_x, data_y, is_final)
+
+    def quit(self):
+        self.is_cancelled = True
+        try:
+            self.db_conn.interrupt()  # running query stops with OperationalError
+        except (AttributeError, sqlite3.ProgrammingError):  # not connected yet or already closed
+            pass
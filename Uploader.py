@@ -0,0 +1,213 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import DataBase
+import Metrics
+import Profiling
+import SharedVars as shv
+
+"""This module provides engine for upload ambient data from client database to backend server"""
+
+
+class Uploader:
+    """
+    Drain not sent readings to backend with pool of workers over keep-alive connections.
+    Backlog of each device and data type is split on consecutive time ranges without gaps (batches), all
+    batches are sent in parallel and send_status cursor of device and type is moved to the end
+    of the last batch of acknowledged prefix, so failed batch and all batches after it are resent.
+    """
+    shifr = {
+        'CO2': 'co2',
+        'P': 'air_pressure',
+        'R': 'humidity',
+        'T': 'temperature'
+    }
+
+    def __init__(self, db_path, back_url=None, max_in_flight=None, batch_size=None, batch_age=None):
+        """
+        :param db_path: str, path to SQLite database
+        :param back_url: str, url of backend ambient data endpoint
+        :param max_in_flight: int, number of simultaneous requests to backend
+        :param batch_size: int, max number of readings of one type in single request
+        :param batch_age: int, max waiting time (seconds) of oldest reading before partial batch is sent
+        """
+        self.db_path = db_path
+        self.back_url = back_url or shv.back_url
+        self.max_in_flight = max_in_flight or shv.send_max_in_flight
+        self.batch_size = batch_size or shv.send_batch_size
+        self.batch_age = batch_age if batch_age is not None else shv.send_batch_age
+        self.db_conn = None
+        self.last_send = {}
+        self.split_warned = set()  # devices and data types which got warning about split batches
+        self.stop_event = threading.Event()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='uploader')
+
+    def run(self):
+        """
+        Send data until stop() is called, wait for new data if backlog is drained. Failed round (e.g. DB
+        is locked by other writer) is retried after the same wait. Uploader runs once, stop() before run()
+        is not lost.
+        :return: None
+        """
+        self.db_conn = DataBase.connect(self.db_path)
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    is_sent = self.send_backlog()
+                except Exception as exc:
+                    self.db_conn.rollback()
+                    shv.logger.error("Upload round is failed: %r", exc)
+                    is_sent = False
+                if not is_sent:
+                    self.stop_event.wait(5)
+        finally:
+            self.db_conn.close()
+            self.db_conn = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        """
+        Release workers and pooled connections
+        :return: None
+        """
+        self.stop()
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    @Profiling.span('send_backlog')
+    def send_backlog(self):
+        """
+        Send one round of batches for all devices and data types
+        :return: bool, True if any batch was acknowledged
+        """
+        futures = {}
+        for device in DataBase.get_devices(self.db_conn):
+            for dtype in shv.all_dtype:
+                batches = self.plan_batches(device, dtype)
+                futures[(device, dtype)] = [
+                    (batch[-1][0], self.executor.submit(self.post_batch, device, dtype, batch))
+                    for batch in batches
+                ]
+
+        seen_data = False
+        cursor = self.db_conn.cursor()
+        for (device, dtype), sent in futures.items():
+            results = [(last_unixtime, future.result()) for last_unixtime, future in sent]
+            acknowledged = None
+            for last_unixtime, is_sent in results:  # move cursor over acknowledged prefix only
+                if not is_sent:
+                    break  # rest of batches will be resent in next round
+                acknowledged = last_unixtime
+            if acknowledged is None:
+                continue
+            cursor.execute(
+                """
+                insert or replace into send_status (unixtime, type, device) values (?, ?, ?)
+                """,
+                (acknowledged, dtype, device)
+            )
+            self.last_send[(device, dtype)] = acknowledged
+            seen_data = True
+        self.db_conn.commit()
+        self.update_metrics(futures)
+        return seen_data
+
+    def update_metrics(self, keys):
+        """
+        Set backlog and lag of upload for devices and data types
+        :param keys: iterable, tuples of device and data type
+        :return: None
+        """
+        now = time.time()
+        for device, dtype in keys:
+            last_send = self.last_send.get((device, dtype), 0)
+            Metrics.upload_backlog.set(
+                DataBase.count_after(self.db_conn, dtype, last_send, device=device), device=device, type=dtype
+            )
+            if last_send:
+                Metrics.upload_lag.set(now - last_send, device=device, type=dtype)
+
+    def plan_batches(self, device, dtype):
+        """
+        Split not sent readings of device and data type on consecutive batches. Backend takes time of value i
+        in batch as start_ts + i * step of device (shv.send_steps), so new batch is started where reading is
+        more than shv.send_step_tolerance from that time: at gap in readings (reconnect, device outage).
+        Readings of device with other cadence than its step are sent one per batch, warning is logged then.
+        :param device: str, identifier of device (serial port)
+        :param dtype: str, identifier for type of sensor data (CO2, T, R, P)
+        :return: list, batches of [(unixtime, value), ...] ordered by time
+        """
+        cursor = self.db_conn.cursor()
+        cursor.execute(
+            """
+            select unixtime from send_status where device = ? and type = ?
+            """,
+            (device, dtype)
+        )
+        res = cursor.fetchall()
+        if res:
+            self.last_send[(device, dtype)] = res[0][0]
+
+        res = DataBase.get_data_after(
+            self.db_conn, dtype, self.last_send.get((device, dtype), 0), self.batch_size * self.max_in_flight,
+            device=device
+        )
+        step = shv.send_steps.get(device, shv.send_step)
+        batches = []
+        for unixtime, value in res:  # backend gets only time of the first value, batch has no gaps
+            batch = batches[-1] if batches else None
+            if (
+                    batch and len(batch) < self.batch_size
+                    and abs(unixtime - (batch[0][0] + len(batch) * step)) <= shv.send_step_tolerance
+            ):
+                batch.append((unixtime, value))
+            else:
+                batches.append([(unixtime, value)])
+        if len(res) >= 10 and len(batches) > len(res) // 2 and (device, dtype) not in self.split_warned:
+            self.split_warned.add((device, dtype))
+            shv.logger.warning(
+                "Readings of %s data of %s are not %s s apart, %s readings are split on %s batches: "
+                "set step of device in send_steps", dtype, device, step, len(res), len(batches)
+            )
+        if batches and len(batches[-1]) < self.batch_size and time.time() - batches[-1][0][0] < self.batch_age:
+            batches.pop()  # last batch is not full and not old enough, wait for more readings
+        return batches
+
+    def post_batch(self, device, dtype, batch):
+        """
+        Send batch of readings to backend, called in worker thread
+        :param device: str, identifier of device (serial port)
+        :param dtype: str, identifier for type of sensor data (CO2, T, R, P)
+        :param batch: list, structure of tuples with values of unixtime and float value [(unixtime, value), ...]
+        :return: bool, True if batch is acknowledged by backend
+        """
+        try:
+            with Metrics.http_request_seconds.time(type=dtype):
+                rres = self.session.post(
+                    self.back_url,
+                    json={
+                        'device_id': shv.back_device_ids.get(device, shv.back_device_id),
+                        'data_type': self.shifr[dtype],
+                        'start_ts': str(batch[0][0]),
+                        'data_pack': [str(int(value)) for _, value in batch]
+                    },
+                    timeout=shv.send_timeout
+                )
+            rres.raise_for_status()
+        except Exception as exc:
+            shv.logger.error('%r', exc)
+            Metrics.http_requests.inc(type=dtype, result='error')
+            return False
+        Metrics.http_requests.inc(type=dtype, result='ok')
+        shv.logger.debug("\tsent %s readings of %s data of %s", len(batch), dtype, device)
+        return True
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import DataBase
+import DataWriter
+import IngestManager
+import LogPipeline
+import Metrics
+import SharedVars as shv
+import Uploader
+from FakeBackend import FakeBackend
+from FakeDevice import FakeDevice
+
+"""End-to-end benchmarks of client without hardware and backend: virtual serial devices (pty) feed
+ingestion and DB writer, local backend stand-in receives upload, plots are drawn offscreen.
+Results are written as JSON, so runs of different releases can be compared."""
+
+scenarios = ('ingest', 'upload', 'plot')
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def latency_summary(histogram, **label_values):
+    """
+    :param histogram: Metrics.Histogram
+    :return: dict, number of observations, mean and quantiles in ms
+    """
+    count, total = histogram.totals(**label_values)
+    return {
+        'count': count,
+        'mean_ms': ms(total / count) if count else None,
+        'p50_ms': ms(histogram.quantile(0.5, **label_values)),
+        'p95_ms': ms(histogram.quantile(0.95, **label_values)),
+        'p99_ms': ms(histogram.quantile(0.99, **label_values))
+    }
+
+
+def fill_db(db_path, devices, frames, unixtime_start):
+    """
+    Write frames of devices into DB, one second between frames
+    :param db_path: str, path to SQLite database
+    :param devices: list, identifiers of devices
+    :param frames: int, number of frames of each device
+    :param unixtime_start: int, time of the first frame
+    :return: int, number of readings
+    """
+    db_conn = DataBase.connect(db_path)
+    DataBase.init_db(db_conn)
+    readings = 0
+    step = 10000
+    for device in devices:
+        for first in range(0, frames, step):
+            rows = [
+                (unixtime_start + i, dtype, 400 + (i % 600) if dtype == 'CO2' else 20 + (i % 50) / 10, device)
+                for i in range(first, min(first + step, frames)) for dtype in shv.all_dtype
+            ]
+            db_conn.execute("BEGIN IMMEDIATE")
+            readings += DataBase.insert_readings(db_conn, rows)
+            db_conn.commit()
+    db_conn.close()
+    return readings
+
+
+def run_ingest(db_path, n_devices, rate, duration, corrupt, seed):
+    """
+    Virtual devices send frames for duration seconds, all of them are read by IngestManager and written
+    by DataWriter as in client
+    :return: dict, results of scenario
+    """
+    Metrics.reset()
+    devices = [FakeDevice(rate=rate, corrupt=corrupt, seed=None if seed is None else seed + i) for i in range(n_devices)]
+    db_conn = DataBase.connect(db_path)
+    DataBase.init_db(db_conn)
+    writer = DataWriter.DataWriter(db_path)
+    writer.start()
+    manager = IngestManager.IngestManager([device.port for device in devices], writer)
+    ingest_thread = threading.Thread(target=manager.run, name='ingest')
+    ingest_thread.start()
+    time.sleep(0.5)  # ports are opened
+    for device in devices:
+        device.start()
+    time.sleep(duration)
+    for device in devices:
+        device.stop()
+    sent = sum(device.sent for device in devices)
+    deadline = time.monotonic() + 10
+    while Metrics.serial_frames.value() < sent and time.monotonic() < deadline:
+        time.sleep(0.05)  # frames buffered in pty are read
+    drain_start = time.monotonic()
+    manager.stop()
+    ingest_thread.join()
+    writer.stop()
+    drain = time.monotonic() - drain_start
+    ingested = Metrics.serial_frames.value()
+    stored = DataBase.count_after(db_conn, 'T', 0)
+    db_conn.close()
+    for device in devices:
+        device.close()
+    return {
+        'params': {'devices': n_devices, 'rate_per_device': rate, 'duration_s': duration, 'corrupt': corrupt},
+        'frames_sent': sent,
+        'frames_corrupted': sum(device.corrupted for device in devices),
+        'frames_ingested': ingested,
+        'frames_stored': stored,
+        'frames_per_s': round(ingested / duration, 1),
+        'invalid_frames': Metrics.serial_invalid.value(),
+        'dropped_pieces': Metrics.serial_dropped.value(),
+        'writer_drain_s': round(drain, 3),
+        'db_write': latency_summary(Metrics.db_write_seconds)
+    }
+
+
+def run_upload(db_path, n_devices, backlog, latency, fail_rate, seed, timeout=300):
+    """
+    Backlog of not sent readings is drained by Uploader to backend stand-in
+    :param timeout: float, max seconds of drain, backlog is reported as not drained after it
+    :return: dict, results of scenario
+    """
+    devices = ['/dev/bench{}'.format(i) for i in range(n_devices)]
+    unixtime_start = int(time.time()) - 7 * 86400
+    readings = fill_db(db_path, devices, backlog, unixtime_start)
+    last = unixtime_start + backlog - 1
+    backend = FakeBackend(latency=latency, fail_rate=fail_rate, seed=seed)
+    backend.start()
+    Metrics.reset()
+    uploader = Uploader.Uploader(db_path, back_url=backend.url, batch_age=0)
+    upload_thread = threading.Thread(target=uploader.run, name='upload')
+    db_conn = DataBase.connect(db_path)
+    start = time.monotonic()
+    upload_thread.start()
+    deadline = start + timeout
+    is_drained = False
+    while upload_thread.is_alive() and time.monotonic() < deadline:  # uploader may fail or never drain
+        cursor = db_conn.execute("select count(*) from send_status where unixtime >= ?", (last,))
+        if cursor.fetchone()[0] >= len(devices) * len(shv.all_dtype):
+            is_drained = True
+            break
+        time.sleep(0.05)
+    drain = time.monotonic() - start
+    uploader.stop()
+    upload_thread.join()
+    uploader.close()
+    backend.stop()
+    db_conn.close()
+    return {
+        'params': {
+            'devices': n_devices, 'backlog_frames_per_device': backlog, 'latency_s': latency,
+            'fail_rate': fail_rate, 'batch_size': shv.send_batch_size, 'max_in_flight': shv.send_max_in_flight,
+            'timeout_s': timeout
+        },
+        'readings': readings,
+        'drained': is_drained,
+        'drain_s': round(drain, 3),
+        'rows_per_s': round(readings / drain, 1) if is_drained else None,
+        'requests_ok': backend.requests,
+        'requests_failed': backend.failed,
+        'rows_resent': backend.rows - readings,
+        'http': latency_summary(Metrics.http_request_seconds)
+    }
+
+
+def run_plot(db_path, updates, seed):
+    """
+    Realtime plot is updated reading by reading through RenderScheduler, latency is time from new value
+    to finished redraw (frame rate limit included). Plot of full DB range is fetched and drawn as by
+    button "Plot".
+    :return: dict, results of scenario
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import random
+    import numpy as np
+    from PyQt5 import QtWidgets
+    import PlotRender
+    import RingBuffer
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rnd = random.Random(seed)
+    Metrics.reset()
+    tab_widget = QtWidgets.QTabWidget()
+    page = QtWidgets.QWidget()
+    layout = QtWidgets.QVBoxLayout(page)
+    canvas = PlotRender.MplCanvas(page, width=10, height=10, dpi=150)
+    layout.addWidget(canvas)
+    tab_widget.addTab(page, 'T')
+    tab_widget.resize(1280, 800)
+    tab_widget.show()
+    scheduler = PlotRender.RenderScheduler(tab_widget)
+    scheduler.register('T', page, canvas)
+    buffer = RingBuffer.RingBuffer(shv.realtime_window_len)
+    buffer.extend([20 + rnd.random() for _ in range(shv.realtime_window_len)])
+    line, = canvas.axes.plot(np.arange(shv.realtime_window_len), buffer.view(), 'r')
+    canvas.set_animated([line])
+    scheduler.mark_dirty('T', full=True)
+    while 'T' in scheduler.dirty:
+        app.processEvents()
+    latencies = []
+    for i in range(updates):
+        buffer.append(20 + rnd.random() + (5 if i % 50 == 49 else 0))  # rare jump out of view, full redraw
+        line.set_ydata(buffer.view())
+        start = time.perf_counter()
+        scheduler.mark_dirty('T')
+        while 'T' in scheduler.dirty:
+            app.processEvents()
+            time.sleep(0.0005)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    db_conn = DataBase.connect(db_path)
+    first, last = db_conn.execute("select min(bucket), max(bucket) from rollup_minute").fetchone()
+    fetch, draw = [], []
+    if first is not None:
+        n_out = max(int(canvas.width() * shv.plot_points_per_pixel), 100)
+        for _ in range(5):
+            start = time.perf_counter()
+            data_x, data_y = DataBase.get_range_arrays(db_conn, 'T', first, last + 60, n_buckets=n_out // 2)
+            fetch.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            canvas.axes.clear()
+            canvas.set_animated([])
+            canvas.axes.plot(data_x, data_y, 'b')
+            canvas.draw()
+            draw.append(time.perf_counter() - start)
+    db_conn.close()
+    tab_widget.close()
+    return {
+        'params': {'updates': updates, 'max_fps': shv.plot_max_fps, 'window_len': shv.realtime_window_len},
+        'realtime_latency': {
+            'mean_ms': ms(sum(latencies) / len(latencies)),
+            'p50_ms': ms(latencies[len(latencies) // 2]),
+            'p95_ms': ms(latencies[int(len(latencies) * 0.95)])
+        },
+        'redraw_blit': latency_summary(Metrics.plot_redraw_seconds, mode='blit'),
+        'redraw_full': latency_summary(Metrics.plot_redraw_seconds, mode='full'),
+        'history_fetch_ms': ms(sum(fetch) / len(fetch)) if fetch else None,
+        'history_draw_ms': ms(sum(draw) / len(draw)) if draw else None
+    }
+
+
+def release_info():
+    """
+    :return: dict, version of client, git commit and platform of run
+    """
+    with open(os.path.join(root, 'pyproject.toml')) as project_file:
+        version = re.search(r'^version = "(.+)"', project_file.read(), re.M)
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'version': version.group(1) if version else None,
+        'commit': commit,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmarks of client with virtual serial devices and local backend stand-in"
+    )
+    parser.add_argument('--scenario', action='append', choices=scenarios, help="scenario to run, all by default")
+    parser.add_argument('--devices', type=int, default=4, help="number of virtual devices")
+    parser.add_argument('--rate', type=float, default=50, help="frames per second of each device")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of ingestion")
+    parser.add_argument('--corrupt', type=float, default=0.01, help="fraction of corrupted frames")
+    parser.add_argument('--backlog', type=int, default=20000, help="not sent frames of each device for upload")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds of backend response delay")
+    parser.add_argument('--fail-rate', type=float, default=0.05, help="fraction of failed backend requests")
+    parser.add_argument('--upload-timeout', type=float, default=300, help="max seconds of upload drain")
+    parser.add_argument('--updates', type=int, default=300, help="number of realtime plot updates")
+    parser.add_argument('--seed', type=int, default=1, help="seed of random data")
+    parser.add_argument('--output', help="JSON file of results, stdout if not set")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='ambient-bench-')
+    LogPipeline.init_logger(os.path.join(work_dir, 'bench-log.log'), logging.WARNING, console=False)
+    shv.metrics_port = None
+    shv.archive_after_days = None
+    results = {'release': release_info(), 'scenarios': {}}
+    upload_db = os.path.join(work_dir, 'upload.db')
+    for scenario in args.scenario or scenarios:
+        print("Run {} scenario".format(scenario), file=sys.stderr)
+        if scenario == 'ingest':
+            result = run_ingest(
+                os.path.join(work_dir, 'ingest.db'), args.devices, args.rate, args.duration, args.corrupt, args.seed
+            )
+        elif scenario == 'upload':
+            result = run_upload(
+                upload_db, args.devices, args.backlog, args.latency, args.fail_rate, args.seed, args.upload_timeout
+            )
+        else:
+            if not os.path.exists(upload_db):
+                fill_db(upload_db, ['/dev/bench0'], args.backlog, int(time.time()) - 7 * 86400)
+            result = run_plot(upload_db, args.updates, args.seed)
+        results['scenarios'][scenario] = result
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    else:
+        print(text)
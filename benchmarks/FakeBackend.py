@@ -0,0 +1,78 @@
+import http.server
+import json
+import random
+import threading
+import time
+
+"""This module provides local stand-in of backend ambient-data endpoint with configurable latency and failures"""
+
+
+class BackendHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, as backend behind web server
+
+    def do_POST(self):
+        backend = self.server.backend
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if backend.latency:
+            time.sleep(backend.latency)
+        with backend.lock:
+            is_failed = backend.random.random() < backend.fail_rate
+        if is_failed:
+            backend.count(failed=1)
+            self.reply(500)
+            return
+        try:
+            rows = len(json.loads(body)['data_pack'])
+        except (ValueError, KeyError, TypeError):
+            backend.count(failed=1)
+            self.reply(400)
+            return
+        backend.count(requests=1, rows=rows)
+        self.reply(200)
+
+    def reply(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBackend(threading.Thread):
+    """
+    HTTP server which accepts POST of uploader, answers after latency seconds and fails
+    fail_rate part of requests with status 500
+    """
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=None):
+        """
+        :param latency: float, delay of each response in seconds
+        :param fail_rate: float, fraction of failed requests from 0 to 1
+        :param seed: int, seed of random generator, for repeatable runs
+        """
+        threading.Thread.__init__(self, name='fake-backend', daemon=True)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0  # number of accepted requests
+        self.failed = 0  # number of failed requests
+        self.rows = 0  # number of accepted readings
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), BackendHandler)
+        self.server.daemon_threads = True
+        self.server.backend = self
+        self.url = 'http://127.0.0.1:{}/ambient-data/'.format(self.server.server_address[1])
+
+    def count(self, requests=0, failed=0, rows=0):
+        with self.lock:
+            self.requests += requests
+            self.failed += failed
+            self.rows += rows
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,75 @@
+import os
+import random
+import threading
+import time
+import tty
+
+"""This module provides virtual LogicYield ambient device: frames are written to pseudo terminal,
+client reads its slave end as a serial port"""
+
+
+class FakeDevice(threading.Thread):
+    """
+    Emit LY frames at given rate into pty. Device clock starts at clock_start and goes one second per frame,
+    so every frame has its own time and nothing is de-duplicated by DB. Part of frames is corrupted:
+    garbage before frame, frame cut without line end or frame with broken value.
+    """
+    corruptions = ('garbage', 'cut', 'value')
+
+    def __init__(self, rate=10, corrupt=0.0, clock_start=None, seed=None):
+        """
+        :param rate: float, frames per second
+        :param corrupt: float, fraction of corrupted frames from 0 to 1
+        :param clock_start: int, unixtime of the first frame, 30 days ago if None
+        :param seed: int, seed of random generator, for repeatable runs
+        """
+        threading.Thread.__init__(self, name='fake-device', daemon=True)
+        self.rate = rate
+        self.corrupt = corrupt
+        self.clock = int(clock_start if clock_start is not None else time.time() - 30 * 86400)
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # no echo and line discipline, as serial port
+        self.port = os.ttyname(self.slave)
+        self.stop_event = threading.Event()
+        self.sent = 0  # number of valid frames
+        self.corrupted = 0  # number of corrupted frames
+
+    def frame(self):
+        """
+        :return: bytes, next frame with line end, it may be corrupted
+        """
+        local = time.localtime(self.clock)
+        self.clock += 1
+        line = 'LY,{}_{}_{}_{}_{}_{},T_{:.2f}_C,R_{}_%,P_{}_mm,CO2_{}_ppm\n'.format(
+            local.tm_year, local.tm_mon, local.tm_mday, local.tm_hour, local.tm_min, local.tm_sec,
+            20 + 5 * self.random.random(), self.random.randint(20, 60), self.random.randint(740, 770),
+            self.random.randint(400, 1200)
+        ).encode('ascii')
+        if self.corrupt and self.random.random() < self.corrupt:
+            self.corrupted += 1
+            kind = self.random.choice(self.corruptions)
+            if kind == 'garbage':
+                return bytes(self.random.randrange(256) for _ in range(16)) + b'\n'
+            if kind == 'cut':
+                return line[:self.random.randrange(3, len(line) - 1)]  # next header resyncs stream
+            return line.replace(b'T_', b'T_x', 1)
+        self.sent += 1
+        return line
+
+    def run(self):
+        start = time.monotonic()
+        emitted = 0
+        while not self.stop_event.wait(0.01):
+            due = int((time.monotonic() - start) * self.rate) - emitted  # frames are sent by bursts of tick
+            if due > 0:
+                os.write(self.master, b''.join(self.frame() for _ in range(due)))
+                emitted += due
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
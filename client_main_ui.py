@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'client_main.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(780, 892)
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.gridLayout = QtWidgets.QGridLayout(self.centralwidget)
+        self.gridLayout.setObjectName("gridLayout")
+        self.cb_devices = QtWidgets.QComboBox(self.centralwidget)
+        self.cb_devices.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.cb_devices.setFont(font)
+        self.cb_devices.setObjectName("cb_devices")
+        self.cb_devices.addItem("")
+        self.gridLayout.addWidget(self.cb_devices, 0, 0, 1, 1)
+        self.pushButton = QtWidgets.QPushButton(self.centralwidget)
+        self.pushButton.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.pushButton.setFont(font)
+        self.pushButton.setObjectName("pushButton")
+        self.gridLayout.addWidget(self.pushButton, 0, 1, 1, 1)
+        self.pb_com_connect = QtWidgets.QPushButton(self.centralwidget)
+        self.pb_com_connect.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.pb_com_connect.setFont(font)
+        self.pb_com_connect.setObjectName("pb_com_connect")
+        self.gridLayout.addWidget(self.pb_com_connect, 0, 2, 1, 1)
+        self.tv_comdata = QtWidgets.QTableView(self.centralwidget)
+        self.tv_comdata.setObjectName("tv_comdata")
+        self.gridLayout.addWidget(self.tv_comdata, 1, 0, 1, 3)
+        self.l_date = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.l_date.setFont(font)
+        self.l_date.setAlignment(QtCore.Qt.AlignCenter)
+        self.l_date.setObjectName("l_date")
+        self.gridLayout.addWidget(self.l_date, 2, 0, 1, 1)
+        self.l_date_2 = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.l_date_2.setFont(font)
+        self.l_date_2.setAlignment(QtCore.Qt.AlignCenter)
+        self.l_date_2.setObjectName("l_date_2")
+        self.gridLayout.addWidget(self.l_date_2, 2, 1, 1, 1)
+        self.dte_start_date = QtWidgets.QDateTimeEdit(self.centralwidget)
+        self.dte_start_date.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.dte_start_date.setFont(font)
+        self.dte_start_date.setLocale(QtCore.QLocale(QtCore.QLocale.English, QtCore.QLocale.UnitedKingdom))
+        self.dte_start_date.setDate(QtCore.QDate(2022, 1, 1))
+        self.dte_start_date.setTimeSpec(QtCore.Qt.LocalTime)
+        self.dte_start_date.setObjectName("dte_start_date")
+        self.gridLayout.addWidget(self.dte_start_date, 3, 0, 1, 1)
+        self.dte_end_date = QtWidgets.QDateTimeEdit(self.centralwidget)
+        self.dte_end_date.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.dte_end_date.setFont(font)
+        self.dte_end_date.setLocale(QtCore.QLocale(QtCore.QLocale.English, QtCore.QLocale.UnitedKingdom))
+        self.dte_end_date.setDate(QtCore.QDate(2023, 1, 1))
+        self.dte_end_date.setObjectName("dte_end_date")
+        self.gridLayout.addWidget(self.dte_end_date, 3, 1, 1, 1)
+        self.chb_real_time = QtWidgets.QCheckBox(self.centralwidget)
+        self.chb_real_time.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.chb_real_time.setFont(font)
+        self.chb_real_time.setObjectName("chb_real_time")
+        self.gridLayout.addWidget(self.chb_real_time, 3, 2, 1, 1)
+        self.tabw_data = QtWidgets.QTabWidget(self.centralwidget)
+        self.tabw_data.setMinimumSize(QtCore.QSize(0, 400))
+        self.tabw_data.setObjectName("tabw_data")
+        self.gridLayout.addWidget(self.tabw_data, 4, 0, 1, 3)
+        self.pb_plot_data = QtWidgets.QPushButton(self.centralwidget)
+        self.pb_plot_data.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.pb_plot_data.setFont(font)
+        self.pb_plot_data.setObjectName("pb_plot_data")
+        self.gridLayout.addWidget(self.pb_plot_data, 5, 0, 1, 1)
+        self.cb_view_device = QtWidgets.QComboBox(self.centralwidget)
+        self.cb_view_device.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.cb_view_device.setFont(font)
+        self.cb_view_device.setObjectName("cb_view_device")
+        self.gridLayout.addWidget(self.cb_view_device, 5, 1, 1, 1)
+        self.pb_save_data = QtWidgets.QPushButton(self.centralwidget)
+        self.pb_save_data.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.pb_save_data.setFont(font)
+        self.pb_save_data.setObjectName("pb_save_data")
+        self.gridLayout.addWidget(self.pb_save_data, 5, 2, 1, 1)
+        self.pb_to_cloud = QtWidgets.QPushButton(self.centralwidget)
+        self.pb_to_cloud.setMinimumSize(QtCore.QSize(0, 40))
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        self.pb_to_cloud.setFont(font)
+        self.pb_to_cloud.setObjectName("pb_to_cloud")
+        self.gridLayout.addWidget(self.pb_to_cloud, 6, 0, 1, 3)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.menubar = QtWidgets.QMenuBar(MainWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 780, 22))
+        self.menubar.setObjectName("menubar")
+        self.menuFile = QtWidgets.QMenu(self.menubar)
+        self.menuFile.setObjectName("menuFile")
+        self.menuSelect_Device = QtWidgets.QMenu(self.menuFile)
+        self.menuSelect_Device.setObjectName("menuSelect_Device")
+        self.menuSelect_Data = QtWidgets.QMenu(self.menuFile)
+        self.menuSelect_Data.setObjectName("menuSelect_Data")
+        MainWindow.setMenuBar(self.menubar)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+        self.action1st = QtWidgets.QAction(MainWindow)
+        self.action1st.setObjectName("action1st")
+        self.action2nd = QtWidgets.QAction(MainWindow)
+        self.action2nd.setObjectName("action2nd")
+        self.action1st_data = QtWidgets.QAction(MainWindow)
+        self.action1st_data.setObjectName("action1st_data")
+        self.action2nd_data = QtWidgets.QAction(MainWindow)
+        self.action2nd_data.setObjectName("action2nd_data")
+        self.actionSave_Image = QtWidgets.QAction(MainWindow)
+        self.actionSave_Image.setObjectName("actionSave_Image")
+        self.actionSave_Data = QtWidgets.QAction(MainWindow)
+        self.actionSave_Data.setObjectName("actionSave_Data")
+        self.actionGet_Status = QtWidgets.QAction(MainWindow)
+        self.actionGet_Status.setObjectName("actionGet_Status")
+        self.actionLoad_Data_to_Cloud = QtWidgets.QAction(MainWindow)
+        self.actionLoad_Data_to_Cloud.setObjectName("actionLoad_Data_to_Cloud")
+        self.actionProfiling = QtWidgets.QAction(MainWindow)
+        self.actionProfiling.setCheckable(True)
+        self.actionProfiling.setObjectName("actionProfiling")
+        self.actionExit = QtWidgets.QAction(MainWindow)
+        self.actionExit.setObjectName("actionExit")
+        self.menuSelect_Device.addAction(self.action1st)
+        self.menuSelect_Device.addAction(self.action2nd)
+        self.menuSelect_Data.addAction(self.action1st_data)
+        self.menuSelect_Data.addAction(self.action2nd_data)
+        self.menuFile.addAction(self.menuSelect_Device.menuAction())
+        self.menuFile.addAction(self.menuSelect_Data.menuAction())
+        self.menuFile.addAction(self.actionSave_Image)
+        self.menuFile.addAction(self.actionSave_Data)
+        self.menuFile.addAction(self.actionGet_Status)
+        self.menuFile.addAction(self.actionLoad_Data_to_Cloud)
+        self.menuFile.addAction(self.actionProfiling)
+        self.menuFile.addAction(self.actionExit)
+        self.menubar.addAction(self.menuFile.menuAction())
+
+        self.retranslateUi(MainWindow)
+        self.tabw_data.setCurrentIndex(-1)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.cb_devices.setItemText(0, _translate("MainWindow", "Select Connected Device"))
+        self.pushButton.setText(_translate("MainWindow", "Refresh"))
+        self.pb_com_connect.setText(_translate("MainWindow", "Connect Device"))
+        self.l_date.setText(_translate("MainWindow", "Start Time"))
+        self.l_date_2.setText(_translate("MainWindow", "End Time"))
+        self.dte_start_date.setDisplayFormat(_translate("MainWindow", "M/d/yy HH:mm"))
+        self.dte_end_date.setDisplayFormat(_translate("MainWindow", "M/d/yy HH:mm"))
+        self.chb_real_time.setText(_translate("MainWindow", "Plot in Real Time"))
+        self.pb_plot_data.setText(_translate("MainWindow", "Plot Data"))
+        self.cb_view_device.setToolTip(_translate("MainWindow", "Device which data are shown in table and plots"))
+        self.pb_save_data.setText(_translate("MainWindow", "Save Data to csv"))
+        self.pb_to_cloud.setText(_translate("MainWindow", "Load to Cloud"))
+        self.menuFile.setTitle(_translate("MainWindow", "File"))
+        self.menuSelect_Device.setTitle(_translate("MainWindow", "Select Device"))
+        self.menuSelect_Data.setTitle(_translate("MainWindow", "Select Data"))
+        self.action1st.setText(_translate("MainWindow", "1st"))
+        self.action2nd.setText(_translate("MainWindow", "2nd"))
+        self.action1st_data.setText(_translate("MainWindow", "1st data"))
+        self.action2nd_data.setText(_translate("MainWindow", "2nd data"))
+        self.actionSave_Image.setText(_translate("MainWindow", "Save Image"))
+        self.actionSave_Data.setText(_translate("MainWindow", "Save Data"))
+        self.actionGet_Status.setText(_translate("MainWindow", "Get Status"))
+        self.actionLoad_Data_to_Cloud.setText(_translate("MainWindow", "Load Data to Cloud"))
+        self.actionProfiling.setText(_translate("MainWindow", "Profiling"))
+        self.actionExit.setText(_translate("MainWindow", "Exit"))
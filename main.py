@@ -1,27 +1,30 @@
 # -*- coding: utf-8 -*-
 
-from PyQt5 import QtCore, QtWidgets, QtGui, uic
-import matplotlib
-matplotlib.use('Qt5Agg')
+import time
+start_time = time.perf_counter()  # for measurement of startup time
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
+from PyQt5 import QtCore, QtWidgets, QtGui
 
-import time
-import sqlite3
-import serial
-from serial.tools import list_ports
 import os
 import sys
-import psutil
 import logging
-import random
-import datetime
-
+import threading
+import numpy as np
+
+import client_main_ui
+import DataBase
+import DataWriter
+import LogPipeline
+import Metrics
+import Profiling
+import QueryCache
+import RingBuffer
 import DataProcess as dp
 import SharedVars as shv
+import TableImplementation
 import ThreadCom
-import ThreadSend
+import ThreadPlotData
+# PlotRender (matplotlib), ThreadSend (requests) and psutil are imported on first use
 
 """This module provides main structure and function of client program for get ambient data from PCB device"""
 # Plots: https://www.pythonguis.com/tutorials/plotting-matplotlib/
@@ -30,53 +33,39 @@ __version__ = "0.1.0"
 __author__ = 'Yunovidov Dmitriy: Dm.Yunovidov@gmail.com'
 
 
-class MplCanvas(FigureCanvasQTAgg):
-    """
-    Class for matplotlib canvas
-    """
-    def __init__(self, parent=None, width=5, height=4, dpi=150):
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = fig.add_subplot(111)
-        super(MplCanvas, self).__init__(fig)
-
-
 def init_logger():
     """
-    Initiate logging
+    Initiate logging: file, console and warning window for user are written by listener thread
+    of LogPipeline, so logging never blocks GUI and data threads
     :return: None
     """
-    shv.logger = logging.getLogger('main_logger')
-    shv.logger.setLevel(logging.DEBUG)
-    # create file handler which logs even debug messages
-    fh = logging.FileHandler('main-log.log', 'w')
-    fh.setLevel(logging.DEBUG)
-    # create console handler with a higher log level
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-    # create class handler with a higher log level for user messages
-    clh = logging.StreamHandler(dp.InfoWindow())
-    clh.setLevel(logging.WARNING)
-    # create formatter and add it to the handlers
-    formatter = logging.Formatter(
-        '%(levelname)s, %(asctime)s, (%(module)s - %(funcName)s - %(lineno)d), %(message)s'
-    )
-    ch.setFormatter(formatter)
-    fh.setFormatter(formatter)
-    clh.setFormatter(formatter)
-    # add the handlers to logger
-    shv.logger.addHandler(clh)
-    shv.logger.addHandler(ch)
-    shv.logger.addHandler(fh)
-
-
-class MainWindow(QtWidgets.QMainWindow):
+    LogPipeline.init_logger('main-log.log', logging.DEBUG, handlers=[dp.InfoHandler(dp.InfoWindow())])
+
+
+class MainWindow(QtWidgets.QMainWindow, client_main_ui.Ui_MainWindow):
+    profile_signal = QtCore.pyqtSignal(str)  # path of profiling summary, profiling may stop in any thread
     datetime_format = 'dd-MM-yyyy HH:mm:ss'
-    device_num = 1
-    device_com = None
+    device_num = 0  # number of connected serial devices
+    device_coms = []  # serial ports of connected devices
+    view_device = None  # device shown in table and plots, None for all devices
     db_conn = None
+    writer = None  # DB writer thread instance
+    query_cache = None  # cache of plot queries to DB
     db_path = 'test.db'
     thread = None  # COM data thread instance
+    scan_thread = None  # scan of COM ports thread instance
+    found_ports = []  # COM ports found by the last scan
+    render_scheduler = None  # redraw of plots, created with the first plot
     send_thread = None  # Send data to server thread
+    export_thread = None  # export of data into file thread
+    plot_threads = {}  # running loads of historical plot data {request: PlotDataThread}
+    plot_request = 0  # number of the last load of plot data
+    plot_requests = {}  # number of load of data shown on plot {sens_dtype: request}, other results are dropped
+    plot_ranges = {}  # time range and visible span of loaded plot data {sens_dtype: (start, stop, span)}
+    zoom_dtypes = set()  # types of zoomed or panned plots waiting for load of visible range
+    export_progress = None  # progress dialog of export
+    metrics_server = None  # HTTP endpoint with metrics
+    metrics_last = None  # time and totals of metrics at previous update of status bar
     tabs = {}  # tab structure for each data type {sens_dtype: [widget, canvas, toolbar, layout]}
     _plot_ref = {
         'realtime_plot': {},
@@ -90,11 +79,11 @@ class MainWindow(QtWidgets.QMainWindow):
         'realtime_plot': {},
         'datetime_plot': {}
     }
-    visible_data_len = 50
+    visible_data_len = shv.realtime_window_len
 
     def __init__(self):
         super(QtWidgets.QMainWindow, self).__init__()
-        uic.loadUi("client_main.ui", self)
+        self.setupUi(self)  # form is generated from client_main.ui by pyuic5
 
         self.setWindowTitle("Client Ambient Data")
 
@@ -125,6 +114,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tray_icon.show()
 
         self.pb_com_connect.clicked.connect(self.start_com)
+        self.pushButton.clicked.connect(self.refresh)
         #
         # self.pb_exit.clicked.connect(self.hide_it)
         # self.pb_save.clicked.connect(self.save_data)
@@ -139,6 +129,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.timer.timeout.connect(self.update_statusbar)
         # self.timer.timeout.connect(self.update_plot)
         self.timer.start(5000)
+        self.metrics_server = Metrics.start_server()
 
         # setting date format
         self.dte_start_date.setDisplayFormat("dd.MM.yyyy HH:mm")
@@ -146,12 +137,32 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.pb_plot_data.clicked.connect(self.update_plot)
         self.chb_real_time.stateChanged.connect(self.is_realtime_check)
+        self.dte_start_date.dateTimeChanged.connect(self.cancel_plot_data)  # plot of old range is not needed
+        self.dte_end_date.dateTimeChanged.connect(self.cancel_plot_data)
+        # Zoom and pan of datetime plots load visible range after the last change of limits
+        self.zoom_timer = QtCore.QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(shv.plot_zoom_delay)
+        self.zoom_timer.timeout.connect(self.load_zoomed_data)
 
         self.pb_to_cloud.clicked.connect(self.load_to_cloud)
+        self.pb_save_data.clicked.connect(self.save_data)
 
-        self.statusBar().showMessage("Dot Pulse ambient device No {}".format(self.device_num))
+        self.statusBar().showMessage("Dot Pulse ambient devices: {}".format(self.device_num))
         self.initdb()
 
+        # Device shown in table and plots
+        self.set_table_model()
+        self.cb_view_device.currentIndexChanged.connect(self.change_view_device)
+        self.refresh_view_devices()
+
+        # Profiling of hot paths: menu entry or AMBIENT_PROFILE environment variable
+        self.profile_signal.connect(self.profiling_stopped)
+        Profiling.listeners.append(self.profile_signal.emit)
+        Profiling.init_from_env()
+        self.actionProfiling.setChecked(Profiling.enabled)
+        self.actionProfiling.toggled.connect(self.toggle_profiling)
+
         shv.logger.info("Successfully init main class")
 
     def load_to_cloud(self):
@@ -160,6 +171,7 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         if self.send_thread is None:
+            import ThreadSend  # requests is loaded only for upload
             shv.logger.info("Successfully init thread to sent data to server")
             self.send_thread = ThreadSend.SendThread(db_path=self.db_path)
 
@@ -179,6 +191,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         if self.chb_real_time.isChecked():
             shv.logger.debug("\tstart realtime plot of sensors data")
+            self.cancel_plot_data()
             self.dte_start_date.setEnabled(False)
             self.dte_end_date.setEnabled(False)
             self.pb_plot_data.setEnabled(False)
@@ -189,12 +202,19 @@ class MainWindow(QtWidgets.QMainWindow):
             self.dte_end_date.setEnabled(True)
             self.pb_plot_data.setEnabled(True)
 
+    @Profiling.span('update_plot')
     def update_plot(self, new_data=None):
         """
         Set new data on plots after sensors
-        :param new_data: dict, new data unit from sensors
+        :param new_data: FrameParser.Reading, new data unit from sensors
         :return:
         """
+        import PlotRender  # matplotlib is loaded with the first plot
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+
+        if self.render_scheduler is None:
+            # Redraw of plots: visible tab only, limited frame rate
+            self.render_scheduler = PlotRender.RenderScheduler(self.tabw_data, parent=self)
         for sens_dtype in shv.all_dtype:  # take each data type from sensors: CO2, T, P, R
             if sens_dtype not in self.tabs:  # for initial start, when none of tab created
                 shv.logger.debug("\tcreate tab infrastructure")
@@ -203,12 +223,13 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.tabs[sens_dtype].append(QtWidgets.QWidget())  # set widget for new tab
                 self.tabw_data.addTab(self.tabs[sens_dtype][0], sens_dtype)  # set widget as new tab in QTabWidget
                 # Add matplotlib widgets for widget in tab in QTabWidget
-                self.tabs[sens_dtype].append(MplCanvas(self, width=10, height=10, dpi=150))
+                self.tabs[sens_dtype].append(PlotRender.MplCanvas(self, width=10, height=10, dpi=150))
                 self.tabs[sens_dtype].append(NavigationToolbar(self.tabs[sens_dtype][1], self))
                 self.tabs[sens_dtype].append(QtWidgets.QVBoxLayout())  # add layout and fill it with widgets
                 self.tabs[sens_dtype][3].addWidget(self.tabs[sens_dtype][2])
                 self.tabs[sens_dtype][3].addWidget(self.tabs[sens_dtype][1])
                 self.tabs[sens_dtype][0].setLayout(self.tabs[sens_dtype][3])
+                self.render_scheduler.register(sens_dtype, self.tabs[sens_dtype][0], self.tabs[sens_dtype][1])
                 for k in self.all_data_x:
                     self.all_data_x[k][sens_dtype] = None
                     self.all_data_y[k][sens_dtype] = None
@@ -216,109 +237,251 @@ class MainWindow(QtWidgets.QMainWindow):
 
             if self._plot_ref['realtime_plot'][sens_dtype] is None and self.chb_real_time.isChecked():
                 # For initial realtime plot, after tab structure is creates
-                shv.logger.debug("\tset initial realtime plot for {}".format(sens_dtype))
+                shv.logger.debug("\tset initial realtime plot for %s", sens_dtype)
                 data = self.get_db_data(sens_dtype, limit=self.visible_data_len)  # get DB data for sensor
                 if not data:
                     shv.logger.warning("There is no data on DB")
                     return
-                self.all_data_x['realtime_plot'][sens_dtype] = list(range(self.visible_data_len))  # set number of visible values of unixtime
-                self.all_data_y['realtime_plot'][sens_dtype] = []
-                for unixtime_and_value in data:
-                    self.all_data_y['realtime_plot'][sens_dtype].append(unixtime_and_value[1])  # add value
-                while len(self.all_data_y['realtime_plot'][sens_dtype]) < self.visible_data_len:  # add 0 data to fulfill set len
-                    self.all_data_y['realtime_plot'][sens_dtype].insert(0, 0)
+                self.all_data_x['realtime_plot'][sens_dtype] = np.arange(self.visible_data_len)  # set number of visible values of unixtime
+                # ring buffer keeps visible values, not filled part is 0
+                self.all_data_y['realtime_plot'][sens_dtype] = RingBuffer.RingBuffer(self.visible_data_len)
+                self.all_data_y['realtime_plot'][sens_dtype].extend([value for _, value in data])
                 self.tabs[sens_dtype][1].axes.clear()  # clear of previose plot
                 plot_refs = self.tabs[sens_dtype][1].axes.plot(
                     self.all_data_x['realtime_plot'][sens_dtype],
-                    self.all_data_y['realtime_plot'][sens_dtype],
+                    self.all_data_y['realtime_plot'][sens_dtype].view(),
                     'r'
                 )  # plot data on axes in tab
                 self._plot_ref['realtime_plot'][sens_dtype] = plot_refs[0]  # save plot for further update
+                self.tabs[sens_dtype][1].set_animated(plot_refs)  # new values are drawn by blitting
+                self.render_scheduler.mark_dirty(sens_dtype, full=True)
             elif self._plot_ref['realtime_plot'][sens_dtype] is not None and self.chb_real_time.isChecked():
                 # Update data on realtime plot
-                shv.logger.debug("\tupdate realtime plot for {}".format(sens_dtype))
+                shv.logger.debug("\tupdate realtime plot for %s", sens_dtype)
                 if new_data is None:  # initialize data before but no COM connection
                     self.tabs[sens_dtype][1].axes.clear()  # clear of previose plot
                     plot_refs = self.tabs[sens_dtype][1].axes.plot(
                         self.all_data_x['realtime_plot'][sens_dtype],
-                        self.all_data_y['realtime_plot'][sens_dtype],
+                        self.all_data_y['realtime_plot'][sens_dtype].view(),
                         'r'
                     )  # plot data on axes in tab
                     self._plot_ref['realtime_plot'][sens_dtype] = plot_refs[0]
+                    self.tabs[sens_dtype][1].set_animated(plot_refs)
+                    self.render_scheduler.mark_dirty(sens_dtype, full=True)
                 else:
-                    self.all_data_y[
-                        'realtime_plot'
-                    ][sens_dtype] = self.all_data_y[
-                                            'realtime_plot'
-                                    ][sens_dtype][1:] + [new_data[sens_dtype]]
+                    self.all_data_y['realtime_plot'][sens_dtype].append(getattr(new_data, sens_dtype))
                     self._plot_ref['realtime_plot'][sens_dtype].set_ydata(
-                        self.all_data_y['realtime_plot'][sens_dtype]
-                    )
+                        self.all_data_y['realtime_plot'][sens_dtype].view()
+                    )  # no copy, view of ring buffer memory
+                    self.render_scheduler.mark_dirty(sens_dtype)
             else:
-                # Plot datetime_plot
-                shv.logger.debug("\tset initial non realtime plot for {}".format(sens_dtype))
-                unixtime_start = self.dte_start_date.dateTime().toSecsSinceEpoch()
-                unixtime_stop = self.dte_end_date.dateTime().toSecsSinceEpoch()
-                shv.logger.debug("\tunixtime start: {} and end: {}".format(
-                    unixtime_start, unixtime_stop
-                ))
-                # TODO: get data from DB based on unixtime values
-                data = self.get_db_data(
-                    sens_dtype, limit=10000
-                )  # get DB data for sensor
-                if not data:
-                    shv.logger.warning("There is no data on DB")
-                    return
-                valid_data = [x for x in data if unixtime_start < x[0] < unixtime_stop]
-                self.all_data_x['datetime_plot'][sens_dtype] = []
-                self.all_data_y['datetime_plot'][sens_dtype] = []
-                for unixtime_and_value in valid_data:
-                    self.all_data_x['datetime_plot'][sens_dtype].append(unixtime_and_value[0])
-                    self.all_data_y['datetime_plot'][sens_dtype].append(unixtime_and_value[1])
-                self.tabs[sens_dtype][1].axes.clear()  # clear of previose plot
-                plot_refs = self.tabs[sens_dtype][1].axes.plot(
-                    self.all_data_x['datetime_plot'][sens_dtype],
-                    self.all_data_y['datetime_plot'][sens_dtype],
-                    'r'
-                )
-                self._plot_ref['datetime_plot'][sens_dtype] = plot_refs[0]
-            self.tabs[sens_dtype][1].draw()  # trigger the canvas to update and redraw.
+                # Plot datetime_plot: data are loaded in background, see load_plot_data
+                plot_ref = self._plot_ref['datetime_plot'][sens_dtype]
+                if plot_ref is not None and plot_ref in self.tabs[sens_dtype][1].axes.lines:
+                    self.tabs[sens_dtype][1].axes.set_autoscale_on(True)  # line is reused, new range is shown whole
+                else:
+                    self._plot_ref['datetime_plot'][sens_dtype] = None  # axes are cleared by the first data of load
+        if not self.chb_real_time.isChecked():
+            self.load_plot_data()
+
+    def load_plot_data(self, dtypes=None, unixtime_start=None, unixtime_stop=None, n_out=None):
+        """
+        Start background load of plot data, coarse data of long range are shown first, then detailed ones.
+        By default all types are loaded for time range of GUI and all running loads are cancelled,
+        otherwise only the running loads which have no other types to show.
+        :param dtypes: list, data types to load, all types if None
+        :param unixtime_start: int, start of time range, start of GUI range if None
+        :param unixtime_stop: int, end of time range, end of GUI range if None
+        :param n_out: int, number of points to load, derived from canvas width if None
+        :return: None
+        """
+        if dtypes is None:
+            self.cancel_plot_data()
+            current = self.tabw_data.currentWidget()
+            dtypes = sorted(shv.all_dtype, key=lambda sens_dtype: self.tabs[sens_dtype][0] is not current)
+            unixtime_start = self.dte_start_date.dateTime().toSecsSinceEpoch()
+            unixtime_stop = self.dte_end_date.dateTime().toSecsSinceEpoch()
+            for sens_dtype in dtypes:
+                self.plot_ranges[sens_dtype] = (unixtime_start, unixtime_stop, unixtime_stop - unixtime_start)
+        shv.logger.debug("\tload %s from %s to %s", dtypes, unixtime_start, unixtime_stop)
+        self.plot_request += 1
+        for sens_dtype in dtypes:
+            self.plot_requests[sens_dtype] = self.plot_request  # results of older loads are dropped
+        for request, plot_thread in list(self.plot_threads.items()):
+            if all(self.plot_requests.get(sens_dtype) != request for sens_dtype in plot_thread.dtypes):
+                plot_thread.quit()
+                del self.plot_threads[request]
+        plot_thread = ThreadPlotData.PlotDataThread(
+            self.plot_request, self.db_path, self.query_cache, dtypes, unixtime_start, unixtime_stop,
+            n_out or self.plot_target_points(self.tabs[dtypes[0]][1]), self.view_device, parent=self
+        )  # visible tab is loaded first, cancelled thread is kept by parent until it ends
+        plot_thread.data_signal.connect(self.plot_data_loaded)
+        plot_thread.finish_signal.connect(self.plot_data_finished)
+        plot_thread.finished.connect(plot_thread.deleteLater)
+        self.plot_threads[self.plot_request] = plot_thread
+        self.statusBar().showMessage("Loading of plot data")
+        plot_thread.start()
+
+    def cancel_plot_data(self):
+        """
+        Cancel background loads of plot data, their late results are dropped
+        :return: None
+        """
+        for plot_thread in self.plot_threads.values():
+            plot_thread.quit()
+        self.plot_threads.clear()
+        self.plot_requests.clear()
+        self.plot_ranges.clear()
+        self.zoom_timer.stop()
+        self.zoom_dtypes.clear()
+
+    def plot_data_loaded(self, request, sens_dtype, data_x, data_y, is_final):
+        """
+        Function for process data signal of plot data thread: show loaded data on plot of type.
+        Axes are scaled to data unless user has zoomed or panned plot.
+        :param request: int, number of load request
+        :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+        :param data_x: numpy.ndarray, unixtime values
+        :param data_y: numpy.ndarray, sensor values
+        :param is_final: bool, data are final for time range, otherwise coarse ones
+        :return: None
+        """
+        if request != self.plot_requests.get(sens_dtype) or self.chb_real_time.isChecked():
+            return
+        shv.logger.debug("\t%s points of %s, final: %s", len(data_x), sens_dtype, is_final)
+        canvas = self.tabs[sens_dtype][1]
+        if is_final and not len(data_x) and canvas.axes.get_autoscalex_on():  # empty zoomed view is not reported
+            shv.logger.warning("There is no %s data on DB", sens_dtype)
+        self.all_data_x['datetime_plot'][sens_dtype] = data_x
+        self.all_data_y['datetime_plot'][sens_dtype] = data_y
+        if self._plot_ref['datetime_plot'][sens_dtype] is None:
+            canvas.axes.clear()  # clear of previose plot
+            plot_refs = canvas.axes.plot(data_x, data_y, 'r')
+            self._plot_ref['datetime_plot'][sens_dtype] = plot_refs[0]
+            canvas.set_animated([])
+            canvas.axes.callbacks.connect(
+                'xlim_changed', lambda axes, sens_dtype=sens_dtype: self.plot_xlim_changed(sens_dtype, axes)
+            )  # callbacks are reset by clear of axes
+        else:
+            self._plot_ref['datetime_plot'][sens_dtype].set_data(data_x, data_y)  # new data on the same line
+            canvas.axes.relim()
+            canvas.axes.autoscale_view()
+        self.render_scheduler.mark_dirty(sens_dtype, full=True)
+
+    def plot_data_finished(self, request):
+        """
+        Function for process finish signal of plot data thread
+        :param request: int, number of load request
+        :return: None
+        """
+        if self.plot_threads.pop(request, None) is not None and not self.plot_threads:
+            self.statusBar().showMessage("Plot data are loaded")
+
+    def plot_xlim_changed(self, sens_dtype, axes):
+        """
+        Function for process change of x limits of datetime plot: zoom and pan of user (autoscale of x is
+        off then) schedule load of visible range, the last change of limits is waited for shv.plot_zoom_delay ms
+        :param sens_dtype: str, identifier for type of sensor data (CO2, T, R, P)
+        :param axes: matplotlib.axes.Axes, axes of plot
+        :return: None
+        """
+        if axes.get_autoscalex_on() or self.chb_real_time.isChecked():  # limits are set by loaded data
+            return
+        self.zoom_dtypes.add(sens_dtype)
+        self.zoom_timer.start()
+
+    def load_zoomed_data(self):
+        """
+        Load visible range of zoomed or panned plots with resolution of canvas, with shv.plot_zoom_margin
+        of range on each side for pan. Data are not loaded if loaded ones cover view in enough detail.
+        :return: None
+        """
+        for sens_dtype in self.zoom_dtypes:
+            canvas = self.tabs[sens_dtype][1]
+            x_start, x_stop = canvas.axes.get_xlim()
+            span = x_stop - x_start
+            loaded = self.plot_ranges.get(sens_dtype)
+            if loaded is not None and loaded[0] <= x_start and x_stop <= loaded[1] and span >= 0.8 * loaded[2]:
+                continue  # pan inside loaded margin or small zoom
+            margin = span * shv.plot_zoom_margin
+            unixtime_start = int(x_start - margin)
+            unixtime_stop = int(x_stop + margin) + 1
+            self.plot_ranges[sens_dtype] = (unixtime_start, unixtime_stop, span)
+            self.load_plot_data(
+                [sens_dtype], unixtime_start, unixtime_stop,
+                n_out=int(self.plot_target_points(canvas) * (1 + 2 * shv.plot_zoom_margin))
+            )  # the same number of points per pixel as full view
+        self.zoom_dtypes.clear()
+
+    def set_table_model(self):
+        """
+        Set new model of table of COM data for shown device
+        :return: None
+        """
+        device = self.view_device
+        # Table of COM data: bounded live rows, older rows are loaded from DB on scroll
+        self.tv_comdata.setModel(TableImplementation.LiveTableModel(
+            columns=shv.all_dtype,
+            headers=['{} {}'.format(data_type, shv.all_units[data_type]) for data_type in shv.all_dtype],
+            capacity=shv.table_capacity,
+            fetch_older=lambda before, limit: DataBase.get_frames_before(
+                self.db_conn, before, limit, device=device
+            ),
+            page_size=shv.table_page_size,
+            max_paged=shv.table_max_paged,
+            parent=self
+        ))
+
+    def refresh_view_devices(self, ports=()):
+        """
+        Add devices from DB and connected ports to selector of shown device
+        :param ports: list, serial ports of connected devices
+        :return: None
+        """
+        known = [self.cb_view_device.itemData(i) for i in range(self.cb_view_device.count())]
+        self.cb_view_device.blockSignals(True)
+        for device in DataBase.get_devices(self.db_conn) + list(ports):
+            if device not in known:
+                self.cb_view_device.addItem(device or 'Default device', device)
+                known.append(device)
+        self.cb_view_device.blockSignals(False)
+        if self.cb_view_device.currentData() != self.view_device:
+            self.change_view_device()  # the first device is added
+
+    def change_view_device(self):
+        """
+        Show data of device selected in GUI: reset table and realtime plots
+        :return: None
+        """
+        self.view_device = self.cb_view_device.currentData()
+        shv.logger.debug("\tshow data of device %s", self.view_device)
+        self.set_table_model()
+        for sens_dtype in self._plot_ref['realtime_plot']:
+            self._plot_ref['realtime_plot'][sens_dtype] = None  # reload last data of device from DB
+        if self.tabs or self.chb_real_time.isChecked():
+            self.update_plot()
+
+    @staticmethod
+    def plot_target_points(canvas):
+        """
+        Number of points which plot can display, derived from canvas width
+        :param canvas: MplCanvas, canvas of plot
+        :return: int, target number of points for decimation
+        """
+        width = canvas.width() * canvas.devicePixelRatioF()
+        return max(int(width * shv.plot_points_per_pixel), 100)
 
     def initdb(self):
         """
         Initiate database and create tables and indexes
         """
-        shv.logger.info(
-            "Init {} database and {} table in it".format(self.db_path, 'ambient_data')
-        )
-        self.db_conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        cursor = self.db_conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ambient_data (
-                unixtime integer,
-                type text,
-                value real
-            )
-            """)
-        cursor.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS uk_ambient_data on ambient_data (
-                type,
-                unixtime
-            )
-            """)
-        # DB for last send status
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS send_status (
-                unixtime integer,
-                type text
-            )
-            """)
-        cursor.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS uk_send_status on send_status (
-                type
-            )
-            """)
-        self.db_conn.commit()
+        shv.logger.info("Init %s database and %s table in it", self.db_path, 'ambient_data')
+        self.db_conn = DataBase.connect(self.db_path)
+        DataBase.init_db(self.db_conn)
+        self.writer = DataWriter.DataWriter(self.db_path)  # the only writer of readings
+        self.query_cache = QueryCache.QueryCache()
+        self.writer.listeners.append(self.query_cache.on_insert)  # cached plot data follow new readings
+        self.writer.start()
 
     def start_com(self):
         """
@@ -326,94 +489,81 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         if self.pb_com_connect.text() == 'Connect Device':
-            self.device_com = self.cb_devices.currentText()
-            shv.logger.debug(
-                "\tinit {} COM port connection and data thread".format(self.device_com)
-            )
-            # TODO: some random error appear when thread is started and get corrupt data
+            if self.cb_devices.currentText() == 'All ports':
+                self.device_coms = list(self.found_ports)
+            else:
+                self.device_coms = [self.cb_devices.currentText()]
+            self.device_num = len(self.device_coms)
+            shv.logger.debug("\tinit %s COM ports connection and data thread", self.device_coms)
+            self.refresh_view_devices(self.device_coms)
+            # one thread reads all devices, readings go to the shared DB writer
             self.thread = ThreadCom.COMStartThread(
-                device_com=self.device_com,
-                db_path=self.db_path
+                device_coms=self.device_coms,
+                writer=self.writer
             )
-            self.thread.SER_UPDATE_SIGNAL.connect(
-                lambda x: self.com_data(x)
-            )  # connect signal from thread
+            self.thread.SER_UPDATE_SIGNAL.connect(self.com_data)  # connect signal from thread
+            self.thread.my_signal.connect(self.com_status)
             self.thread.start()
             self.pb_com_connect.setText('Stop Connection')
         else:
-            shv.logger.debug(
-                "\tstop {} COM port connection and data thread".format(self.device_com)
-            )
+            shv.logger.debug("\tstop %s COM ports connection and data thread", self.device_coms)
             self.thread.quit()
+            self.device_num = 0
             self.pb_com_connect.setText('Connect Device')
 
     def refresh(self):
+        """
+        Start scan of COM ports in background, found ports are set in GUI when scan is finished
+        :return: None
+        """
+        if self.scan_thread is not None and self.scan_thread.isRunning():
+            return
+        self.pushButton.setEnabled(False)
+        self.scan_thread = ThreadCom.PortScanThread(parent=self)
+        self.scan_thread.ports_found.connect(self.set_ports)
+        self.scan_thread.start()
+
+    def set_ports(self, ports):
         """
         Set found COM ports in GUI interface
+        :param ports: list, available COM ports
         :return: None
         """
+        self.found_ports = ports
         self.cb_devices.clear()
-        self.cb_devices.addItems(self.available_com())
+        self.cb_devices.addItems(['All ports'] + ports)
         self.cb_devices.setCurrentIndex(0)
+        self.pushButton.setEnabled(True)
 
-    def available_com(self):
-        """
-        Scan system for available COM (virtual COM) ports
-        :return: list with available COM ports
-        """
-        shv.logger.debug("Init scan for COM ports")
-        if os.name == 'nt':
-            # Windows
-            all_ports = []
-            for i in range(256):
-                try:
-                    s = serial.Serial(i)
-                    all_ports.append('COM' + str(i + 1))
-                    s.close()
-                except serial.SerialException:
-                    pass
-            return all_ports
-        else:
-            # Mac / Linux
-            all_ports = []
-            for i in [port[0] for port in list_ports.comports()]:
-                all_ports.append(i)
-            return all_ports
-
+    @Profiling.span('com_data')
     def com_data(self, com_data):
         """
         Function for process COM data thread signal
-        :param com_data: str, data line form thread for ambient data COM device
+        :param com_data: FrameParser.Reading, data frame form thread for ambient data COM device
         :return: None
         """
         # TODO: set table for display time interval data or to realtime data
-        if com_data == 'Serial is broken':
-            shv.logger.debug(
-                "\tstop {} COM port connection and data thread".format(self.device_com)
-            )
-            self.pb_com_connect.setText('Connect Device')
-            return
-
-        shv.logger.debug("\t get COM data: {}".format(com_data))
-        com_data_now = {}
-        splitted = com_data.split(',')
-        for i in range(1, 5):
-            v_splitted = splitted[i].split('_')
-            v_type = v_splitted[0]
-            v_value = float(v_splitted[1])
-            com_data_now[v_type] = v_value
+        shv.logger.debug("\t get COM data: %s", com_data)
+        if self.view_device is not None and com_data.device != self.view_device:
+            return  # data of other device is only written to DB
         dp.set_table_data(
-            data_to_table=com_data_now,
-            tv_data_widget=self.tv_comdata,
-            time_stamp=splitted[0]
+            reading=com_data,
+            tv_data_widget=self.tv_comdata
         )
 
         if self.chb_real_time.isChecked():
             shv.logger.debug("\t start realtime plot")
-            timestamp = list(map(int, splitted[0].split('_')))
-            unixtime = int(time.mktime(datetime.datetime(*timestamp).timetuple()))
-            com_data_now['unixtime'] = unixtime
-            self.update_plot(new_data=com_data_now)
+            self.update_plot(new_data=com_data)
+
+    def com_status(self, port, message):
+        """
+        Function for process status signal of COM data thread
+        :param port: str, serial port of device
+        :param message: str, status of serial connection
+        :return: None
+        """
+        shv.logger.debug("\t%s status: %s", port, message)
+        self.statusBar().showMessage("{}: {}".format(port, message))
 
     def get_db_data(self, sens_dtype, limit=100):
         """
@@ -422,33 +572,77 @@ class MainWindow(QtWidgets.QMainWindow):
         :param limit: int, limit value for get last data from DB
         :return: list, structure of tuples with values of unixtime and float value [(unixtime, value), ...]
         """
-        cursor = self.db_conn.cursor()
-        cursor.execute(
-            """
-            select unixtime, value from ambient_data where type = ? order by unixtime desc limit ?
-            """,  # limit 10
-            (sens_dtype, limit)
-        )
-        data = list(
-            reversed(
-                [x for x in cursor.fetchall()]
-            )
-        )  # crate list with tuples, newest come first
-        return data
+        return self.query_cache.get_last_data(self.db_conn, sens_dtype, limit=limit, device=self.view_device)
+
+    def toggle_profiling(self, checked):
+        """
+        Start profiling for shv.profile_window seconds or stop it, summary is written in background
+        :param checked: bool, state of menu entry
+        :return: None
+        """
+        if checked:
+            Profiling.start()
+            self.statusBar().showMessage("Profiling for {} s".format(shv.profile_window))
+        else:
+            threading.Thread(target=Profiling.stop, name='profile-dump').start()
+
+    def profiling_stopped(self, path):
+        """
+        Function for process end of profiling (by menu or at the end of window)
+        :param path: str, path of profiling summary
+        :return: None
+        """
+        self.actionProfiling.blockSignals(True)
+        self.actionProfiling.setChecked(False)
+        self.actionProfiling.blockSignals(False)
+        self.statusBar().showMessage("Profiling summary: {}".format(path))
 
     def update_statusbar(self):
         """
-        Generate OS resources data and print it on statusBar each second
+        Print metrics of client and OS resources on statusBar every 5 seconds, rates and mean durations
+        are for the time since previous update, metrics of each device are in tooltip
         :return: None
         """
+        import psutil
+        now = time.monotonic()
+        totals = (
+            Metrics.serial_frames.value(),
+            Metrics.serial_dropped.value() + Metrics.serial_invalid.value(),
+            Metrics.http_requests.value(result='error'),
+            Metrics.db_write_seconds.totals(),
+            Metrics.plot_redraw_seconds.totals()
+        )
+        last_time, last_totals = self.metrics_last or (now, totals)
+        self.metrics_last = (now, totals)
+        period = now - last_time
+        frames, dropped, errors, writes, redraws = totals
+        last_frames, last_dropped, last_errors, last_writes, last_redraws = last_totals
         self.statusBar().showMessage(
-            "Dot Pulse device No {0} \t CPU: {1} %, \t Memory usage: {2} %, \t Free space: {3} %".format(
+            "Dot Pulse devices: {0} \t Frames: {1:.1f}/s, dropped {2} \t DB write: {3:.1f} ms \t "
+            "Upload backlog: {4}, errors {5} \t Redraw: {6:.1f} ms \t "
+            "CPU: {7} %, \t Memory usage: {8} %, \t Free space: {9} %".format(
                 self.device_num,
+                (frames - last_frames) / period if period else 0,
+                dropped - last_dropped,
+                mean_ms(writes, last_writes),
+                Metrics.upload_backlog.value(),
+                errors - last_errors,
+                mean_ms(redraws, last_redraws),
                 psutil.cpu_percent(),
                 psutil.virtual_memory()[2],
                 psutil.disk_usage('/')[3]
             )
         )
+        lines = []
+        for (device,), device_frames in sorted(Metrics.serial_frames.snapshot().items()):
+            device_dropped = Metrics.serial_dropped.value(device=device) + Metrics.serial_invalid.value(device=device)
+            lines.append('{}: {} frames, {} dropped'.format(device, device_frames, device_dropped))
+        lags = Metrics.upload_lag.snapshot()
+        for (device, dtype), backlog in sorted(Metrics.upload_backlog.snapshot().items()):
+            lines.append('{} {}: backlog {}, lag {:.0f} s'.format(device, dtype, backlog, lags.get((device, dtype), 0)))
+        if self.metrics_server is not None:
+            lines.append('Metrics: http://{}:{}/metrics'.format(shv.metrics_host, self.metrics_server.port))
+        self.statusBar().setToolTip('\n'.join(lines))
 
     def hide_it(self):
         """
@@ -470,21 +664,90 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         options = QtWidgets.QFileDialog.Options()
         options |= QtWidgets.QFileDialog.DontUseNativeDialog
-        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(
+        file_name, name_filter = QtWidgets.QFileDialog.getSaveFileName(
             self,
             "QFileDialog.getSaveFileName()",
             "",
-            "All Files (*);;CSV Files (*.csv)",
+            "CSV Files (*.csv);;Columnar Files (*.seg);;All Files (*)",
             options=options
         )
         if file_name:
-            print(file_name)
+            if not os.path.splitext(file_name)[1]:
+                file_name += '.seg' if name_filter.startswith('Columnar') else '.csv'
+            shv.logger.debug("\tselected file %s", file_name)
             return file_name
         else:
             return None
 
+    def save_data(self):
+        """
+        Export data of shown device for time range of GUI into CSV or columnar file in background thread
+        :return: None
+        """
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.statusBar().showMessage("Export is already running")
+            return
+        dtypes = dp.select_dtypes(self)
+        if dtypes is None:
+            return
+        file_name = self.save_file_dialog()
+        if file_name is None:
+            return
+        import ThreadExport
+        devices = [self.view_device] if self.view_device is not None else DataBase.get_devices(self.db_conn)
+        self.export_thread = ThreadExport.ExportThread(
+            db_path=self.db_path,
+            path=file_name,
+            dtypes=dtypes,
+            unixtime_start=self.dte_start_date.dateTime().toSecsSinceEpoch(),
+            unixtime_stop=self.dte_end_date.dateTime().toSecsSinceEpoch(),
+            devices=devices,
+            parent=self
+        )
+        self.export_progress = QtWidgets.QProgressDialog(
+            "Export of data into {}".format(file_name), "Cancel", 0, 100, self
+        )
+        self.export_progress.setMinimumDuration(0)
+        self.export_progress.canceled.connect(self.export_thread.quit)
+        self.export_thread.progress_signal.connect(self.export_progress.setValue)
+        self.export_thread.finish_signal.connect(self.export_finished)
+        self.export_thread.start()
+
+    def export_finished(self, message):
+        """
+        Function for process finish signal of export thread
+        :param message: str, result of export
+        :return: None
+        """
+        self.export_progress.close()
+        self.statusBar().showMessage(message)
+
     def closeEvent(self, event):
         self.save_dialog()
+        if self.export_thread is not None:
+            # export must be finished before exit, events are processed meanwhile: progress is shown
+            # and export can be cancelled
+            loop = QtCore.QEventLoop()
+            self.export_thread.finished.connect(loop.quit)
+            if self.export_thread.isRunning():
+                self.export_progress.setWindowModality(QtCore.Qt.ApplicationModal)
+                loop.exec_()
+            self.export_thread.wait()
+        if self.scan_thread is not None:
+            self.scan_thread.wait()
+        self.cancel_plot_data()
+        for plot_thread in self.findChildren(ThreadPlotData.PlotDataThread):
+            plot_thread.wait()  # cancelled loads end with interrupted query
+        if self.thread is not None:
+            self.thread.quit()
+            self.thread.wait()
+        if self.send_thread is not None:
+            self.send_thread.quit()
+            self.send_thread.wait()  # requests in flight end within shv.send_timeout
+        self.writer.stop()  # commit queued readings
+        Profiling.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         # self.timer.stop()
         # self.timer.deleteLater()
         self.deleteLater()
@@ -505,6 +768,30 @@ class MainWindow(QtWidgets.QMainWindow):
             pass
 
 
+def mean_ms(totals, last_totals):
+    """
+    :param totals: tuple, number and sum (seconds) of observations of histogram
+    :param last_totals: tuple, previous number and sum of observations
+    :return: float, mean duration (ms) of observations between totals, 0 if there are no observations
+    """
+    count = totals[0] - last_totals[0]
+    return (totals[1] - last_totals[1]) / count * 1000 if count else 0
+
+
+def report_startup(app, is_exit=False):
+    """
+    Log time from start of process to the first iteration of event loop, when window is shown
+    :param app: PyQt5.QtWidgets.QApplication, application instance
+    :param is_exit: bool, print time and exit, used for check of startup regressions
+    :return: None
+    """
+    startup = time.perf_counter() - start_time
+    shv.logger.info("Startup time: %.3f s", startup)
+    if is_exit:
+        print("{:.3f}".format(startup))
+        app.quit()
+
+
 if __name__ == "__main__":
     import sys
 
@@ -513,4 +800,6 @@ if __name__ == "__main__":
     # app.setStyle("Fusion")
     main_window = MainWindow()
     main_window.show()
+    # --startup-time: print startup time in seconds and exit
+    QtCore.QTimer.singleShot(0, lambda: report_startup(app, '--startup-time' in sys.argv))
     sys.exit(app.exec_())
\ No newline at end of file